@@ -1,9 +1,184 @@
-from django.contrib import admin
-from portal.models import PartnerService, Customer, SparePart, WarrantyClaim, ClaimSparePart
+from django import forms
+from django.contrib import admin, messages
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from portal.importers import import_spareparts, iter_rows
+from portal.models import (
+    PartnerService, Customer, SparePart, WarrantyClaim, ClaimEvent, ClaimSparePart, ClaimStatusHistory, ExchangeRate, Job,
+)
+from portal.workflow import approve_claims, approve_quantities, transition_claims
+
+
+class SparePartImportForm(forms.Form):
+    file = forms.FileField(
+        label=_("Price list"),
+        help_text=_("CSV or XLSX with a stock_code header and any of description, "
+                    "price_usd, price_eur, price_gbp, price_try."),
+    )
+
+
+@admin.register(SparePart)
+class SparePartAdmin(admin.ModelAdmin):
+    list_display = ("stock_code", "description", "price_usd", "price_eur", "price_gbp", "price_try")
+    search_fields = ("stock_code",)
+    change_list_template = "admin/portal/sparepart/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path("import/", self.admin_site.admin_view(self.import_view), name="portal_sparepart_import"),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """Upload a price list and upsert it in batches, streaming from the upload."""
+        if not self.has_add_permission(request) or not self.has_change_permission(request):
+            return redirect("admin:portal_sparepart_changelist")
+        form = SparePartImportForm(request.POST or None, request.FILES or None)
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                result = import_spareparts(iter_rows(upload, upload.name))
+            except ValueError as exc:
+                form.add_error("file", str(exc))
+            else:
+                self.message_user(request, _(
+                    "Imported %(imported)d parts from %(rows)d rows in %(elapsed).1fs (%(rate).0f rows/sec)."
+                ) % {"imported": result.imported, "rows": result.rows,
+                     "elapsed": result.elapsed, "rate": result.rows_per_second})
+                for line, message in result.errors:
+                    self.message_user(request, f"line {line}: {message}", messages.WARNING)
+                if result.error_count > len(result.errors):
+                    self.message_user(request, _("%(count)d more rows were rejected.") % {
+                        "count": result.error_count - len(result.errors)}, messages.WARNING)
+                return redirect("admin:portal_sparepart_changelist")
+        return TemplateResponse(request, "admin/portal/sparepart/import_form.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": _("Import price list"),
+            "form": form,
+        })
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ("currency", "rate", "updated_at")
+
+
+@admin.register(WarrantyClaim)
+class WarrantyClaimAdmin(admin.ModelAdmin):
+    list_display = ("id", "claim_date", "status", "vehicle_type", "vehicle_chassis_number", "customer", "partner_service")
+    list_filter = ("status", "vehicle_type", "partner_service")
+    list_select_related = ("customer", "partner_service")
+    # Same order as the portal listing, so filtered pages read the composite indexes
+    ordering = ("-claim_date", "-id")
+    search_fields = ("vehicle_chassis_number",)
+    search_help_text = _("Claim number or chassis number")
+
+    actions = ("mark_accepted", "mark_rejected", "mark_needs_revise", "mark_completed", "approve_parts")
+
+    def _transition(self, request, queryset, target):
+        result = transition_claims(queryset, target, user=request.user)
+        label = WarrantyClaim.ClaimStatus(target).label
+        self.message_user(request, _("%(count)d claims moved to %(status)s.") % {
+            "count": result.updated, "status": label})
+        if result.skipped:
+            self.message_user(request, _(
+                "%(count)d claims were skipped because they cannot move to %(status)s from their status."
+            ) % {"count": result.skipped, "status": label}, messages.WARNING)
+
+    @admin.action(description=_("Accept selected claims"))
+    def mark_accepted(self, request, queryset):
+        self._transition(request, queryset, WarrantyClaim.ClaimStatus.Accepted)
+
+    @admin.action(description=_("Reject selected claims"))
+    def mark_rejected(self, request, queryset):
+        self._transition(request, queryset, WarrantyClaim.ClaimStatus.Rejected)
+
+    @admin.action(description=_("Send selected claims back for revision"))
+    def mark_needs_revise(self, request, queryset):
+        self._transition(request, queryset, WarrantyClaim.ClaimStatus.NeedsRevise)
+
+    @admin.action(description=_("Complete selected claims"))
+    def mark_completed(self, request, queryset):
+        self._transition(request, queryset, WarrantyClaim.ClaimStatus.Completed)
+
+    @admin.action(description=_("Approve all part quantities of selected claims"))
+    def approve_parts(self, request, queryset):
+        count = approve_claims(queryset, user=request.user)
+        self.message_user(request, _("%(count)d part lines approved in full.") % {"count": count})
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default search casts the integer columns to text, which cannot use an index
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            number = int(term)
+            return queryset.filter(Q(vehicle_chassis_number=number) | Q(pk=number)), False
+        return queryset.none(), False
+
+
+@admin.register(ClaimStatusHistory)
+class ClaimStatusHistoryAdmin(admin.ModelAdmin):
+    list_display = ("claim", "from_status", "to_status", "changed_by", "changed_at")
+    list_filter = ("to_status",)
+    list_select_related = ("claim", "changed_by")
+    raw_id_fields = ("claim",)
+
+
+@admin.register(ClaimEvent)
+class ClaimEventAdmin(admin.ModelAdmin):
+    """Read-only: the event log is append-only."""
+
+    list_display = ("claim_id", "line_id", "action", "actor_id", "created_at")
+    list_filter = ("action",)
+    ordering = ("-created_at", "-id")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "status", "attempts", "run_after", "finished_at")
+    list_filter = ("status", "kind")
+    ordering = ("-id",)
+    readonly_fields = ("locked_by", "locked_at", "last_error", "created_at", "finished_at")
+    actions = ("requeue",)
+
+    @admin.action(description=_("Run selected jobs again"))
+    def requeue(self, request, queryset):
+        count = queryset.exclude(status=Job.Status.Running).update(
+            status=Job.Status.Queued, attempts=0, run_after=timezone.now(), locked_by="", finished_at=None,
+        )
+        self.message_user(request, _("%(count)d jobs queued again.") % {"count": count})
+
+
+@admin.register(ClaimSparePart)
+class ClaimSparePartAdmin(admin.ModelAdmin):
+    list_display = ("claim_id", "stock_code", "currency", "unit_price", "quantity", "approved_quantity",
+                    "approved_total_price")
+    list_filter = ("currency",)
+    raw_id_fields = ("claim", "spare_part")
+    actions = ("approve_in_full",)
+
+    @admin.action(description=_("Approve selected lines in full"))
+    def approve_in_full(self, request, queryset):
+        count = approve_quantities(queryset, user=request.user)
+        self.message_user(request, _("%(count)d part lines approved in full.") % {"count": count})
+
 
 # Register your models here.
 admin.site.register(PartnerService)
 admin.site.register(Customer)
-admin.site.register(SparePart)
-admin.site.register(WarrantyClaim)
-admin.site.register(ClaimSparePart)
+
@@ -0,0 +1,101 @@
+"""Async versions of the read-heavy portal views, for ASGI deployments.
+
+They answer the same URLs under ``async/`` with the same templates and JSON
+as their counterparts in portal.views. Rows are read with the async ORM
+(``aget``, ``async for``), so the event loop keeps serving other requests
+while a query runs. Form validation, context processors and template
+rendering still touch the database through sync code; they run in the sync
+thread via ``sync_to_async``.
+
+Under WSGI these views still work, but every request pays for an event loop
+and gains nothing; route traffic to them only when serving through asgi.py.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views.decorators.http import require_GET
+
+from .catalog import aget_catalog_snapshot, alookup_spareparts
+from .middleware import query_budget
+from .pagination import akeyset_page
+from .search import asearch_page
+from .views import (
+    _claim_details_queries, _claim_listing, _listing_context, _lookup_params, _page_number,
+)
+
+
+async def _request_user(request):
+    user = await request.auser()
+    # Share the loaded user with sync code such as context processors
+    request.user = user
+    return user
+
+
+@login_required()
+@require_GET
+@query_budget(8)
+async def claims_page(request):
+    """Async version of ``views.claims_page``."""
+    user = await _request_user(request)
+    claims, filter_form, search_query = await sync_to_async(_claim_listing)(request, user)
+    next_param = None
+    if search_query:
+        page_number = _page_number(request)
+        page, has_next = await asearch_page(claims, search_query, page_number)
+        if has_next:
+            next_param = ("page", page_number + 1)
+    else:
+        page, next_cursor = await akeyset_page(claims, request.GET.get("after"))
+        if next_cursor:
+            next_param = ("after", next_cursor)
+    # Reads the cached claim cards, which may use a sync-only cache backend
+    context = await sync_to_async(_listing_context)(request, filter_form, search_query, page, next_param)
+    return await sync_to_async(render)(request, "portal/warranty_claims.html", context)
+
+
+@login_required()
+@require_GET
+@query_budget(8)
+async def claim_details(request, claim_id):
+    """Async version of ``views.claim_details``."""
+    user = await _request_user(request)
+    # Resolving the partner scope may read the cache or the database
+    claims, totals = await sync_to_async(_claim_details_queries)(user, claim_id)
+    claim = await aget_object_or_404(claims, pk=claim_id)
+    return await sync_to_async(render)(request, "portal/claim_details.html", {
+        "claim": claim,
+        "parts": claim.claim_spare_parts.all(),
+        "attachments": claim.attachments.all(),
+        "totals": [row async for row in totals],
+    })
+
+
+@login_required()
+@require_GET
+async def sparepart_lookup(request):
+    """Async version of ``views.sparepart_lookup``."""
+    try:
+        query, exact, limit = _lookup_params(request)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    if not query or limit < 1:
+        return JsonResponse({"results": []})
+    return JsonResponse({"results": await alookup_spareparts(query, exact=exact, limit=limit)})
+
+
+@login_required()
+@require_GET
+async def sparepart_catalog(request):
+    """Async version of ``views.sparepart_catalog``, with the same ETag handling."""
+    snapshot = await aget_catalog_snapshot()
+    etag = quote_etag(snapshot.etag)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(snapshot.content, content_type="application/json")
+    response.headers.setdefault("ETag", etag)
+    patch_cache_control(response, max_age=60, must_revalidate=True)
+    return response
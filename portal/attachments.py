@@ -0,0 +1,257 @@
+"""Claim attachments: resumable uploads, content-addressed storage, thumbnails.
+
+Uploads arrive in chunks. Each chunk is first streamed from the request into
+a file of its own next to the upload's part file (``uploads/<upload id>.part``),
+so no file is ever held in memory. It is only copied into the part file, at
+the offset the server has acknowledged, once the conditional update of
+``AttachmentUpload.received`` has claimed that offset; two requests sending
+the same chunk at once cannot both write. An interrupted upload resumes from
+``received``.
+
+When the last byte arrives the part file is hashed from disk and moved to
+``blobs/<sha256[:2]>/<sha256>``. A file whose content is already stored is
+dropped instead, and the new ClaimAttachment points at the existing
+AttachmentBlob, so phones resending the same photos cost no extra space.
+
+The content type of a blob is read from its first bytes, never from the
+uploader's filename, and only images and PDFs (``INLINE_CONTENT_TYPES``) are
+recognised. Everything else is stored as ``application/octet-stream`` and
+downloaded rather than displayed, so an uploaded HTML or SVG file cannot run
+script on the portal's origin.
+
+New PNG and JPEG blobs queue an ``attachment_thumbnail`` job, so the last
+chunk's request returns as soon as the file is stored; ``run_jobs`` workers
+write the thumbnail to ``thumbnails/<sha256[:2]>/<sha256>`` (see
+portal.thumbnails).
+
+Abandoned uploads, blobs no claim refers to any more and their thumbnails are
+removed by the ``cleanup_attachments`` command.
+
+Settings:
+
+``PORTAL_ATTACHMENT_ROOT``
+    Directory holding uploads, blobs and thumbnails (default
+    ``BASE_DIR / "attachments"``).
+``PORTAL_ATTACHMENT_MAX_SIZE``
+    Largest accepted file in bytes (default 25 MB).
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, ProtectedError
+from django.utils import timezone
+
+from .models import AttachmentBlob, AttachmentUpload, ClaimAttachment
+
+COPY_CHUNK_SIZE = 64 * 1024
+DEFAULT_MAX_SIZE = 25 * 1024 * 1024
+OCTET_STREAM = "application/octet-stream"
+# (leading bytes, content type); RIFF files are only WebP with "WEBP" at offset 8
+SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"RIFF", "image/webp"),
+    (b"%PDF-", "application/pdf"),
+)
+# Content types safe to show in the browser; anything else is served as a download
+INLINE_CONTENT_TYPES = frozenset(content_type for _, content_type in SIGNATURES)
+# Content types portal.thumbnails can preview
+THUMBNAIL_CONTENT_TYPES = frozenset({"image/png", "image/jpeg"})
+
+
+class UploadError(Exception):
+    """The upload cannot take the chunk; ``offset`` is where the client should resume."""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+def attachment_root():
+    return Path(getattr(settings, "PORTAL_ATTACHMENT_ROOT", settings.BASE_DIR / "attachments"))
+
+
+def max_size():
+    return getattr(settings, "PORTAL_ATTACHMENT_MAX_SIZE", DEFAULT_MAX_SIZE)
+
+
+def part_path(upload):
+    return attachment_root() / "uploads" / f"{upload.pk}.part"
+
+
+def blob_path(sha256):
+    return attachment_root() / "blobs" / sha256[:2] / sha256
+
+
+def thumbnail_path(sha256):
+    return attachment_root() / "thumbnails" / sha256[:2] / sha256
+
+
+def start_upload(claim, filename, size, user):
+    """Open a resumable upload of ``size`` bytes to ``claim``."""
+    if size < 0 or size > max_size():
+        raise UploadError(f"Files must be at most {max_size()} bytes")
+    upload = AttachmentUpload.objects.create(
+        claim=claim, filename=os.path.basename(filename)[:255] or "attachment", size=size, created_by=user,
+    )
+    path = part_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    return upload
+
+
+def receive_chunk(upload, offset, stream, length):
+    """Append ``length`` bytes read from ``stream`` to ``upload``, which must be at ``offset``.
+
+    Returns the ClaimAttachment once the upload is complete, otherwise None.
+    """
+    if offset != upload.received:
+        raise UploadError("Chunk does not continue the upload", upload.received)
+    if length < 0 or offset + length > upload.size:
+        raise UploadError("Chunk runs past the declared size", upload.received)
+    path = part_path(upload)
+    with tempfile.TemporaryFile(dir=path.parent, prefix=f"{upload.pk}.", suffix=".chunk") as chunk:
+        written = 0
+        while written < length:
+            data = stream.read(min(COPY_CHUNK_SIZE, length - written))
+            if not data:
+                break
+            chunk.write(data)
+            written += len(data)
+        if written != length:
+            raise UploadError("Chunk ended early", upload.received)
+        chunk.seek(0)
+        with transaction.atomic():
+            # Claim the offset first: of two requests sending the same chunk only
+            # one gets here, and only it touches the part file
+            if not AttachmentUpload.objects.filter(pk=upload.pk, received=offset).update(received=F("received") + length):
+                raise UploadError("Upload was changed concurrently", AttachmentUpload.objects.get(pk=upload.pk).received)
+            # Should the copy fail, the transaction takes the claim back
+            with open(path, "r+b") as part:
+                part.truncate(offset)
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, COPY_CHUNK_SIZE)
+    upload.received = offset + length
+    if upload.received == upload.size:
+        return finish_upload(upload)
+    return None
+
+
+def sniff_content_type(path):
+    """The content type of the file at ``path`` from its first bytes, or ``application/octet-stream``."""
+    with open(path, "rb") as fh:
+        head = fh.read(16)
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature) and (signature != b"RIFF" or head[8:12] == b"WEBP"):
+            return content_type
+    return OCTET_STREAM
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(COPY_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def finish_upload(upload):
+    """Store the completed upload under its hash and attach it to the claim."""
+    path = part_path(upload)
+    sha256 = _hash_file(path)
+    target = blob_path(sha256)
+    if target.exists():
+        path.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+    from .jobs import enqueue
+
+    content_type = sniff_content_type(target)
+    previewable = content_type in THUMBNAIL_CONTENT_TYPES
+    with transaction.atomic():
+        blob, created = AttachmentBlob.objects.get_or_create(
+            sha256=sha256,
+            defaults={
+                "size": upload.size,
+                "content_type": content_type,
+                "thumbnail_status": (
+                    AttachmentBlob.ThumbnailStatus.Pending if previewable else AttachmentBlob.ThumbnailStatus.Unavailable
+                ),
+            },
+        )
+        if created and previewable:
+            enqueue("attachment_thumbnail", {"blob_id": blob.pk})
+        attachment, _ = ClaimAttachment.objects.get_or_create(
+            claim_id=upload.claim_id, blob=blob,
+            defaults={"filename": upload.filename, "uploaded_by_id": upload.created_by_id},
+        )
+        upload.delete()
+    return attachment
+
+
+def _remove_old_files(paths, cutoff, keep):
+    removed = 0
+    for path in paths:
+        try:
+            if path.name in keep or path.stat().st_mtime >= cutoff:
+                continue
+            path.unlink()
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+
+def cleanup_attachments(max_age):
+    """Delete what uploads older than ``max_age`` (a timedelta) left behind.
+
+    That is uploads started before then with their part files, blobs no
+    attachment refers to any more with their files and thumbnails, and files
+    under ``uploads``, ``blobs`` and ``thumbnails`` that have no row. Files younger than ``max_age``
+    are kept, since a blob file is written just before its row. Returns the
+    number of uploads, blobs and stray files removed.
+    """
+    root = attachment_root()
+    cutoff = timezone.now() - max_age
+    file_cutoff = time.time() - max_age.total_seconds()
+
+    stale = list(AttachmentUpload.objects.filter(created_at__lt=cutoff).values_list("pk", flat=True))
+    AttachmentUpload.objects.filter(pk__in=stale).delete()
+    for upload_id in stale:
+        (root / "uploads" / f"{upload_id}.part").unlink(missing_ok=True)
+
+    blobs = 0
+    for blob in AttachmentBlob.objects.filter(attachments__isnull=True, created_at__lt=cutoff).only("pk", "sha256"):
+        try:
+            with transaction.atomic():
+                # Only if no upload finished with this content since the query above
+                deleted, _ = AttachmentBlob.objects.filter(pk=blob.pk, attachments__isnull=True).delete()
+        except (IntegrityError, ProtectedError):
+            continue
+        if deleted:
+            blob_path(blob.sha256).unlink(missing_ok=True)
+            thumbnail_path(blob.sha256).unlink(missing_ok=True)
+            blobs += 1
+
+    uploads_dir = root / "uploads"
+    strays = 0
+    if uploads_dir.is_dir():
+        live = {f"{pk}.part" for pk in AttachmentUpload.objects.values_list("pk", flat=True)}
+        strays += _remove_old_files(uploads_dir.iterdir(), file_cutoff, live)
+    for stored_dir in (root / "blobs", root / "thumbnails"):
+        if not stored_dir.is_dir():
+            continue
+        for prefix_dir in filter(Path.is_dir, stored_dir.iterdir()):
+            known = set(AttachmentBlob.objects.filter(sha256__startswith=prefix_dir.name).values_list("sha256", flat=True))
+            strays += _remove_old_files(prefix_dir.iterdir(), file_cutoff, known)
+    return len(stale), blobs, strays
@@ -0,0 +1,146 @@
+"""Latency benchmarks for the main portal views.
+
+``seed_dataset`` fills an empty database with a reproducible set of partner
+services, users, customers, catalog parts and claims, made by portal.synthetic.
+``run_benchmarks`` then drives the views through the test client and reports
+latency percentiles, throughput and SQL query counts per view. Results are plain dicts so they can
+be stored as JSON and compared with ``find_regressions``.
+"""
+
+import json
+import platform
+import random
+import statistics
+import time
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import User
+from .models import Customer, PartnerService, SparePart, WarrantyClaim
+from .synthetic import generate_dataset
+
+BENCHMARK_PASSWORD = "benchmark"
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+def seed_dataset(seed=0, services=5, customers_per_service=20, parts=500, claims=5000, days=365):
+    """Fill the (empty) database with a reproducible dataset.
+
+    The rows come from portal.synthetic (uniform over the partner services and
+    parts); every partner user gets the benchmark password and an SSH user is
+    added. Returns the names and ids the benchmarks need.
+    """
+    generate_dataset(seed=seed, services=services, customers=services * customers_per_service, parts=parts,
+                     claims=claims, days=days, skew=0)
+    # Hashing is deliberately slow; every seeded user shares one password hash
+    password = make_password(BENCHMARK_PASSWORD)
+    User.objects.filter(partner_fields__isnull=False).update(password=password)
+    ssh = User.objects.create(username="ssh", password=password)
+    User.objects.filter(pk=ssh.pk).update(role=User.Types.SSH)
+    service = PartnerService.objects.order_by("pk").first()
+    return {
+        "partner": User.objects.get(partner_fields__partner_service=service).username,
+        "ssh": ssh.username,
+        "claim_ids": list(WarrantyClaim.objects.filter(partner_service=service).values_list("pk", flat=True)),
+        "customer_ids": list(Customer.objects.filter(partner_service=service).values_list("pk", flat=True)),
+        "stock_codes": list(SparePart.objects.values_list("stock_code", flat=True)),
+    }
+
+
+def _measure(request, iterations, warmup):
+    """Call ``request(i)`` and record its latency and query count per call."""
+    for i in range(warmup):
+        request(i)
+    latencies, queries = [], []
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request(warmup + i)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            raise RuntimeError(f"benchmark request failed with {response.status_code}")
+        queries.append(len(captured))
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 3),
+        "requests_per_sec": round(len(latencies) / sum(latencies), 2),
+        "queries": max(queries),
+    }
+
+
+def run_benchmarks(dataset, iterations=100, warmup=5, seed=0):
+    """Benchmark the portal views against a seeded dataset; returns ``{view: stats}``."""
+    rng = random.Random(seed)
+    partner = Client()
+    partner.login(username=dataset["partner"], password=BENCHMARK_PASSWORD)
+    ssh = Client()
+    ssh.login(username=dataset["ssh"], password=BENCHMARK_PASSWORD)
+    claim_ids = rng.sample(dataset["claim_ids"], min(len(dataset["claim_ids"]), iterations + warmup))
+
+    def login(i):
+        return Client().post(reverse("portal:login"), {
+            "username": dataset["partner"], "password": BENCHMARK_PASSWORD,
+        })
+
+    def create_claim(i):
+        codes = rng.sample(dataset["stock_codes"], 3)
+        return partner.post(reverse("portal:create_claim"), {
+            "claim_type": WarrantyClaim.ClaimTypes.Repair, "customer": rng.choice(dataset["customer_ids"]),
+            "vehicle_driver_name": "Driver", "vehicle_driver_phone": "555",
+            "vehicle_type": WarrantyClaim.VehicleTypes.Tipper, "vehicle_defect_date": "2025-01-01",
+            "vehicle_chassis_number": 123456, "vehicle_registration_date": "2020-01-01",
+            "vehicle_kilometer": 1000, "defect_category": "axle", "defect_description": "crack near the weld",
+            "parts": json.dumps([{"stock_code": code, "quantity": 1, "currency": "EUR"} for code in codes]),
+        })
+
+    views = {
+        "login_view": login,
+        "claims_page": lambda i: partner.get(reverse("portal:claims")),
+        "claims_page_ssh": lambda i: ssh.get(reverse("portal:claims")),
+        "claim_details": lambda i: partner.get(
+            reverse("portal:claim_details", args=[claim_ids[i % len(claim_ids)]])
+        ),
+        "create_claim": create_claim,
+    }
+    return {name: _measure(request, iterations, warmup) for name, request in views.items()}
+
+
+def environment():
+    """Describe the run, so results from different machines are not mixed up unnoticed."""
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "machine": platform.machine(),
+        "timestamp": timezone.now().isoformat(),
+    }
+
+
+def find_regressions(baseline, results, tolerance=0.25):
+    """Compare two result sets; returns human-readable regressions.
+
+    A view regresses when its p95 latency grows by more than ``tolerance``
+    (a fraction) or it runs more queries than in the baseline.
+    """
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} ms -> {stats['p95_ms']} ms")
+        if stats["queries"] > before["queries"]:
+            regressions.append(f"{name}: queries {before['queries']} -> {stats['queries']}")
+    return regressions
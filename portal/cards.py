@@ -0,0 +1,66 @@
+"""Cached claim cards for the claims list.
+
+Rendering a page of cards is mostly template work on rows that never change.
+Each card is cached as HTML under the claim id and ``claim_last_modified``,
+which ``save`` moves through ``auto_now``; bulk updates that change what a
+card shows set it themselves, as the status workflow does. A card also shows
+the customer and the creator, which can change without the claim being
+modified, so the key carries a digest of their shown values
+(``related_values``) too. Nothing has to be invalidated. A page reads all of
+its cards with one ``get_many`` and stores the ones it had to render with one
+``set_many``. Stale entries are never deleted, since nothing asks for their
+keys again, so they simply expire.
+
+Settings:
+
+``PORTAL_CLAIM_CARD_TIMEOUT``
+    Seconds a card stays cached (default one day).
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+CARD_TEMPLATE = "portal/claim_card.html"
+DEFAULT_TIMEOUT = 24 * 3600
+# Bump when the card template changes, so cached cards are not served in the old layout
+CARD_VERSION = 3
+
+
+def related_values(claim):
+    """The values of the customer and creator of ``claim`` that its card shows."""
+    customer = claim.customer
+    return customer.first_name, customer.last_name, customer.company, claim.created_by.username
+
+
+def card_key(claim, language):
+    related = hashlib.sha256(repr(related_values(claim)).encode()).hexdigest()[:16]
+    modified = claim.claim_last_modified.timestamp()
+    return f"portal:claim-card:{CARD_VERSION}:{language}:{claim.pk}:{modified:.6f}:{related}"
+
+
+def render_claim_cards(claims):
+    """Return the HTML of the card of each claim, in order.
+
+    The claims need the fields the card shows plus ``claim_last_modified``,
+    with the customer and creator joined.
+    """
+    claims = list(claims)
+    # Dates in the card are formatted for the active language
+    language = get_language()
+    keys = [card_key(claim, language) for claim in claims]
+    cached = cache.get_many(keys)
+    rendered = {}
+    cards = []
+    for claim, key in zip(claims, keys):
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_to_string(CARD_TEMPLATE, {"c": claim})
+        cards.append(mark_safe(html))
+    if rendered:
+        cache.set_many(rendered, getattr(settings, "PORTAL_CLAIM_CARD_TIMEOUT", DEFAULT_TIMEOUT))
+    return cards
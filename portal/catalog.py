@@ -0,0 +1,183 @@
+"""Spare-part catalog lookups backed by an in-memory stock-code index.
+
+The index keeps every stock code of the catalog in a sorted list, so prefix and
+exact lookups are a couple of bisections; only the matching rows are then read
+from the database. A catalog version token kept in the database tells each
+process when its copy of the index, or of the serialized catalog snapshot, is
+stale; checking it costs one primary-key read per lookup.
+"""
+
+import hashlib
+import json
+from bisect import bisect_left
+from threading import Lock
+from uuid import uuid4
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import CatalogVersion, SparePart
+from .utility import get_sparepart_data
+
+CATALOG_VERSION_ID = 1
+PRICE_FIELDS = ("price_usd", "price_eur", "price_gbp", "price_try")
+LOOKUP_FIELDS = ("stock_code", "description") + PRICE_FIELDS
+
+
+def _version_rows():
+    return CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).values_list("token", flat=True)
+
+
+def get_catalog_version():
+    """Return the current catalog version token; one primary-key read."""
+    version = _version_rows().first()
+    if version is None:
+        # get_or_create keeps concurrent first callers on a single version
+        version = CatalogVersion.objects.get_or_create(
+            pk=CATALOG_VERSION_ID, defaults={"token": uuid4().hex},
+        )[0].token
+    return version
+
+
+async def aget_catalog_version():
+    """Async version of ``get_catalog_version``."""
+    version = await _version_rows().afirst()
+    if version is None:
+        version = (await CatalogVersion.objects.aget_or_create(
+            pk=CATALOG_VERSION_ID, defaults={"token": uuid4().hex},
+        ))[0].token
+    return version
+
+
+def invalidate_catalog():
+    """Give the catalog a new version token, in the current transaction.
+
+    The token lives in the database, so web workers and management commands
+    all see the same one, and it commits or rolls back together with the
+    catalog write. Tokens are random, so a rolled-back change can never leave
+    a process holding an index built from rows that no longer exist under a
+    token that comes back later.
+    """
+    version = uuid4().hex
+    if not CatalogVersion.objects.filter(pk=CATALOG_VERSION_ID).update(token=version):
+        CatalogVersion.objects.update_or_create(pk=CATALOG_VERSION_ID, defaults={"token": version})
+
+
+class StockCodeIndex:
+    """Sorted list of stock codes, rebuilt when the catalog version changes."""
+
+    def __init__(self):
+        self._codes = []
+        self._version = None
+        self._lock = Lock()
+
+    def codes(self):
+        version = get_catalog_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    codes = list(SparePart.objects.values_list("stock_code", flat=True))
+                    # Sort in Python so ordering matches bisect, whatever the DB collation
+                    codes.sort()
+                    self._codes, self._version = codes, version
+        return self._codes
+
+    def exact(self, stock_code):
+        codes = self.codes()
+        i = bisect_left(codes, stock_code)
+        if i < len(codes) and codes[i] == stock_code:
+            return [stock_code]
+        return []
+
+    def prefix(self, prefix, limit):
+        codes = self.codes()
+        i = bisect_left(codes, prefix)
+        matches = []
+        while i < len(codes) and len(matches) < limit and codes[i].startswith(prefix):
+            matches.append(codes[i])
+            i += 1
+        return matches
+
+
+stock_code_index = StockCodeIndex()
+
+
+def _matching_codes(query, exact, limit):
+    if exact:
+        return stock_code_index.exact(query)
+    return stock_code_index.prefix(query, limit)
+
+
+def _in_code_order(codes, rows):
+    # A part deleted since the index was built simply drops out here
+    return [rows[code] for code in codes if code in rows]
+
+
+def lookup_spareparts(query, exact=False, limit=20):
+    """Return catalog rows whose stock code equals or starts with ``query``.
+
+    Rows are plain dicts of ``LOOKUP_FIELDS`` ordered by stock code.
+    """
+    codes = _matching_codes(query, exact, limit)
+    if not codes:
+        return []
+    rows = {
+        row["stock_code"]: row
+        for row in SparePart.objects.filter(stock_code__in=codes).values(*LOOKUP_FIELDS)
+    }
+    return _in_code_order(codes, rows)
+
+
+async def alookup_spareparts(query, exact=False, limit=20):
+    """Async version of ``lookup_spareparts``.
+
+    The index only touches the database when it is stale, so it is consulted
+    in the sync thread; the matching rows are read with the async ORM.
+    """
+    codes = await sync_to_async(_matching_codes)(query, exact, limit)
+    if not codes:
+        return []
+    rows = {
+        row["stock_code"]: row
+        async for row in SparePart.objects.filter(stock_code__in=codes).values(*LOOKUP_FIELDS)
+    }
+    return _in_code_order(codes, rows)
+
+
+class CatalogSnapshot:
+    """Serialized catalog for one catalog version.
+
+    ``etag`` is a hash of the content, so every process serving the same
+    catalog hands out the same validator.
+    """
+
+    def __init__(self, version, content):
+        self.version = version
+        self.content = content
+        self.etag = hashlib.sha256(content).hexdigest()[:32]
+
+
+_snapshot = None
+_snapshot_lock = Lock()
+
+
+def get_catalog_snapshot():
+    """Return the catalog snapshot, rebuilding it only after a catalog change."""
+    global _snapshot
+    version = get_catalog_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                content = json.dumps(get_sparepart_data(), cls=DjangoJSONEncoder).encode()
+                snapshot = _snapshot = CatalogSnapshot(version, content)
+    return snapshot
+
+
+async def aget_catalog_snapshot():
+    """Async version of ``get_catalog_snapshot``; only a rebuild leaves the event loop."""
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version == await aget_catalog_version():
+        return snapshot
+    return await sync_to_async(get_catalog_snapshot)()
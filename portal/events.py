@@ -0,0 +1,200 @@
+"""Append-only audit log of claim and part line changes.
+
+Every write path of WarrantyClaim and ClaimSparePart (saves, deletes,
+queryset updates, ``bulk_create`` and ``bulk_update``) reports its changes
+here as ClaimEvent rows carrying the actor, the time and a
+``{field: [old, new]}`` diff. The events are not written one by one:
+
+- inside a transaction they are buffered and written with one
+  ``bulk_create`` when it commits, and dropped if it (or the savepoint they
+  were recorded in) rolls back. Only ``transaction.on_commit`` is used for
+  this; see _EventSegment;
+- outside of a transaction, during a request wrapped by
+  ClaimEventMiddleware, they are written with one ``bulk_create`` at the end
+  of the request;
+- anywhere else they are written right away.
+
+Saves and deletes diff against the snapshots the rollup and totals maintenance
+take anyway; queryset updates and ``bulk_update`` read the changed columns
+before and after the write.
+
+The actor is whoever ``acting_as`` names, which ClaimEventMiddleware sets to
+the request's user. Enable it by adding ``"portal.events.ClaimEventMiddleware"``
+to ``MIDDLEWARE`` after AuthenticationMiddleware.
+"""
+
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ClaimEvent, ClaimSparePart, WarrantyClaim
+from .totals import TOTAL_FIELDS
+
+EVENT_BATCH_SIZE = 1000
+
+# Totals are derived from the lines and claim_last_modified changes with every
+# write; neither says anything the line events do not
+CLAIM_AUDIT_FIELDS = tuple(
+    field.attname for field in WarrantyClaim._meta.concrete_fields
+    if not field.primary_key and field.attname not in {*TOTAL_FIELDS, "claim_last_modified"}
+)
+LINE_AUDIT_FIELDS = tuple(field.attname for field in ClaimSparePart._meta.concrete_fields if not field.primary_key)
+
+_actor = ContextVar("claim_event_actor", default=None)
+_request_events = ContextVar("claim_request_events", default=None)
+_transaction_batch = ContextVar("claim_transaction_events", default=None)
+
+
+@contextmanager
+def acting_as(user):
+    """Attribute the events recorded inside the block to ``user``."""
+    token = _actor.set(user)
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+def _actor_id():
+    user = _actor.get()
+    if user is None or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+class _TransactionEvents:
+    """The events recorded in one transaction, written with one ``bulk_create`` when it commits."""
+
+    def __init__(self):
+        self.segments = []
+        self.alive = 0
+        self.flushed = False
+
+    def add(self, events):
+        segment = _EventSegment(self, events)
+        self.segments.append(weakref.ref(segment, self._dropped))
+        self.alive += 1
+        transaction.on_commit(segment)
+
+    def _dropped(self, ref):
+        self.alive -= 1
+
+    def flush(self):
+        self.flushed = True
+        events = [event for ref in self.segments if (segment := ref()) is not None for event in segment.events]
+        ClaimEvent.objects.bulk_create(events, batch_size=EVENT_BATCH_SIZE)
+
+
+class _EventSegment:
+    """The events of one ``record`` call, registered as its own on_commit hook.
+
+    A savepoint that rolls back drops the hooks registered inside it, and with
+    them the only reference to their segments, so a dropped segment's weak
+    reference is dead by the time the transaction commits. The first segment
+    to run writes the events of all the live ones.
+    """
+
+    __slots__ = ("batch", "events", "__weakref__")
+
+    def __init__(self, batch, events):
+        self.batch = batch
+        self.events = events
+
+    def __call__(self):
+        if not self.batch.flushed:
+            self.batch.flush()
+
+
+def _transaction_events():
+    batch = _transaction_batch.get()
+    # A committed batch is done; one whose segments were all rolled back is empty
+    if batch is None or batch.flushed or not batch.alive:
+        batch = _TransactionEvents()
+        _transaction_batch.set(batch)
+    return batch
+
+
+def record(events):
+    """Queue unsaved ClaimEvent instances for writing (see the module docstring)."""
+    if not events:
+        return
+    actor_id = _actor_id()
+    now = timezone.now()
+    for event in events:
+        event.actor_id = actor_id
+        event.created_at = now
+    if connection.in_atomic_block:
+        _transaction_events().add(events)
+        return
+    pending = _request_events.get()
+    if pending is not None:
+        pending.extend(events)
+        return
+    ClaimEvent.objects.bulk_create(events, batch_size=EVENT_BATCH_SIZE)
+
+
+@contextmanager
+def buffered_events():
+    """Collect the events recorded outside of transactions and write them at the end."""
+    pending = []
+    token = _request_events.set(pending)
+    try:
+        yield
+    finally:
+        _request_events.reset(token)
+        if pending:
+            ClaimEvent.objects.bulk_create(pending, batch_size=EVENT_BATCH_SIZE)
+
+
+def diff(before, after, fields):
+    """Return ``{field: [old, new]}`` for the ``fields`` that differ; ``None`` rows count as empty."""
+    changes = {}
+    for field in fields:
+        old = before.get(field) if before else None
+        new = after.get(field) if after else None
+        if old != new:
+            changes[field] = [old, new]
+    return changes
+
+
+def claim_event(action, claim_id, before=None, after=None, fields=CLAIM_AUDIT_FIELDS):
+    return ClaimEvent(claim_id=claim_id, action=action, changes=diff(before, after, fields))
+
+
+def line_event(action, claim_id, line_id, before=None, after=None, fields=LINE_AUDIT_FIELDS):
+    return ClaimEvent(claim_id=claim_id, line_id=line_id, action=action, changes=diff(before, after, fields))
+
+
+def instance_values(instance, fields):
+    return {field: getattr(instance, field) for field in fields}
+
+
+def record_updates(before, after, fields, line=False):
+    """Record one event per row whose ``fields`` changed; rows are ``{"pk": ..., field: ...}``."""
+    after = {row["pk"]: row for row in after}
+    events = []
+    for row in before:
+        changes = diff(row, after.get(row["pk"]), fields)
+        if not changes:
+            continue
+        if line:
+            claim_id = after.get(row["pk"], row)["claim_id"]
+            events.append(ClaimEvent(claim_id=claim_id, line_id=row["pk"], action=ClaimEvent.Actions.Updated,
+                                     changes=changes))
+        else:
+            events.append(ClaimEvent(claim_id=row["pk"], action=ClaimEvent.Actions.Updated, changes=changes))
+    record(events)
+
+
+class ClaimEventMiddleware:
+    """Attribute claim events to the request's user and write them once per request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with acting_as(request.user), buffered_events():
+            return self.get_response(request)
@@ -0,0 +1,110 @@
+"""Streaming exports of warranty claims for the SSH back office.
+
+Rows come from one joined query read through a server-side cursor
+(``iterator(chunk_size=...)``) and are written out as they arrive, so memory
+use does not grow with the number of claims and the first bytes leave
+immediately. Part totals are the ones stored on each claim.
+
+Text typed in by partners is written with a leading ``'`` when it starts
+like a formula (``=``, ``+``, ``-``, ``@``, tab or CR), so a spreadsheet
+opening the export shows it as text instead of evaluating it.
+"""
+
+import csv
+
+from django.utils import timezone
+
+from .models import SparePart, WarrantyClaim
+from .totals import total_fields
+from .xlsx import iter_xlsx_bytes
+
+EXPORT_CHUNK_SIZE = 2000
+CSV_ROWS_PER_CHUNK = 500
+
+CLAIM_COLUMNS = (
+    ("Claim ID", "id"),
+    ("Claim Date", "claim_date"),
+    ("Last Modified", "claim_last_modified"),
+    ("Status", "status"),
+    ("Claim Type", "claim_type"),
+    ("Vehicle Type", "vehicle_type"),
+    ("Chassis Number", "vehicle_chassis_number"),
+    ("Kilometer", "vehicle_kilometer"),
+    ("Defect Date", "vehicle_defect_date"),
+    ("Defect Category", "defect_category"),
+    ("Customer First Name", "customer__first_name"),
+    ("Customer Last Name", "customer__last_name"),
+    ("Customer Company", "customer__company"),
+    ("Customer Email", "customer__email"),
+    ("Partner Service", "partner_service__name"),
+    ("Created By", "created_by__username"),
+)
+CURRENCIES = SparePart.Currency.values
+FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def export_header():
+    return [label for label, _ in CLAIM_COLUMNS] + [
+        f"{kind} {currency}" for currency in CURRENCIES for kind in ("Requested", "Approved")
+    ]
+
+
+def local_datetime(value):
+    """``value`` in the current time zone to the second, as a naive datetime for spreadsheets."""
+    return timezone.localtime(value).replace(microsecond=0, tzinfo=None)
+
+
+def spreadsheet_text(value):
+    """``value`` made safe to open in a spreadsheet: text that would start a formula gets a ``'``."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_export_rows(claims):
+    """Yield one list of cell values per claim of the ``claims`` queryset."""
+    fields = [field for _, field in CLAIM_COLUMNS]
+    # Totals are denormalized on the claim, so the lines table is not joined
+    totals = [field for currency in CURRENCIES for field in total_fields(currency)]
+    labels = {
+        "status": dict(WarrantyClaim.ClaimStatus.choices),
+        "claim_type": dict(WarrantyClaim.ClaimTypes.choices),
+        "vehicle_type": dict(WarrantyClaim.VehicleTypes.choices),
+    }
+    modified = fields.index("claim_last_modified")
+    rows = claims.values_list(*fields, *totals).order_by("id")
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        values = list(row)
+        for i, field in enumerate(fields):
+            if field in labels:
+                values[i] = str(labels[field].get(values[i], values[i]))
+            else:
+                values[i] = spreadsheet_text(values[i])
+        values[modified] = local_datetime(values[modified])
+        yield values
+
+
+class _Echo:
+    """File-like object whose write() hands back the written line."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(claims):
+    writer = csv.writer(_Echo())
+    chunk = [writer.writerow(export_header())]
+    for row in iter_export_rows(claims):
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= CSV_ROWS_PER_CHUNK:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk)
+
+
+def iter_xlsx(claims):
+    def rows():
+        yield export_header()
+        yield from iter_export_rows(claims)
+
+    return iter_xlsx_bytes(rows(), sheet_name="Warranty Claims")
@@ -3,10 +3,22 @@
 Readability improvements include docstrings and consistent widget attrs.
 """
 
+import re
+
 from django import forms
+from django.core.exceptions import ValidationError
 from django.forms.widgets import DateInput
 from django.utils.translation import gettext_lazy as _
-from .models import WarrantyClaim, Customer, ClaimSparePart, SparePart
+from .models import WarrantyClaim, Customer, ClaimSparePart, SparePart, PartnerService
+
+
+def _whole_quantity(value):
+    """Return ``value`` as a positive whole number, or None; 1.7 is not rounded to 1."""
+    if isinstance(value, str) and re.fullmatch(r"\s*\d+\s*", value, re.ASCII):
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        return None
+    return value
 
 
 class LoginForm(forms.Form):
@@ -28,8 +40,9 @@ class CreateWarrantyClaimForm(forms.ModelForm):
 
     class Meta:
         model = WarrantyClaim
-        # Exclude id (implicit), status (system), created_by, partner_service, and auto date fields
-        exclude = ["status", 'created_by', 'partner_service', 'claim_date', 'claim_last_modified']
+        # Exclude id (implicit), status (system), created_by, partner_service, and auto date fields;
+        # spare parts come in through the ``parts`` payload instead
+        exclude = ["status", 'created_by', 'partner_service', 'claim_date', 'claim_last_modified', 'spare_parts']
         widgets = {
             "claim_type": forms.Select(attrs={"class": "form-select"}),
             "customer": forms.Select(attrs={"class": "form-select"}),
@@ -45,9 +58,102 @@ class CreateWarrantyClaimForm(forms.ModelForm):
         }
 
     def clean_parts(self):
-        data = self.cleaned_data.get("parts")
-        # Optional: validate structure/content
-        return data
+        """Turn the parts payload into unsaved ClaimSparePart lines.
+
+        The payload maps stock codes to ``{quantity, currency}`` (a list of such
+        objects with a ``stock_code`` key is accepted too). Descriptions and prices
+        are snapshotted from the catalog, fetched with a single query; client-side
+        prices are ignored.
+        """
+        data = self.cleaned_data.get("parts") or []
+        if isinstance(data, dict):
+            data = list(data.values())
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ValidationError(_("Invalid spare parts payload."))
+
+        requested = {}
+        currencies = set(SparePart.Currency.values)
+        for item in data:
+            stock_code = str(item.get("stock_code", "")).strip()
+            currency = item.get("currency")
+            quantity = _whole_quantity(item.get("quantity"))
+            if not stock_code or quantity is None or currency not in currencies:
+                raise ValidationError(_("Invalid spare part line: %(line)s") % {"line": item})
+            if stock_code in requested:
+                raise ValidationError(_("Spare part %(code)s is listed twice.") % {"code": stock_code})
+            requested[stock_code] = (quantity, currency)
+
+        catalog = SparePart.objects.in_bulk(list(requested), field_name="stock_code")
+        missing = [code for code in requested if code not in catalog]
+        if missing:
+            raise ValidationError(_("Unknown stock codes: %(codes)s") % {"codes": ", ".join(missing)})
+
+        lines = []
+        for stock_code, (quantity, currency) in requested.items():
+            part = catalog[stock_code]
+            unit_price = getattr(part, f"price_{currency.lower()}")
+            lines.append(ClaimSparePart(
+                spare_part=part,
+                stock_code=stock_code,
+                description=part.description,
+                currency=currency,
+                unit_price=unit_price,
+                quantity=quantity,
+                total_price=unit_price * quantity,
+            ))
+        return lines
+
+    def save_parts(self, claim):
+        """Write the cleaned part lines for a saved claim in one INSERT."""
+        lines = self.cleaned_data.get("parts") or []
+        for line in lines:
+            line.claim = claim
+        return ClaimSparePart.objects.bulk_create(lines)
+
+
+class ClaimFilterForm(forms.Form):
+    """Optional filters for the claims listing; all map to indexed columns."""
+
+    status = forms.ChoiceField(
+        required=False,
+        choices=[("", _("All statuses"))] + WarrantyClaim.ClaimStatus.choices,
+        widget=forms.Select(attrs={"class": "form-select form-select-sm"}),
+    )
+    vehicle_type = forms.ChoiceField(
+        required=False,
+        choices=[("", _("All vehicle types"))] + WarrantyClaim.VehicleTypes.choices,
+        widget=forms.Select(attrs={"class": "form-select form-select-sm"}),
+    )
+    partner_service = forms.ModelChoiceField(
+        required=False,
+        queryset=PartnerService.objects.order_by("name"),
+        empty_label=_("All partners"),
+        widget=forms.Select(attrs={"class": "form-select form-select-sm"}),
+    )
+
+    def __init__(self, *args, show_partner=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not show_partner:
+            # Partners only ever see their own service's claims
+            del self.fields["partner_service"]
+
+    def filter(self, claims):
+        """Apply the valid filters to a WarrantyClaim queryset.
+
+        Each field counts on its own: an invalid one (e.g. a partner service
+        that no longer exists) is left out and reported in ``errors``, and the
+        others still apply.
+        """
+        # Cleaning keeps the fields that validated in cleaned_data
+        self.is_valid()
+        data = self.cleaned_data
+        if data.get("status"):
+            claims = claims.filter(status=data["status"])
+        if data.get("vehicle_type"):
+            claims = claims.filter(vehicle_type=data["vehicle_type"])
+        if data.get("partner_service"):
+            claims = claims.filter(partner_service=data["partner_service"])
+        return claims
 
 
 class WarrantyClaimReadOnlyForm():
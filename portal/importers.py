@@ -0,0 +1,159 @@
+"""Streaming bulk import of the SparePart price catalog.
+
+Rows are read lazily from a CSV or XLSX file, validated in fixed-size batches
+and upserted on ``stock_code`` with one ``bulk_create(update_conflicts=True)``
+per batch, each batch in its own transaction. Memory use depends on the batch
+size, not on the size of the file.
+"""
+
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import SparePart
+from .xlsx import iter_xlsx_rows
+
+DEFAULT_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 100
+IMPORT_COLUMNS = ("stock_code", "description", "price_usd", "price_eur", "price_gbp", "price_try")
+PRICE_COLUMNS = IMPORT_COLUMNS[2:]
+STOCK_CODE_MAX_LENGTH = SparePart._meta.get_field("stock_code").max_length
+CENT = Decimal("0.01")
+PRICE_LIMIT = Decimal(10) ** 10  # max_digits=12 with decimal_places=2
+
+
+class ImportResult:
+    """Counters collected while importing; errors are kept up to a limit."""
+
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+
+def iter_csv_rows(fileobj):
+    """Yield rows of a binary CSV file as lists of strings."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        yield from csv.reader(text)
+    finally:
+        # Leave the underlying file open for the caller
+        text.detach()
+
+
+def iter_rows(fileobj, filename):
+    """Pick the reader for ``filename`` by extension."""
+    if filename.lower().endswith(".xlsx"):
+        return iter_xlsx_rows(fileobj)
+    if filename.lower().endswith(".csv"):
+        return iter_csv_rows(fileobj)
+    raise ValueError(f"Unsupported file type: {filename}. Use .csv or .xlsx")
+
+
+def _parse_header(header):
+    columns = [name.strip().lower() for name in header]
+    if "stock_code" not in columns:
+        raise ValueError("The header row must contain a stock_code column")
+    unknown = [name for name in columns if name and name not in IMPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return {name: i for i, name in enumerate(columns) if name}
+
+
+def _parse_price(value):
+    price = Decimal(value.strip() or "0")
+    # Rounding here would silently change a price list; fractions of a cent are a row error
+    cents = price.quantize(CENT)
+    if cents != price or cents < 0 or cents >= PRICE_LIMIT:
+        raise InvalidOperation
+    return cents
+
+
+def _build_part(values, positions):
+    """Return a SparePart for one row, or raise ValueError with the reason."""
+
+    def cell(name):
+        i = positions[name]
+        return values[i] if i < len(values) else ""
+
+    stock_code = cell("stock_code").strip()
+    if not stock_code:
+        raise ValueError("stock_code is empty")
+    if len(stock_code) > STOCK_CODE_MAX_LENGTH:
+        raise ValueError(f"stock_code is longer than {STOCK_CODE_MAX_LENGTH} characters")
+    part = SparePart(stock_code=stock_code)
+    if "description" in positions:
+        part.description = cell("description").strip()
+    for name in PRICE_COLUMNS:
+        if name in positions:
+            try:
+                setattr(part, name, _parse_price(cell(name)))
+            except (InvalidOperation, ValueError):
+                raise ValueError(f"{name} is not a valid price: {cell(name)!r}")
+    return part
+
+
+def _write_batch(parts, update_fields):
+    # Within one statement a key may appear only once; the last row wins
+    unique = list({part.stock_code: part for part in parts}.values())
+    with transaction.atomic():
+        if update_fields:
+            SparePart.objects.bulk_create(
+                unique,
+                update_conflicts=True,
+                unique_fields=["stock_code"],
+                update_fields=update_fields,
+            )
+        else:
+            # A file of bare stock codes only adds the missing ones
+            SparePart.objects.bulk_create(unique, ignore_conflicts=True)
+    return len(unique)
+
+
+def import_spareparts(rows, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Upsert catalog rows from an iterable whose first item is the header.
+
+    Invalid rows are skipped and reported on the result. ``progress`` is called
+    with the running result after every batch.
+    """
+    result = ImportResult()
+    rows = iter(rows)
+    positions = _parse_header(next(rows, []))
+    update_fields = [name for name in IMPORT_COLUMNS[1:] if name in positions]
+
+    batch = []
+    for line, values in enumerate(rows, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        result.rows += 1
+        try:
+            batch.append(_build_part(values, positions))
+        except ValueError as exc:
+            result.add_error(line, str(exc))
+        if len(batch) >= batch_size:
+            result.imported += _write_batch(batch, update_fields)
+            batch = []
+            result.elapsed = time.monotonic() - result.started
+            if progress:
+                progress(result)
+    if batch:
+        result.imported += _write_batch(batch, update_fields)
+    result.elapsed = time.monotonic() - result.started
+    if progress:
+        progress(result)
+    return result
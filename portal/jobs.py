@@ -0,0 +1,240 @@
+"""A small database-backed job queue for work that should not run in a request.
+
+``enqueue`` inserts a Job row in the caller's transaction, so a job exists
+exactly when the write that asked for it committed, and no broker is needed.
+``manage.py run_jobs`` works the queue:
+
+- Due jobs are claimed in batches of one kind. On backends that support it
+  (PostgreSQL) the batch is selected with ``FOR UPDATE SKIP LOCKED``, so
+  several workers never wait on each other. Elsewhere (SQLite) one
+  conditional UPDATE marks the batch with a fresh token and the worker reads
+  back the rows carrying it; SQLite runs writes one at a time, so two workers
+  can never take the same row.
+- Handlers registered with ``batch=True`` get every payload of the batch in
+  one call, e.g. to send all emails over one SMTP connection. They return
+  the payloads that failed, so the jobs that succeeded are not run again.
+- A failed job is retried with exponential backoff until ``max_attempts``;
+  then it is marked failed with the error.
+- Jobs left running by a worker that died are put back in the queue after
+  ``PORTAL_JOB_TIMEOUT`` seconds (default 600). That counts as an attempt, so
+  a job that keeps killing its worker ends up failed too.
+- Workers only record the outcome of jobs that still carry their token; a
+  job taken away from a worker that was too slow is left to its new owner.
+
+Emails link back to the portal through ``PORTAL_SITE_URL``, the address the
+portal is served at (e.g. ``https://portal.example.com``).
+"""
+
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Job, WarrantyClaim
+
+logger = logging.getLogger("portal.jobs")
+
+DEFAULT_BATCH_SIZE = 50
+DEFAULT_TIMEOUT = 600
+BACKOFF_BASE = 30
+BACKOFF_MAX = 3600
+
+# kind -> (handler, batch)
+_handlers = {}
+
+
+def job_handler(kind, batch=False):
+    """Register the handler of a job kind.
+
+    A plain handler is called with one payload per job; a batch handler with
+    the list of payloads of all jobs claimed together. A batch handler returns
+    ``{index: error}`` for the payloads that failed (nothing if all succeeded);
+    if it raises, the whole batch failed.
+    """
+    def decorator(func):
+        _handlers[kind] = (func, batch)
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=None, max_attempts=5):
+    """Queue a job of ``kind``; it runs once the current transaction commits and ``delay`` has passed."""
+    if kind not in _handlers:
+        raise ValueError(f"No handler for job kind {kind!r}")
+    run_after = timezone.now() + (delay or timedelta(0))
+    return Job.objects.create(kind=kind, payload=payload or {}, run_after=run_after, max_attempts=max_attempts)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that failed ``attempts`` times."""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def _due(kinds=None):
+    jobs = Job.objects.filter(status=Job.Status.Queued, run_after__lte=timezone.now())
+    if kinds:
+        jobs = jobs.filter(kind__in=kinds)
+    return jobs.order_by("run_after", "id")
+
+
+def reclaim_stale():
+    """Requeue the jobs of workers that have run them longer than ``PORTAL_JOB_TIMEOUT``.
+
+    Each counts as a failed attempt; a job out of attempts is marked failed.
+    Returns the number of jobs reclaimed.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, "PORTAL_JOB_TIMEOUT", DEFAULT_TIMEOUT)
+    stale = Job.objects.filter(status=Job.Status.Running, locked_at__lt=now - timedelta(seconds=timeout))
+    changes = {
+        "attempts": F("attempts") + 1, "locked_by": "",
+        "last_error": f"Worker did not finish within {timeout} seconds",
+    }
+    given_up = stale.filter(attempts__gte=F("max_attempts") - 1).update(
+        status=Job.Status.Failed, finished_at=now, **changes,
+    )
+    return given_up + stale.update(status=Job.Status.Queued, run_after=now, **changes)
+
+
+def claim_batch(batch_size=DEFAULT_BATCH_SIZE, kinds=None):
+    """Lock up to ``batch_size`` due jobs of the kind due first; returns them (maybe empty)."""
+    first = _due(kinds).values_list("kind", flat=True).first()
+    if first is None:
+        return []
+    token = uuid.uuid4().hex
+    claim = {"status": Job.Status.Running, "locked_by": token, "locked_at": timezone.now()}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                _due([first]).select_for_update(skip_locked=True).values_list("pk", flat=True)[:batch_size]
+            )
+            Job.objects.filter(pk__in=ids).update(**claim)
+    else:
+        # The subquery and the update run as one statement under SQLite's write lock;
+        # the repeated conditions keep rows another worker just claimed out
+        ids = _due([first]).values("pk")[:batch_size]
+        _due([first]).filter(pk__in=ids).update(**claim)
+    return list(Job.objects.filter(locked_by=token).order_by("id"))
+
+
+def _owned(jobs):
+    # The token guards against recording the outcome of a job reclaimed from this worker
+    return Job.objects.filter(pk__in=[job.pk for job in jobs], locked_by=jobs[0].locked_by)
+
+
+def run_batch(jobs):
+    """Run claimed jobs of one kind and record the outcome; returns the number that succeeded."""
+    if not jobs:
+        return 0
+    handler, batch = _handlers.get(jobs[0].kind, (None, False))
+    if handler is None:
+        _failed(jobs, f"No handler for job kind {jobs[0].kind!r}")
+        return 0
+    if batch:
+        try:
+            errors = handler([job.payload for job in jobs]) or {}
+        except Exception:
+            logger.warning("Batch of %d %s jobs failed", len(jobs), jobs[0].kind, exc_info=True)
+            _failed(jobs, traceback.format_exc())
+            return 0
+        for index, error in errors.items():
+            logger.warning("Job %s failed: %s", jobs[index], error)
+            _failed([jobs[index]], error)
+        succeeded = [job for index, job in enumerate(jobs) if index not in errors]
+        if succeeded:
+            _owned(succeeded).update(status=Job.Status.Done, finished_at=timezone.now())
+        return len(succeeded)
+    done = 0
+    for job in jobs:
+        try:
+            handler(job.payload)
+        except Exception:
+            logger.warning("Job %s failed", job, exc_info=True)
+            _failed([job], traceback.format_exc())
+            continue
+        _owned([job]).update(status=Job.Status.Done, finished_at=timezone.now())
+        done += 1
+    return done
+
+
+def _failed(jobs, error):
+    now = timezone.now()
+    for job in jobs:
+        attempts = job.attempts + 1
+        if attempts >= job.max_attempts:
+            changes = {"status": Job.Status.Failed, "finished_at": now}
+        else:
+            changes = {"status": Job.Status.Queued, "run_after": now + timedelta(seconds=backoff(attempts))}
+        _owned([job]).update(attempts=attempts, last_error=error, locked_by="", **changes)
+
+
+def run_pending(batch_size=DEFAULT_BATCH_SIZE, kinds=None):
+    """Work the queue until nothing is due; returns ``(succeeded, failed)`` job counts."""
+    reclaim_stale()
+    succeeded = failed = 0
+    while True:
+        jobs = claim_batch(batch_size, kinds)
+        if not jobs:
+            return succeeded, failed
+        done = run_batch(jobs)
+        succeeded += done
+        failed += len(jobs) - done
+
+
+# Handlers
+
+def site_url():
+    """The address the portal is served at, without a trailing slash, for links in emails."""
+    base = getattr(settings, "PORTAL_SITE_URL", "")
+    if not base:
+        raise ImproperlyConfigured("Set PORTAL_SITE_URL to the address of the portal, e.g. https://portal.example.com")
+    return base.rstrip("/")
+
+
+@job_handler("claim_created_email", batch=True)
+def send_claim_created_emails(payloads):
+    """Tell partner services about their new claims, all messages over one connection.
+
+    Messages are sent one at a time, so an address the server refuses only
+    fails the job of that message.
+    """
+    claims = WarrantyClaim.objects.select_related("partner_service", "created_by").in_bulk(
+        [payload["claim_id"] for payload in payloads]
+    )
+    sender = getattr(settings, "DEFAULT_FROM_EMAIL", None)
+    base = site_url()
+    errors = {}
+    with get_connection() as mail_connection:
+        for index, payload in enumerate(payloads):
+            claim = claims.get(payload["claim_id"])
+            if claim is None or not claim.partner_service.email:
+                continue
+            message = EmailMessage(
+                f"Warranty claim #{claim.pk} created",
+                f"{claim.created_by} created warranty claim #{claim.pk} on {claim.claim_date}.\n"
+                f"Details: {base}{reverse('portal:claim_details', args=[claim.pk])}\n",
+                sender,
+                [claim.partner_service.email],
+                connection=mail_connection,
+            )
+            try:
+                message.send()
+            except Exception as exc:
+                errors[index] = f"{type(exc).__name__}: {exc}"
+    return errors
+
+
+@job_handler("attachment_thumbnail")
+def make_attachment_thumbnail(payload):
+    """Write the thumbnail of a newly uploaded image (see portal.thumbnails)."""
+    from .thumbnails import make_thumbnail
+
+    make_thumbnail(payload["blob_id"])
@@ -0,0 +1,107 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from portal.models import WarrantyClaim
+from users.models import User
+
+
+def _summary(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) * 1000,
+        "p95": latencies[max(int(len(latencies) * 0.95) - 1, 0)] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync views served through the WSGI handler with the async views "
+        "served through the ASGI handler, in-process. Both stacks get the same clients and "
+        "at most --workers requests in flight; the numbers are reported without a verdict."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--username", help="User to request as (default: the first superuser)")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per view and mode")
+        parser.add_argument("--clients", type=int, default=64, help="Clients requesting at the same time")
+        parser.add_argument("--workers", type=int, default=8, help="Requests each stack handles at the same time")
+
+    def handle(self, *args, username, requests, clients, workers, **options):
+        if requests < 1 or clients < 1 or workers < 1:
+            raise CommandError("--requests, --clients and --workers must be positive")
+        users = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True)
+        user = users.first()
+        if user is None:
+            raise CommandError("No user to request as; pass --username")
+        claim = WarrantyClaim.objects.order_by("-pk").first()
+        if claim is None:
+            raise CommandError("There are no claims to request")
+
+        client = Client()
+        client.force_login(user)
+        self.cookies = client.cookies
+        views = [
+            ("claims list", reverse("portal:claims"), reverse("portal:claims_async")),
+            ("claim details", reverse("portal:claim_details", args=[claim.pk]),
+             reverse("portal:claim_details_async", args=[claim.pk])),
+            ("part lookup", reverse("portal:sparepart_lookup") + "?q=1",
+             reverse("portal:sparepart_lookup_async") + "?q=1"),
+        ]
+        self.stdout.write(f"{requests} requests per view, {clients} clients, {workers} workers per stack")
+        self.stdout.write(f"{'view':<15}{'mode':<6}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, sync_url, async_url in views:
+            for mode, result in (
+                ("wsgi", self.run_wsgi(sync_url, requests, clients, workers)),
+                ("asgi", asyncio.run(self.run_asgi(async_url, requests, clients, workers))),
+            ):
+                self.stdout.write(
+                    f"{name:<15}{mode:<6}{result['rps']:>9.1f}{result['p50']:>9.1f}{result['p95']:>9.1f}"
+                )
+
+    def expect_ok(self, url, response):
+        if response.status_code != 200:
+            raise CommandError(f"{url} answered {response.status_code}")
+
+    def run_wsgi(self, url, requests, clients, workers):
+        # Every client has a thread; a request waits for one of the workers
+        pool = threading.BoundedSemaphore(workers)
+
+        def fetch(_):
+            client = Client()
+            client.cookies = self.cookies
+            started = time.perf_counter()
+            with pool:
+                self.expect_ok(url, client.get(url))
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients, initializer=connections.close_all) as executor:
+            latencies = list(executor.map(fetch, range(requests)))
+        return _summary(latencies, time.perf_counter() - started)
+
+    async def run_asgi(self, url, requests, clients, workers):
+        # The same clients and the same limit on requests in flight, on one event loop
+        client_slots = asyncio.Semaphore(clients)
+        pool = asyncio.Semaphore(workers)
+        client = AsyncClient()
+        client.cookies = self.cookies
+
+        async def fetch():
+            async with client_slots:
+                started = time.perf_counter()
+                async with pool:
+                    self.expect_ok(url, await client.get(url))
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(fetch() for _ in range(requests)))
+        return _summary(latencies, time.perf_counter() - started)
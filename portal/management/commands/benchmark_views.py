@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from portal.benchmarks import environment, find_regressions, run_benchmarks, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and benchmark login, the claims list, claim "
+        "details and claim creation. Reports p50/p95/p99 latency, requests/sec and "
+        "SQL queries per view; --output stores them as JSON and --baseline fails "
+        "on regressions against a stored run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--claims", type=int, default=5000, help="Claims in the seeded dataset")
+        parser.add_argument("--iterations", type=int, default=100, help="Measured requests per view")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed for the dataset and requests")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.25,
+            help="Allowed p95 latency growth over the baseline, as a fraction (default 0.25)",
+        )
+
+    def handle(self, *args, claims, iterations, seed, output, baseline, tolerance, **options):
+        if claims < 1 or iterations < 1:
+            raise CommandError("--claims and --iterations must be positive")
+        if baseline:
+            try:
+                with open(baseline) as fh:
+                    baseline = json.load(fh)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f"Cannot read baseline {baseline}: {exc}")
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=set())
+        try:
+            self.stdout.write(f"Seeding {claims} claims...")
+            dataset = seed_dataset(seed=seed, claims=claims)
+            results = {
+                "environment": environment(),
+                "parameters": {"claims": claims, "iterations": iterations, "seed": seed},
+                "views": run_benchmarks(dataset, iterations=iterations, seed=seed),
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f"{'view':<18}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}")
+        for name, stats in results["views"].items():
+            self.stdout.write(
+                f"{name:<18}{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}"
+                f"{stats['requests_per_sec']:>9.1f}{stats['queries']:>9}"
+            )
+        if output:
+            with open(output, "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Results written to {output}")
+        if baseline:
+            regressions = find_regressions(baseline["views"], results["views"], tolerance)
+            if regressions:
+                raise CommandError("Regressions against the baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.attachments import cleanup_attachments
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete abandoned attachment uploads with their part files, blobs no claim "
+        "refers to any more, and stored files that have no database row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours", type=float, default=24,
+            help="Only remove uploads, blobs and files older than this (default 24)",
+        )
+
+    def handle(self, *args, hours, **options):
+        if hours < 0:
+            raise CommandError("--hours must not be negative")
+        uploads, blobs, strays = cleanup_attachments(timedelta(hours=hours))
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {uploads} abandoned uploads, {blobs} unreferenced blobs and {strays} stray files"
+        ))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.synthetic import DEFAULT_BATCH_SIZE, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Add a deterministic synthetic dataset of partner services, customers, spare "
+        "parts, claims and claim part lines, for reproducing production-scale load."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default 0)")
+        parser.add_argument("--services", type=int, default=20, help="Partner services (default 20)")
+        parser.add_argument("--customers", type=int, default=50000, help="Customers (default 50000)")
+        parser.add_argument("--parts", type=int, default=20000, help="Catalog spare parts (default 20000)")
+        parser.add_argument("--claims", type=int, default=1000000, help="Warranty claims (default 1000000)")
+        parser.add_argument(
+            "--lines-per-claim", type=float, default=2.5,
+            help="Average part lines per claim (default 2.5)",
+        )
+        parser.add_argument("--days", type=int, default=730, help="Days of claim history (default 730)")
+        parser.add_argument(
+            "--skew", type=float, default=1.0,
+            help="Zipf exponent for partner service and part popularity; 0 is uniform (default 1.0)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+            help=f"Rows written per transaction (default {DEFAULT_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, seed, services, customers, parts, claims, lines_per_claim, days, skew, batch_size,
+               **options):
+        if batch_size < 1 or services < 1 or days < 1:
+            raise CommandError("--batch-size, --services and --days must be positive")
+        if min(customers, parts, claims) < 0 or lines_per_claim < 0 or skew < 0:
+            raise CommandError("Counts, --lines-per-claim and --skew cannot be negative")
+
+        def progress(model, rows, elapsed):
+            if model in ("WarrantyClaim", "Customer", "SparePart"):
+                self.stdout.write(f"{model}: {rows} rows, {elapsed:.1f}s")
+
+        started = time.monotonic()
+        written = generate_dataset(
+            seed=seed, services=services, customers=customers, parts=parts, claims=claims,
+            lines_per_claim=lines_per_claim, days=days, skew=skew, batch_size=batch_size, progress=progress,
+        )
+        elapsed = time.monotonic() - started
+        total = sum(written.values())
+        summary = ", ".join(f"{count} {model}" for model, count in written.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {summary} in {elapsed:.1f}s ({total / elapsed:.0f} rows/sec, rollups and search index included)"
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.importers import DEFAULT_BATCH_SIZE, import_spareparts, iter_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Upsert the SparePart catalog from a CSV or XLSX price list. The header row "
+        "needs stock_code and any of description, price_usd, price_eur, price_gbp, price_try."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path to a .csv or .xlsx file")
+        parser.add_argument(
+            "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+            help=f"Rows validated and written per transaction (default {DEFAULT_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, path, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        def progress(result):
+            self.stdout.write(f"{result.rows} rows read, {result.rows_per_second:.0f} rows/sec")
+
+        try:
+            with open(path, "rb") as fh:
+                result = import_spareparts(iter_rows(fh, path), batch_size=batch_size, progress=progress)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... and {result.error_count - len(result.errors)} more errors")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} parts from {result.rows} rows "
+            f"({result.error_count} rejected) in {result.elapsed:.1f}s, "
+            f"{result.rows_per_second:.0f} rows/sec"
+        ))
@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily claim rollups behind the dashboard from the claims. "
+        "Run after loading claims with signals bypassed, or to repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since", metavar="YYYY-MM-DD",
+            help="Only rebuild the days from this date on (default: all days)",
+        )
+
+    def handle(self, *args, since, **options):
+        if since:
+            try:
+                since = date.fromisoformat(since)
+            except ValueError:
+                raise CommandError("--since must be a date in YYYY-MM-DD format")
+        rows = rebuild_rollups(since)
+        scope = f"since {since}" if since else "for all days"
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows {scope}"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from portal.models import WarrantyClaim
+from portal.totals import find_total_mismatches, recompute_claim_totals
+
+
+class Command(BaseCommand):
+    help = (
+        "Verify the per-currency totals stored on warranty claims against their part "
+        "lines, in batches, and repair the claims that drifted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Claims checked per batch")
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Only report mismatches; exit with an error if any are found",
+        )
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Recompute every claim instead of only those that drifted",
+        )
+
+    def handle(self, *args, batch_size, check, all, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        last_pk = 0
+        checked = drifted = 0
+        while True:
+            claim_ids = list(
+                WarrantyClaim.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+            if not claim_ids:
+                break
+            last_pk = claim_ids[-1]
+            checked += len(claim_ids)
+            with transaction.atomic():
+                if all and not check:
+                    recompute_claim_totals(claim_ids)
+                    continue
+                mismatches = find_total_mismatches(claim_ids)
+                drifted += len(mismatches)
+                for claim_id, fields in mismatches.items():
+                    detail = ", ".join(f"{field} {stored} != {expected}" for field, (stored, expected) in fields.items())
+                    self.stdout.write(f"claim {claim_id}: {detail}")
+                if mismatches and not check:
+                    recompute_claim_totals(mismatches)
+
+        if check and drifted:
+            raise CommandError(f"{drifted} of {checked} claims have wrong totals")
+        action = "recomputed" if all and not check else ("found wrong" if check else "repaired")
+        self.stdout.write(self.style.SUCCESS(f"Checked {checked} claims, {action} {checked if all and not check else drifted}"))
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portal.models import SparePart
+from portal.repricing import DEFAULT_BATCH_SIZE, reprice_catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every SparePart price column from the --base currency using the "
+        "ExchangeRate table."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base", default=SparePart.Currency.EUR, choices=SparePart.Currency.values,
+            help="Currency whose prices are kept as entered (default EUR)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+            help=f"Parts written per transaction (default {DEFAULT_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, base, batch_size, **options):
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        started = time.monotonic()
+
+        def progress(count):
+            self.stdout.write(f"{count} parts repriced")
+
+        skipped = []
+
+        def overflow(pk, error):
+            skipped.append(pk)
+            self.stderr.write(f"part {pk} left unchanged: {error}")
+
+        try:
+            count = reprice_catalog(base, batch_size=batch_size, progress=progress, overflow=overflow)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.monotonic() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Repriced {count} parts from {base} in {elapsed:.1f}s ({rate:.0f} parts/sec)"
+        ))
+        if skipped:
+            raise CommandError(f"{len(skipped)} parts were not repriced: a converted price does not fit its column")
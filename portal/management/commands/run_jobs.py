@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from portal.jobs import DEFAULT_BATCH_SIZE, run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        "Work the background job queue: claim due jobs in batches of one kind, run them "
+        "and retry failures with backoff. Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit once no job is due")
+        parser.add_argument(
+            "--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+            help=f"Jobs of one kind claimed together (default {DEFAULT_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=2.0,
+            help="Seconds to sleep when no job is due (default 2)",
+        )
+        parser.add_argument("--kinds", nargs="+", metavar="KIND", help="Only run jobs of these kinds")
+
+    def handle(self, *args, once, batch_size, poll_interval, kinds, **options):
+        if batch_size < 1 or poll_interval < 0:
+            raise CommandError("--batch-size must be positive and --poll-interval cannot be negative")
+        try:
+            while True:
+                succeeded, failed = run_pending(batch_size, kinds)
+                if succeeded or failed:
+                    self.stdout.write(f"Ran {succeeded + failed} jobs: {succeeded} succeeded, {failed} failed")
+                if once:
+                    return
+                # Drop connections the database may have closed while idle
+                close_old_connections()
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopped")
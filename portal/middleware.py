@@ -0,0 +1,120 @@
+"""Per-request SQL instrumentation.
+
+QueryInstrumentationMiddleware wraps every query a request runs on any
+database connection and records the count, the total SQL time and the queries
+that repeat. The figures go out as a ``Server-Timing`` header (visible in the
+browser's network panel) and as one JSON log line on the ``portal.sql``
+logger; requests that repeat a query are logged as warnings, since a query run
+once per row of a page is the usual N+1 pattern.
+
+Enable it by adding ``"portal.middleware.QueryInstrumentationMiddleware"`` to
+``MIDDLEWARE``. Settings:
+
+``PORTAL_QUERY_BUDGET``
+    Queries a request may run before it is reported as over budget (default
+    none). Views can set their own with the ``query_budget`` decorator.
+``PORTAL_QUERY_STRICT``
+    Raise QueryBudgetExceeded instead of logging when a request goes over its
+    budget. Meant for tests.
+``PORTAL_QUERY_REPEAT_THRESHOLD``
+    How often the same statement may run in one request before it is
+    reported as repeated (default 3).
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("portal.sql")
+
+DEFAULT_REPEAT_THRESHOLD = 3
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(limit):
+    """Set the query budget of a view, overriding ``PORTAL_QUERY_BUDGET``."""
+    def decorator(view):
+        view.query_budget = limit
+        return view
+    return decorator
+
+
+class QueryRecorder:
+    """Execute wrapper collecting the statements and SQL time of one request."""
+
+    def __init__(self):
+        self.statements = Counter()
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.statements[sql] += 1
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def repeated(self, threshold):
+        """Return ``[(sql, count)]`` for statements run at least ``threshold`` times."""
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+class QueryInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.default_budget = getattr(settings, "PORTAL_QUERY_BUDGET", None)
+        self.strict = getattr(settings, "PORTAL_QUERY_STRICT", False)
+        self.repeat_threshold = getattr(settings, "PORTAL_QUERY_REPEAT_THRESHOLD", DEFAULT_REPEAT_THRESHOLD)
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        request.query_budget = self.default_budget
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        repeated = recorder.repeated(self.repeat_threshold)
+        response.headers["Server-Timing"] = ", ".join([
+            f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"',
+            f'dup;desc="{len(repeated)} repeated"',
+            f"total;dur={elapsed * 1000:.1f}",
+        ])
+        budget = request.query_budget
+        over_budget = budget is not None and recorder.count > budget
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "db_ms": round(recorder.duration * 1000, 2),
+            "total_ms": round(elapsed * 1000, 2),
+            "budget": budget,
+            "repeated": [{"count": count, "sql": sql[:300]} for sql, count in repeated],
+        }
+        level = logging.WARNING if repeated or over_budget else logging.INFO
+        logger.log(level, json.dumps(record))
+        if over_budget and self.strict:
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} ran {recorder.count} queries, budget is {budget}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        budget = getattr(view_func, "query_budget", None)
+        if budget is not None:
+            request.query_budget = budget
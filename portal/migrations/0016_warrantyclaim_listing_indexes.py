@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:56
+
+import datetime
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0015_claimsparepart_currency_unit_price'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='claimsparepart',
+            name='approved_total_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='claimsparepart',
+            name='claim',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_spare_parts', to='portal.warrantyclaim'),
+        ),
+        migrations.AlterField(
+            model_name='claimsparepart',
+            name='currency',
+            field=models.CharField(choices=[('USD', 'USD'), ('EUR', 'EUR'), ('GBP', 'GBP'), ('TRY', 'TRY')], default='EUR', max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='claimsparepart',
+            name='spare_part',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='claims', to='portal.sparepart', to_field='stock_code'),
+        ),
+        migrations.AlterField(
+            model_name='warrantyclaim',
+            name='spare_parts',
+            field=models.ManyToManyField(blank=True, through='portal.ClaimSparePart', to='portal.sparepart'),
+        ),
+        migrations.AlterField(
+            model_name='warrantyclaim',
+            name='vehicle_defect_date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AlterField(
+            model_name='warrantyclaim',
+            name='vehicle_registration_date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['claim_date', 'id'], name='claim_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['partner_service', 'claim_date', 'id'], name='claim_partner_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['status', 'claim_date', 'id'], name='claim_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['vehicle_type', 'claim_date', 'id'], name='claim_vtype_date_idx'),
+        ),
+    ]
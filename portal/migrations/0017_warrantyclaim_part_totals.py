@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:59
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    WarrantyClaim = apps.get_model("portal", "WarrantyClaim")
+    ClaimSparePart = apps.get_model("portal", "ClaimSparePart")
+    output = DecimalField(max_digits=14, decimal_places=2)
+
+    def line_sum(currency, price_field):
+        lines = (
+            ClaimSparePart.objects.filter(claim=OuterRef("pk"), currency=currency)
+            .order_by().values("claim").annotate(total=Sum(price_field)).values("total")
+        )
+        return Coalesce(Subquery(lines, output_field=output), Value(Decimal(0)), output_field=output)
+
+    changes = {}
+    for currency in ("USD", "EUR", "GBP", "TRY"):
+        changes[f"requested_total_{currency.lower()}"] = line_sum(currency, "total_price")
+        changes[f"approved_total_{currency.lower()}"] = line_sum(currency, "approved_total_price")
+    WarrantyClaim.objects.filter(claim_spare_parts__isnull=False).distinct().update(**changes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0016_warrantyclaim_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='approved_total_eur',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='approved_total_gbp',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='approved_total_try',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='approved_total_usd',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='requested_total_eur',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='requested_total_gbp',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='requested_total_try',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='warrantyclaim',
+            name='requested_total_usd',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
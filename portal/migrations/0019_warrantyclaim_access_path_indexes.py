@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0018_exchangerate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['partner_service', 'status', 'claim_date', 'id'], name='claim_partner_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='warrantyclaim',
+            index=models.Index(fields=['vehicle_chassis_number'], name='claim_chassis_idx'),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+TOTAL_FIELDS = [
+    f"{kind}_total_{currency}" for currency in ("usd", "eur", "gbp", "try") for kind in ("requested", "approved")
+]
+
+
+def backfill_rollups(apps, schema_editor):
+    WarrantyClaim = apps.get_model("portal", "WarrantyClaim")
+    ClaimRollup = apps.get_model("portal", "ClaimRollup")
+    groups = (
+        WarrantyClaim.objects.order_by()
+        .values("claim_date", "status", "partner_service_id", "vehicle_type")
+        .annotate(claim_count=Count("pk"), **{f"sum_{field}": Sum(field) for field in TOTAL_FIELDS})
+    )
+    ClaimRollup.objects.bulk_create(
+        (
+            ClaimRollup(
+                day=group["claim_date"], status=group["status"], partner_service_id=group["partner_service_id"],
+                vehicle_type=group["vehicle_type"], claim_count=group["claim_count"],
+                **{field: group[f"sum_{field}"] for field in TOTAL_FIELDS},
+            )
+            for group in groups.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0020_warrantyclaim_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('NW', 'New'), ('RV', 'Revised'), ('NR', 'Needs Revise'), ('AC', 'Accepted'), ('RJ', 'Rejected'), ('CP', 'Completed')], max_length=2)),
+                ('vehicle_type', models.CharField(choices=[('CS', 'Curtain Sider'), ('PF', 'Platform'), ('CC', 'Container Chassis'), ('SB', 'Swap Body'), ('RF', 'Reefer'), ('BX', 'Box'), ('SI', 'Silo'), ('TK', 'Tanker'), ('LB', 'Low-Bed'), ('TP', 'Tipper'), ('OT', 'Other')], max_length=2)),
+                ('claim_count', models.IntegerField(default=0)),
+                ('requested_total_usd', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('approved_total_usd', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('requested_total_eur', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('approved_total_eur', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('requested_total_gbp', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('approved_total_gbp', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('requested_total_try', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('approved_total_try', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('partner_service', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claim_rollups', to='portal.partnerservice')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['partner_service', 'day'], name='claim_rollup_partner_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'status', 'partner_service', 'vehicle_type'), name='claim_rollup_key')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
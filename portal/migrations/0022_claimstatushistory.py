@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0021_claimrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaimStatusHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_status', models.CharField(choices=[('NW', 'New'), ('RV', 'Revised'), ('NR', 'Needs Revise'), ('AC', 'Accepted'), ('RJ', 'Rejected'), ('CP', 'Completed')], max_length=2)),
+                ('to_status', models.CharField(choices=[('NW', 'New'), ('RV', 'Revised'), ('NR', 'Needs Revise'), ('AC', 'Accepted'), ('RJ', 'Rejected'), ('CP', 'Completed')], max_length=2)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+                ('note', models.TextField(blank=True)),
+                ('changed_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='claim_status_changes', to=settings.AUTH_USER_MODEL)),
+                ('claim', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='portal.warrantyclaim')),
+            ],
+            options={
+                'verbose_name_plural': 'claim status history',
+                'indexes': [models.Index(fields=['claim', 'changed_at'], name='claim_status_history_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+def dates_to_datetimes(apps, schema_editor):
+    # PostgreSQL and MySQL cast the column type; SQLite keeps the stored
+    # 'YYYY-MM-DD' text, which would sort before every datetime of that day
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "UPDATE portal_warrantyclaim SET claim_last_modified = claim_last_modified || ' 00:00:00' "
+            "WHERE length(claim_last_modified) = 10"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0025_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='warrantyclaim',
+            name='claim_last_modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(dates_to_datetimes, migrations.RunPython.noop),
+    ]
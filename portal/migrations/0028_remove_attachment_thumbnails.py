@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:45
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portal', '0027_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='attachmentblob',
+            name='thumbnail_status',
+        ),
+    ]
@@ -5,9 +5,13 @@ through models for claim spare parts and labours. Only readability-oriented
 improvements (docstrings, comments) are applied to avoid schema changes.
 """
 
+import uuid
+
 from Service_Portal.settings import AUTH_USER_MODEL as User
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from datetime import date
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -48,6 +52,34 @@ class Customer(models.Model):
         return f"{self.company.title()}"
 
 
+def _catalog_changed():
+    # Imported lazily: the catalog module itself depends on these models
+    from .catalog import invalidate_catalog
+    invalidate_catalog()
+
+
+class SparePartQuerySet(models.QuerySet):
+    """Queryset that invalidates the cached catalog on bulk writes.
+
+    Single saves and deletes are covered by signals; these paths bypass them.
+    """
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        _catalog_changed()
+        return rows
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        _catalog_changed()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        _catalog_changed()
+        return objs
+
+
 class SparePart(models.Model):
     """Catalog entry for a spare part with prices in multiple currencies."""
 
@@ -67,10 +99,83 @@ class SparePart(models.Model):
     price_gbp = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     price_try = models.DecimalField(max_digits=12, decimal_places=2, default=0)
 
+    objects = SparePartQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.stock_code}:{self.description}"
 
 
+class CatalogVersion(models.Model):
+    """Single row whose token changes with every write to the catalog; see portal.catalog."""
+
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return self.token
+
+
+class ExchangeRate(models.Model):
+    """Units of a currency per one unit of the common reference currency.
+
+    Only ratios between rates are used, so any reference works as long as all
+    rates share it (a rate of 1 marks the reference itself).
+    """
+
+    currency = models.CharField(max_length=3, choices=SparePart.Currency.choices, unique=True)
+    rate = models.DecimalField(max_digits=18, decimal_places=8)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.currency}: {self.rate}"
+
+
+class WarrantyClaimQuerySet(models.QuerySet):
+    """Queryset that keeps the daily claim rollups and the event log right on bulk updates.
+
+    Single saves and deletes (including queryset deletes) go through signals.
+    """
+
+    def for_user(self, user):
+        """Return the claims ``user`` may see, with the customer and creator joined.
+
+        Partners and partner admins see the claims of their partner service
+        (none without one), SSH staff see all claims and anybody else none.
+        The partner scope is a plain ``partner_service_id`` filter, so it is
+        served by the partner indexes of the claim table.
+        """
+        if not user.is_authenticated:
+            return self.none()
+        if user.is_partner or user.is_partner_admin:
+            from users.principal import get_partner_service
+            partner_service = get_partner_service(user)
+            if partner_service is None:
+                return self.none()
+            claims = self.filter(partner_service_id=partner_service.pk)
+        elif user.is_ssh or user.is_ssh_admin:
+            claims = self.all()
+        else:
+            return self.none()
+        return claims.select_related("customer", "created_by")
+
+    def update(self, **kwargs):
+        from .events import CLAIM_AUDIT_FIELDS, record_updates
+        from .rollups import ROLLUP_SOURCE_FIELDS, apply_rollup_delta, claim_rows, rows_delta
+        audited = [
+            field for field in (self.model._meta.get_field(name).attname for name in kwargs)
+            if field in CLAIM_AUDIT_FIELDS
+        ]
+        tracked = not ROLLUP_SOURCE_FIELDS.isdisjoint(kwargs)
+        if not (tracked or audited):
+            return super().update(**kwargs)
+        claim_ids = list(self.values_list("pk", flat=True))
+        before = claim_rows(claim_ids, audited)
+        rows = super().update(**kwargs)
+        after = claim_rows(claim_ids, audited)
+        if tracked:
+            apply_rollup_delta(rows_delta(before, after))
+        record_updates(before, after, audited)
+        return rows
+
 
 class WarrantyClaim(models.Model):
     """A warranty claim created by a partner for a customer and vehicle."""
@@ -101,7 +206,7 @@ class WarrantyClaim(models.Model):
         Completed = "CP", _("Completed")
 
     claim_date = models.DateField(auto_now_add=True)
-    claim_last_modified = models.DateField(auto_now=True)
+    claim_last_modified = models.DateTimeField(auto_now=True)
     claim_type = models.CharField(max_length=2, choices=ClaimTypes.choices, default=ClaimTypes.Repair)
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name="claims")
     vehicle_driver_name = models.CharField(max_length=64)
@@ -122,6 +227,130 @@ class WarrantyClaim(models.Model):
         blank=True,
     )
 
+    # Per-currency sums of the claim's part lines, kept up to date by portal.totals
+    requested_total_usd = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    approved_total_usd = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    requested_total_eur = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    approved_total_eur = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    requested_total_gbp = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    approved_total_gbp = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    requested_total_try = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+    approved_total_try = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
+
+    objects = WarrantyClaimQuerySet.as_manager()
+
+    class Meta:
+        # Listings page by keyset on (claim_date, id); each filter gets its own prefix.
+        # portal.tests.QueryPlanTests fails if one of these access paths stops using them.
+        indexes = [
+            models.Index(fields=["claim_date", "id"], name="claim_date_id_idx"),
+            models.Index(fields=["partner_service", "claim_date", "id"], name="claim_partner_date_idx"),
+            models.Index(fields=["partner_service", "status", "claim_date", "id"], name="claim_partner_status_idx"),
+            models.Index(fields=["status", "claim_date", "id"], name="claim_status_date_idx"),
+            models.Index(fields=["vehicle_type", "claim_date", "id"], name="claim_vtype_date_idx"),
+            models.Index(fields=["vehicle_chassis_number"], name="claim_chassis_idx"),
+        ]
+
+
+class ClaimRollup(models.Model):
+    """Claim count and per-currency totals of the claims sharing one day and key.
+
+    Maintained incrementally by portal.rollups; ``rebuild_claim_rollups``
+    recomputes it from the claims.
+    """
+
+    day = models.DateField()
+    status = models.CharField(max_length=2, choices=WarrantyClaim.ClaimStatus.choices)
+    partner_service = models.ForeignKey(PartnerService, on_delete=models.CASCADE, related_name="claim_rollups")
+    vehicle_type = models.CharField(max_length=2, choices=WarrantyClaim.VehicleTypes.choices)
+    claim_count = models.IntegerField(default=0)
+    requested_total_usd = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    approved_total_usd = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    requested_total_eur = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    approved_total_eur = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    requested_total_gbp = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    approved_total_gbp = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    requested_total_try = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    approved_total_try = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["day", "status", "partner_service", "vehicle_type"], name="claim_rollup_key",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["partner_service", "day"], name="claim_rollup_partner_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status} {self.partner_service_id} {self.vehicle_type}: {self.claim_count}"
+
+
+class ClaimStatusHistory(models.Model):
+    """One status change of a claim, written by portal.workflow."""
+
+    claim = models.ForeignKey(WarrantyClaim, on_delete=models.CASCADE, related_name="status_history")
+    from_status = models.CharField(max_length=2, choices=WarrantyClaim.ClaimStatus.choices)
+    to_status = models.CharField(max_length=2, choices=WarrantyClaim.ClaimStatus.choices)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="claim_status_changes")
+    changed_at = models.DateTimeField(auto_now_add=True)
+    note = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name_plural = _("claim status history")
+        indexes = [
+            models.Index(fields=["claim", "changed_at"], name="claim_status_history_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.claim_id}: {self.from_status} -> {self.to_status}"
+
+
+class ClaimSparePartQuerySet(models.QuerySet):
+    """Queryset that keeps the claims' denormalized totals and the event log right on bulk writes.
+
+    Single saves and deletes (including queryset deletes) go through signals.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        from .events import LINE_AUDIT_FIELDS, instance_values, line_event, record
+        from .totals import apply_totals_delta, lines_delta
+        objs = super().bulk_create(objs, *args, **kwargs)
+        apply_totals_delta(lines_delta(objs))
+        # Without returned primary keys (ignore_conflicts) the created rows are unknown
+        record([
+            line_event(ClaimEvent.Actions.Created, obj.claim_id, obj.pk, after=instance_values(obj, LINE_AUDIT_FIELDS))
+            for obj in objs if obj.pk is not None
+        ])
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        from .events import record_updates
+        from .totals import recompute_claim_totals
+        objs = list(objs)
+        audited = list(dict.fromkeys(["claim_id", *(self.model._meta.get_field(name).attname for name in fields)]))
+        # A line may also have been moved away from another claim
+        before = list(self.filter(pk__in=[obj.pk for obj in objs]).values("pk", *audited))
+        claim_ids = {obj.claim_id for obj in objs} | {row["claim_id"] for row in before}
+        rows = super().bulk_update(objs, fields, batch_size=batch_size)
+        recompute_claim_totals(claim_ids)
+        record_updates(before, [{"pk": obj.pk, **{field: getattr(obj, field) for field in audited}} for obj in objs],
+                       audited, line=True)
+        return rows
+
+    def update(self, **kwargs):
+        from .events import record_updates
+        from .totals import recompute_claim_totals
+        audited = list(dict.fromkeys(["claim_id", *(self.model._meta.get_field(name).attname for name in kwargs)]))
+        before = list(self.values("pk", *audited))
+        rows = super().update(**kwargs)
+        after = list(ClaimSparePart.objects.filter(pk__in=[row["pk"] for row in before]).values("pk", *audited))
+        recompute_claim_totals({row["claim_id"] for row in before} | {row["claim_id"] for row in after})
+        record_updates(before, after, audited, line=True)
+        return rows
+
+
 class ClaimSparePart(models.Model):
     """Through model storing part snapshot and pricing at claim time."""
 
@@ -142,6 +371,8 @@ class ClaimSparePart(models.Model):
     total_price = models.DecimalField(max_digits=12, decimal_places=2)
     approved_total_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
 
+    objects = ClaimSparePartQuerySet.as_manager()
+
     class Meta:
         unique_together = (("claim", "spare_part"),)
 
@@ -149,6 +380,146 @@ class ClaimSparePart(models.Model):
         return f"{self.stock_code}"
 
 
+class ClaimEventQuerySet(models.QuerySet):
+    """Events are only ever inserted; bulk changes are refused."""
 
+    def update(self, **kwargs):
+        raise TypeError("Claim events are append-only")
 
+    def delete(self):
+        raise TypeError("Claim events are append-only")
 
+
+class ClaimEvent(models.Model):
+    """One append-only audit record of a change to a claim or one of its part lines.
+
+    Written in batches by portal.events. The claim, line and actor are kept
+    as plain ids without foreign key constraints, so the history outlives
+    deleted claims and users.
+    """
+
+    class Actions(models.TextChoices):
+        Created = "created", _("Created")
+        Updated = "updated", _("Updated")
+        Deleted = "deleted", _("Deleted")
+
+    claim = models.ForeignKey(
+        WarrantyClaim, on_delete=models.DO_NOTHING, db_constraint=False, related_name="events",
+    )
+    # Set for part line events, empty for changes to the claim itself
+    line_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=10, choices=Actions.choices)
+    actor = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name="+",
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    # {field: [old value, new value]}
+    changes = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+
+    objects = ClaimEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["claim", "created_at"], name="claim_event_claim_idx"),
+        ]
+
+    def __str__(self):
+        target = f"line {self.line_id} of claim {self.claim_id}" if self.line_id else f"claim {self.claim_id}"
+        return f"{target} {self.action} at {self.created_at:%Y-%m-%d %H:%M:%S}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise TypeError("Claim events are append-only")
+        super().save(*args, **kwargs)
+
+
+class AttachmentBlob(models.Model):
+    """The content of an uploaded file, stored once under its SHA-256.
+
+    portal.attachments writes the file to ``blobs/<sha256[:2]>/<sha256>``;
+    every ClaimAttachment with the same content points at the same blob.
+    """
+
+    class ThumbnailStatus(models.TextChoices):
+        Pending = "pending", _("Pending")
+        Ready = "ready", _("Ready")
+        # Not a format portal.thumbnails can decode, or a broken file
+        Unavailable = "unavailable", _("Unavailable")
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField()
+    content_type = models.CharField(max_length=100)
+    thumbnail_status = models.CharField(
+        max_length=12, choices=ThumbnailStatus.choices, default=ThumbnailStatus.Unavailable,
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
+
+class ClaimAttachment(models.Model):
+    """A photo or document attached to a claim."""
+
+    claim = models.ForeignKey(WarrantyClaim, on_delete=models.CASCADE, related_name="attachments")
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, related_name="attachments")
+    filename = models.CharField(max_length=255)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name="+")
+    uploaded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # Sending the same file to the same claim again attaches it once
+        constraints = [
+            models.UniqueConstraint(fields=["claim", "blob"], name="claim_attachment_unique_blob"),
+        ]
+
+    def __str__(self):
+        return self.filename
+
+
+class AttachmentUpload(models.Model):
+    """A resumable upload in progress; the bytes received so far sit in a part file."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    claim = models.ForeignKey(WarrantyClaim, on_delete=models.CASCADE, related_name="+")
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+
+class Job(models.Model):
+    """A unit of background work for ``manage.py run_jobs``; see portal.jobs."""
+
+    class Status(models.TextChoices):
+        Queued = "queued", _("Queued")
+        Running = "running", _("Running")
+        Done = "done", _("Done")
+        Failed = "failed", _("Failed")
+
+    kind = models.CharField(max_length=64)
+    payload = models.JSONField(encoder=DjangoJSONEncoder, default=dict)
+    status = models.CharField(max_length=8, choices=Status.choices, default=Status.Queued)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Token of the worker batch holding the job while it runs
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for due jobs in run_after order
+            models.Index(fields=["status", "run_after", "id"], name="job_due_idx"),
+            models.Index(fields=["locked_by"], name="job_locked_by_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
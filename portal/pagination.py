@@ -0,0 +1,54 @@
+"""Keyset (cursor) pagination for claim listings.
+
+Pages are ordered newest first on ``(claim_date, id)`` and the cursor is the
+key of the last row shown, so fetching any page costs the same index range
+scan instead of an ever-growing OFFSET.
+"""
+
+from datetime import date
+
+from django.db.models import Q
+
+CLAIMS_PAGE_SIZE = 25
+
+
+def encode_cursor(claim):
+    return f"{claim.claim_date.isoformat()}.{claim.pk}"
+
+
+def decode_cursor(cursor):
+    """Return ``(claim_date, id)`` from a cursor, or ``None`` if it is malformed."""
+    try:
+        day, pk = cursor.split(".")
+        return date.fromisoformat(day), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _keyset_slice(queryset, cursor, page_size):
+    queryset = queryset.order_by("-claim_date", "-id")
+    key = decode_cursor(cursor) if cursor else None
+    if key:
+        day, pk = key
+        queryset = queryset.filter(Q(claim_date__lt=day) | Q(claim_date=day, id__lt=pk))
+    # One extra row tells whether another page exists without a COUNT(*)
+    return queryset[:page_size + 1]
+
+
+def _split_page(claims, page_size):
+    if len(claims) > page_size:
+        return claims[:page_size], encode_cursor(claims[page_size - 1])
+    return claims, None
+
+
+def keyset_page(queryset, cursor=None, page_size=CLAIMS_PAGE_SIZE):
+    """Return ``(claims, next_cursor)`` for the page after ``cursor``.
+
+    ``next_cursor`` is ``None`` on the last page.
+    """
+    return _split_page(list(_keyset_slice(queryset, cursor, page_size)), page_size)
+
+
+async def akeyset_page(queryset, cursor=None, page_size=CLAIMS_PAGE_SIZE):
+    """Async version of ``keyset_page``."""
+    return _split_page([claim async for claim in _keyset_slice(queryset, cursor, page_size)], page_size)
@@ -0,0 +1,98 @@
+"""Minimal PDF writer using only the standard library.
+
+Only what the claim reports need is supported: A4 pages of text in the
+built-in Helvetica fonts (no embedding, so documents stay a few kilobytes)
+and straight lines. Text is encoded as WinAnsi (cp1252); characters outside
+it, such as the Turkish dotless i or s-cedilla, fall back to their base
+letter, anything else to ``?``.
+"""
+
+import unicodedata
+import zlib
+
+A4 = (595, 842)
+
+# Helvetica advance widths (1/1000 em) of the characters right-aligned
+# columns are made of; other characters are estimated
+_WIDTHS = {
+    **{digit: 556 for digit in "0123456789"},
+    ".": 278, ",": 278, "-": 333, " ": 278, "#": 556, ":": 278, "/": 278,
+}
+_DEFAULT_WIDTH = 556
+_FALLBACKS = {"ı": "i", "İ": "I", "ş": "s", "Ş": "S", "ğ": "g", "Ğ": "G"}
+
+
+def text_width(text, size):
+    """Approximate width of ``text`` in points; exact for digits and punctuation."""
+    return sum(_WIDTHS.get(char, _DEFAULT_WIDTH) for char in text) * size / 1000
+
+
+def _encode(text):
+    encoded = bytearray()
+    for char in text:
+        try:
+            encoded += char.encode("cp1252")
+            continue
+        except UnicodeEncodeError:
+            pass
+        base = _FALLBACKS.get(char) or unicodedata.normalize("NFKD", char)[0]
+        encoded += base.encode("cp1252", errors="replace")
+    # Parentheses and backslashes delimit PDF strings
+    return bytes(encoded).replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+class PdfDocument:
+    """Collect drawing operations page by page and serialize them with ``to_bytes``.
+
+    Coordinates are in points from the bottom left corner of the page.
+    """
+
+    def __init__(self, page_size=A4):
+        self.width, self.height = page_size
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.pages.append([])
+
+    def text(self, x, y, text, size=10, bold=False):
+        font = b"/F2" if bold else b"/F1"
+        self.pages[-1].append(b"BT %s %d Tf %.2f %.2f Td (%s) Tj ET" % (font, size, x, y, _encode(str(text))))
+
+    def text_right(self, x, y, text, size=10, bold=False):
+        """Draw ``text`` so that it ends at ``x``."""
+        self.text(x - text_width(str(text), size), y, text, size, bold)
+
+    def line(self, x1, y1, x2, y2, width=0.5):
+        self.pages[-1].append(b"%.2f w %.2f %.2f m %.2f %.2f l S" % (width, x1, y1, x2, y2))
+
+    def to_bytes(self):
+        # Objects 1-4 are the catalog, the page tree and the two fonts; every
+        # page is followed by its content stream
+        page_ids = [5 + 2 * index for index in range(len(self.pages))]
+        objects = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                b" ".join(b"%d 0 R" % page_id for page_id in page_ids), len(page_ids)),
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+        ]
+        for page_id, operations in zip(page_ids, self.pages):
+            objects.append(
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                % (self.width, self.height, page_id + 1)
+            )
+            content = zlib.compress(b"\n".join(operations))
+            objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(content), content))
+
+        out = bytearray(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(len(out))
+            out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+        return bytes(out)
@@ -0,0 +1,226 @@
+"""Printable claim reports as PDF, one at a time or in bulk.
+
+A report repeats the header of the claim details page, followed by the part
+lines and the per-currency totals. Rendering is split in two steps so bulk
+runs can use every core: ``claim_report_data`` reads a prefetched claim into
+plain, picklable values (in the process that owns the database connection),
+and ``render_claim_report`` lays those out as PDF without touching the
+database.
+
+``write_report_zip`` reads the claims in keyset-paged chunks, hands each
+chunk to a process pool and writes the finished documents into a zip in
+claim order while later chunks are still rendering.
+"""
+
+import os
+import textwrap
+import time
+import zipfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.db.models import Prefetch
+
+from .exports import local_datetime
+from .models import ClaimSparePart
+from .pdf import PdfDocument
+
+REPORT_CHUNK_SIZE = 200
+MARGIN = 40
+LINE_HEIGHT = 14
+# x positions of the parts table columns; numbers are right-aligned at theirs
+PART_COLUMNS = (
+    ("#", 40, False), ("Stock Code", 62, False), ("Description", 140, False), ("Qty", 330, True),
+    ("Appr. Qty", 385, True), ("Unit Price", 445, True), ("Cur.", 450, False), ("Total", 510, True),
+    ("Appr. Total", 555, True),
+)
+DESCRIPTION_CHARS = 34
+
+
+def report_claims(claims):
+    """Return ``claims`` with everything a report reads joined or prefetched."""
+    lines = ClaimSparePart.objects.select_related("spare_part").order_by("id")
+    return claims.select_related("customer", "partner_service", "created_by").prefetch_related(
+        Prefetch("claim_spare_parts", queryset=lines)
+    )
+
+
+def _money(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def claim_report_data(claim):
+    """Read a claim fetched through ``report_claims`` into plain values."""
+    parts, totals = [], defaultdict(lambda: [Decimal(0), None])
+    for line in claim.claim_spare_parts.all():
+        parts.append((
+            line.stock_code, line.description or line.spare_part.description, line.quantity,
+            line.approved_quantity, line.unit_price, line.currency, line.total_price, line.approved_total_price,
+        ))
+        total = totals[line.currency]
+        total[0] += line.total_price
+        if line.approved_total_price is not None:
+            total[1] = (total[1] or 0) + line.approved_total_price
+    return {
+        "id": claim.pk,
+        "claim_type": claim.get_claim_type_display(),
+        "left": [
+            ("Claim Date", claim.claim_date), ("Last Modified", local_datetime(claim.claim_last_modified)),
+            ("Vehicle Type", claim.get_vehicle_type_display()), ("Vehicle Defect Date", claim.vehicle_defect_date),
+            ("Vehicle Registration Date", claim.vehicle_registration_date),
+            ("Vehicle Kilometer", claim.vehicle_kilometer), ("Vehicle Chassis Number", claim.vehicle_chassis_number),
+        ],
+        "right": [
+            ("Customer", str(claim.customer)), ("Partner Service", str(claim.partner_service)),
+            ("Created By", str(claim.created_by)), ("Vehicle Driver Name", claim.vehicle_driver_name),
+            ("Vehicle Driver Phone", claim.vehicle_driver_phone),
+        ],
+        "defect": [
+            ("Defect Category", claim.defect_category), ("Claim Status", claim.get_status_display()),
+        ],
+        "description": claim.defect_description,
+        "parts": parts,
+        "totals": sorted((currency, *amounts) for currency, amounts in totals.items()),
+    }
+
+
+def report_filename(data):
+    return f"claim-{data['id']}.pdf"
+
+
+class _Page:
+    """Cursor over a PdfDocument that starts a new page when the current one is full."""
+
+    def __init__(self, pdf, on_new_page=None):
+        self.pdf = pdf
+        self.y = pdf.height - MARGIN
+        self.on_new_page = on_new_page
+
+    def advance(self, lines=1):
+        self.y -= LINE_HEIGHT * lines
+        if self.y < MARGIN:
+            self.pdf.new_page()
+            self.y = self.pdf.height - MARGIN - LINE_HEIGHT
+            if self.on_new_page:
+                self.on_new_page()
+
+    def labelled(self, x, label, value):
+        self.pdf.text(x, self.y, f"{label}:", size=9, bold=True)
+        self.pdf.text(x + 120, self.y, "" if value is None else str(value), size=9)
+
+
+def render_claim_report(data):
+    """Lay out the values from ``claim_report_data`` as a PDF; returns bytes."""
+    pdf = PdfDocument()
+    right_edge = pdf.width - MARGIN
+    page = _Page(pdf)
+    pdf.text(MARGIN, page.y, f"Warranty Claim #{data['id']}", size=16, bold=True)
+    pdf.text_right(right_edge, page.y, data["claim_type"], size=10)
+    page.advance(2)
+
+    for index in range(max(len(data["left"]), len(data["right"]))):
+        if index < len(data["left"]):
+            page.labelled(MARGIN, *data["left"][index])
+        if index < len(data["right"]):
+            page.labelled(310, *data["right"][index])
+        page.advance()
+    page.advance(0.5)
+    for label, value in data["defect"]:
+        page.labelled(MARGIN, label, value)
+        page.advance()
+    pdf.text(MARGIN, page.y, "Defect Description:", size=9, bold=True)
+    page.advance()
+    for text in textwrap.wrap(data["description"], 100) or [""]:
+        pdf.text(MARGIN, page.y, text, size=9)
+        page.advance()
+
+    def table_header():
+        for label, x, numeric in PART_COLUMNS:
+            (pdf.text_right if numeric else pdf.text)(x, page.y, label, size=8, bold=True)
+        pdf.line(MARGIN, page.y - 4, right_edge, page.y - 4)
+        page.y -= 4
+
+    page.advance()
+    pdf.text(MARGIN, page.y, "Spare Parts", size=11, bold=True)
+    page.advance(1.5)
+    if not data["parts"]:
+        pdf.text(MARGIN, page.y, "No spare parts added to this claim.", size=9)
+        return pdf.to_bytes()
+    table_header()
+    page.on_new_page = table_header
+    for number, part in enumerate(data["parts"], start=1):
+        page.advance()
+        stock_code, description, quantity, approved_quantity, unit_price, currency, total, approved_total = part
+        cells = (number, stock_code, (description or "")[:DESCRIPTION_CHARS], quantity,
+                 "-" if approved_quantity is None else approved_quantity, _money(unit_price), currency,
+                 _money(total), _money(approved_total))
+        for (_, x, numeric), value in zip(PART_COLUMNS, cells):
+            (pdf.text_right if numeric else pdf.text)(x, page.y, value, size=8)
+    page.on_new_page = None
+    pdf.line(MARGIN, page.y - 4, right_edge, page.y - 4)
+    page.y -= 4
+    for currency, requested, approved in data["totals"]:
+        page.advance()
+        pdf.text_right(PART_COLUMNS[5][1], page.y, "Total", size=8, bold=True)
+        pdf.text(PART_COLUMNS[6][1], page.y, currency, size=8, bold=True)
+        pdf.text_right(PART_COLUMNS[7][1], page.y, _money(requested), size=8, bold=True)
+        pdf.text_right(PART_COLUMNS[8][1], page.y, _money(approved), size=8, bold=True)
+    return pdf.to_bytes()
+
+
+def _render_chunk(chunk):
+    return [(report_filename(data), render_claim_report(data)) for data in chunk]
+
+
+def iter_report_data(claims, chunk_size=REPORT_CHUNK_SIZE):
+    """Yield lists of ``claim_report_data`` values, reading ``claims`` by primary key in chunks."""
+    claims = report_claims(claims.order_by("pk"))
+    last = None
+    while True:
+        page = claims if last is None else claims.filter(pk__gt=last)
+        chunk = [claim_report_data(claim) for claim in page[:chunk_size]]
+        if not chunk:
+            return
+        yield chunk
+        last = chunk[-1]["id"]
+
+
+def write_report_zip(claims, fileobj, workers=None, chunk_size=REPORT_CHUNK_SIZE, progress=None):
+    """Render the reports of the ``claims`` queryset into a zip written to ``fileobj``.
+
+    ``workers`` is the size of the process pool (default: one per core);
+    ``workers=0`` renders in this process. ``progress(documents, elapsed)``
+    is called after every chunk. Returns the number of documents.
+    """
+    started = time.monotonic()
+    documents = 0
+    # PDFs are already compressed; storing them saves the zip a second pass
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED) as archive:
+        def write(rendered):
+            nonlocal documents
+            for filename, content in rendered:
+                archive.writestr(filename, content)
+            documents += len(rendered)
+            if progress:
+                progress(documents, time.monotonic() - started)
+
+        chunks = iter_report_data(claims, chunk_size)
+        if workers == 0:
+            for chunk in chunks:
+                write(_render_chunk(chunk))
+            return documents
+        workers = workers or os.cpu_count() or 1
+        # django.setup makes the models importable in spawned workers
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+            # Keep a couple of chunks per worker in flight, so the database
+            # reads overlap with rendering without queueing the whole set
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_render_chunk, chunk))
+                if len(pending) >= 2 * workers:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    return documents
@@ -0,0 +1,105 @@
+"""Derive SparePart prices in other currencies from one base currency.
+
+Conversion factors come from ExchangeRate. Prices are converted with Decimal
+arithmetic, rounded half-up to the decimal places of the price column, and
+written back one primary-key range at a time, each in its own transaction.
+A part whose converted price does not fit the column (``max_digits``) is left
+unchanged and reported instead of being written.
+
+Batches are written with ``executemany`` of one parameterized UPDATE rather
+than ``bulk_update``: the CASE/WHEN statement ``bulk_update`` builds costs
+close to a millisecond per row to compile, which is minutes for a full
+catalog, while the prepared UPDATE handles it in seconds.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation, localcontext
+
+from django.db import connection, transaction
+
+from .catalog import invalidate_catalog
+from .models import ExchangeRate, SparePart
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+class PriceOverflow(ValueError):
+    """A converted price does not fit its column."""
+
+
+def conversion_factors(base, targets):
+    """Return ``{currency: factor}`` turning a ``base`` price into each target currency.
+
+    Raises ValueError when a needed rate is missing or not positive.
+    """
+    rates = dict(ExchangeRate.objects.filter(currency__in=[base, *targets]).values_list("currency", "rate"))
+    missing = [currency for currency in [base, *targets] if currency not in rates]
+    if missing:
+        raise ValueError(f"No exchange rate for {', '.join(missing)}")
+    if any(rate <= 0 for rate in rates.values()):
+        raise ValueError("Exchange rates must be positive")
+    with localcontext() as ctx:
+        ctx.prec = 28
+        return {currency: rates[currency] / rates[base] for currency in targets}
+
+
+def convert(price, factor, field):
+    """``price * factor`` rounded half-up to the places of the DecimalField ``field``.
+
+    Raises PriceOverflow when the result has more digits than ``field`` allows.
+    """
+    try:
+        value = (price * factor).quantize(Decimal(1).scaleb(-field.decimal_places), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        value = None
+    if value is None or abs(value) >= Decimal(10) ** (field.max_digits - field.decimal_places):
+        raise PriceOverflow(f"{price} * {factor} does not fit {field.name} (max_digits={field.max_digits})")
+    return value
+
+
+def reprice_catalog(base, batch_size=DEFAULT_BATCH_SIZE, progress=None, overflow=None):
+    """Rewrite every non-base price column from the ``base`` column; return the row count.
+
+    Parts with a converted price too large for its column keep all their
+    prices; ``overflow(pk, error)`` is called for each and they are not counted.
+    """
+    targets = [currency for currency in SparePart.Currency.values if currency != base]
+    factors = conversion_factors(base, targets)
+    base_field = f"price_{base.lower()}"
+    target_fields = {currency: SparePart._meta.get_field(f"price_{currency.lower()}") for currency in targets}
+    quote = connection.ops.quote_name
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        quote(SparePart._meta.db_table),
+        ", ".join(f"{quote(field.column)} = %s" for field in target_fields.values()),
+        quote(SparePart._meta.pk.column),
+    )
+
+    repriced = 0
+    last_pk = 0
+    while True:
+        rows = list(
+            SparePart.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", base_field)[:batch_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        params = []
+        for pk, price in rows:
+            try:
+                prices = [convert(price, factors[currency], field) for currency, field in target_fields.items()]
+            except PriceOverflow as exc:
+                if overflow:
+                    overflow(pk, exc)
+                continue
+            params.append(
+                [field.get_db_prep_save(value, connection) for value, field in zip(prices, target_fields.values())]
+                + [pk]
+            )
+        if not params:
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+            invalidate_catalog()
+        repriced += len(params)
+        if progress:
+            progress(repriced)
+    return repriced
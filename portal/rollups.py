@@ -0,0 +1,137 @@
+"""Incremental maintenance of the daily claim rollups behind the dashboard.
+
+Each claim counts once towards the ClaimRollup row of its (claim date, status,
+partner service, vehicle type) key, together with its stored per-currency
+totals. Writes that can change a claim's key or totals snapshot the affected
+claims before and after, and the difference is added to the rollup rows with
+``UPDATE ... SET field = field + delta``. Part line changes reach the rollups
+through portal.totals, which passes its claim total deltas on per rollup row.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+
+from .models import ClaimRollup, WarrantyClaim
+from .totals import CURRENCIES, TOTAL_FIELDS, total_fields
+
+# Claim fields forming the rollup key, in ClaimRollup field order
+KEY_FIELDS = ("claim_date", "status", "partner_service_id", "vehicle_type")
+ROLLUP_KEY = ("day", "status", "partner_service_id", "vehicle_type")
+# Any update touching one of these may move a claim between rollup rows
+ROLLUP_SOURCE_FIELDS = frozenset({*KEY_FIELDS, "partner_service", *TOTAL_FIELDS})
+
+
+def claim_rows(claim_ids, fields=()):
+    """Return the pk, key and total fields (and ``fields``) of the given claims as they are stored."""
+    if not claim_ids:
+        return []
+    fields = [field for field in fields if field not in KEY_FIELDS]
+    return list(WarrantyClaim.objects.filter(pk__in=claim_ids).values("pk", *KEY_FIELDS, *TOTAL_FIELDS, *fields))
+
+
+def claim_keys(claim_ids):
+    """Return ``{claim_id: rollup key}`` for the given claims."""
+    return {
+        row[0]: tuple(row[1:])
+        for row in WarrantyClaim.objects.filter(pk__in=list(claim_ids)).values_list("pk", *KEY_FIELDS)
+    }
+
+
+def instance_row(claim):
+    """Return the same fields as ``claim_rows`` from a claim instance."""
+    return {field: getattr(claim, field) for field in (*KEY_FIELDS, *TOTAL_FIELDS)}
+
+
+def rows_delta(before, after):
+    """Turn claim rows before and after a write into ``{key: {field: delta}}``."""
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for rows, sign in ((before, -1), (after, 1)):
+        for row in rows:
+            fields = deltas[tuple(row[field] for field in KEY_FIELDS)]
+            fields["claim_count"] += sign
+            for field in TOTAL_FIELDS:
+                fields[field] += sign * Decimal(row[field] or 0)
+    return deltas
+
+
+def apply_rollup_delta(deltas):
+    """Add per-key deltas to the rollup rows, creating rows that do not exist yet."""
+    for key, fields in deltas.items():
+        changes = {field: F(field) + amount for field, amount in fields.items() if amount}
+        if not changes:
+            continue
+        rollups = ClaimRollup.objects.filter(**dict(zip(ROLLUP_KEY, key)))
+        if not rollups.update(**changes):
+            ClaimRollup.objects.bulk_create([ClaimRollup(**dict(zip(ROLLUP_KEY, key)))], ignore_conflicts=True)
+            rollups.update(**changes)
+
+
+def rebuild_rollups(since=None):
+    """Recompute the rollup rows (from day ``since`` on, or all) from the claims.
+
+    The rows are regrouped inside the database with one INSERT ... SELECT.
+    Returns the number of rollup rows written.
+    """
+    claims = WarrantyClaim.objects.all()
+    rollups = ClaimRollup.objects.all()
+    if since is not None:
+        claims = claims.filter(claim_date__gte=since)
+        rollups = rollups.filter(day__gte=since)
+    groups = (
+        claims.order_by()
+        .values(*KEY_FIELDS)
+        .annotate(claim_count=Count("pk"), **{f"sum_{field}": Sum(field) for field in TOTAL_FIELDS})
+    )
+    select, params = groups.query.sql_with_params()
+    quote = connection.ops.quote_name
+    columns = [ClaimRollup._meta.get_field(name).column for name in (*ROLLUP_KEY, "claim_count", *TOTAL_FIELDS)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        rollups.delete()
+        cursor.execute(
+            f"INSERT INTO {quote(ClaimRollup._meta.db_table)} ({', '.join(map(quote, columns))}) {select}",
+            params,
+        )
+        return cursor.rowcount
+
+
+def _summarize(row):
+    totals = []
+    for currency in CURRENCIES:
+        requested, approved = total_fields(currency)
+        if row[requested] or row[approved]:
+            totals.append({"currency": currency, "requested": row[requested], "approved": row[approved]})
+    return {"claims": row["claims"] or 0, "totals": totals}
+
+
+def dashboard_summary(today, days=30, partner_service=None):
+    """Aggregate the last ``days`` days of rollups for the dashboard.
+
+    Reads only ClaimRollup, so the cost depends on the window and the number
+    of keys, never on the number of claims or part lines.
+    """
+    rollups = ClaimRollup.objects.filter(day__gt=today - timedelta(days=days), day__lte=today)
+    if partner_service is not None:
+        rollups = rollups.filter(partner_service=partner_service)
+    sums = {"claims": Sum("claim_count"), **{field: Sum(field) for field in TOTAL_FIELDS}}
+
+    def grouped(field, label=None, order=()):
+        # Group on ``field``; ``order`` names columns carried along for the label and ordering
+        rows = rollups.values(*order, field).annotate(**sums).filter(claims__gt=0).order_by(*order, field)
+        return [{"label": label(row) if label else row[field], **_summarize(row)} for row in rows]
+
+    status_labels = dict(WarrantyClaim.ClaimStatus.choices)
+    vehicle_labels = dict(WarrantyClaim.VehicleTypes.choices)
+    return {
+        "overall": _summarize(rollups.aggregate(**sums)),
+        "by_status": grouped("status", lambda row: status_labels.get(row["status"], row["status"])),
+        "by_vehicle_type": grouped("vehicle_type", lambda row: vehicle_labels.get(row["vehicle_type"], row["vehicle_type"])),
+        # Grouped by id, so services sharing a name stay apart
+        "by_partner_service": [] if partner_service is not None else grouped(
+            "partner_service_id", lambda row: row["partner_service__name"], order=("partner_service__name",),
+        ),
+        "by_day": grouped("day"),
+    }
@@ -0,0 +1,153 @@
+"""Full-text search over claim defect categories and descriptions.
+
+SQLite keeps an external-content FTS5 table filled by triggers on the claims
+table; PostgreSQL uses a GIN index on a ``tsvector`` expression, which the
+database keeps current by itself. Both stay in sync for every write path,
+bulk updates included. Other backends fall back to ``icontains``.
+"""
+
+import re
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.models import Q
+
+from .models import WarrantyClaim
+
+CLAIM_TABLE = WarrantyClaim._meta.db_table
+FTS_TABLE = f"{CLAIM_TABLE}_fts"
+PG_SEARCH_INDEX = f"{CLAIM_TABLE}_search_idx"
+PG_DOCUMENT = "to_tsvector('simple', defect_category || ' ' || defect_description)"
+SEARCH_PAGE_SIZE = 25
+
+_SQLITE_TRIGGERS = {
+    f"{FTS_TABLE}_ai": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {CLAIM_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, defect_category, defect_description)
+            VALUES (new.id, new.defect_category, new.defect_description);
+        END""",
+    f"{FTS_TABLE}_ad": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {CLAIM_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, defect_category, defect_description)
+            VALUES ('delete', old.id, old.defect_category, old.defect_description);
+        END""",
+    f"{FTS_TABLE}_au": f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF defect_category, defect_description ON {CLAIM_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, defect_category, defect_description)
+            VALUES ('delete', old.id, old.defect_category, old.defect_description);
+            INSERT INTO {FTS_TABLE}(rowid, defect_category, defect_description)
+            VALUES (new.id, new.defect_category, new.defect_description);
+        END""",
+}
+
+
+def install_search_index(connection):
+    """Create the text index and its sync triggers if they are missing.
+
+    Safe to run repeatedly. On SQLite, rebuilding a table during a migration
+    drops its triggers, so this also runs after every ``migrate`` and refills
+    the index whenever triggers had to be recreated.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"defect_category, defect_description, content='{CLAIM_TABLE}', content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [CLAIM_TABLE]
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in _SQLITE_TRIGGERS if name not in existing]
+            for name in missing:
+                cursor.execute(_SQLITE_TRIGGERS[name])
+            if missing:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} ON {CLAIM_TABLE} USING GIN ({PG_DOCUMENT})"
+            )
+
+
+def uninstall_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for name in _SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == "postgresql":
+            cursor.execute(f"DROP INDEX IF EXISTS {PG_SEARCH_INDEX}")
+
+
+@contextmanager
+def search_index_suspended(connection):
+    """Drop the SQLite sync triggers for a bulk load and rebuild the index after it.
+
+    Refilling the index once is much cheaper than one trigger run per row.
+    Other backends maintain their index themselves, so nothing changes there.
+    """
+    if connection.vendor != "sqlite":
+        yield
+        return
+    with connection.cursor() as cursor:
+        for name in _SQLITE_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+    try:
+        yield
+    finally:
+        install_search_index(connection)
+
+
+def _fts5_query(text):
+    """Quote every word as an FTS5 prefix term, so user input is never parsed as syntax."""
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_claims(claims, text):
+    """Filter the ``claims`` queryset to matches of ``text``, best matches first.
+
+    The result is a lazy queryset; slice it to page through the results.
+    """
+    vendor = connections[claims.db].vendor
+    if vendor == "sqlite":
+        match = _fts5_query(text)
+        if not match:
+            return claims.none()
+        return claims.extra(
+            tables=[FTS_TABLE],
+            where=[f"{FTS_TABLE}.rowid = {CLAIM_TABLE}.id", f"{FTS_TABLE} MATCH %s"],
+            params=[match],
+            select={"search_rank": f"{FTS_TABLE}.rank"},
+            order_by=["search_rank", "-id"],
+        )
+    if vendor == "postgresql":
+        return claims.extra(
+            where=[f"{PG_DOCUMENT} @@ websearch_to_tsquery('simple', %s)"],
+            params=[text],
+            select={"search_rank": f"ts_rank({PG_DOCUMENT}, websearch_to_tsquery('simple', %s))"},
+            select_params=[text],
+            order_by=["-search_rank", "-id"],
+        )
+    words = text.split()
+    if not words:
+        return claims.none()
+    for word in words:
+        claims = claims.filter(Q(defect_category__icontains=word) | Q(defect_description__icontains=word))
+    return claims.order_by("-claim_date", "-id")
+
+
+def search_page(claims, text, page=1, page_size=SEARCH_PAGE_SIZE):
+    """Return ``(claims, has_next)`` for one page of ranked search results."""
+    start = (page - 1) * page_size
+    results = list(search_claims(claims, text)[start:start + page_size + 1])
+    return results[:page_size], len(results) > page_size
+
+
+async def asearch_page(claims, text, page=1, page_size=SEARCH_PAGE_SIZE):
+    """Async version of ``search_page``."""
+    start = (page - 1) * page_size
+    results = [claim async for claim in search_claims(claims, text)[start:start + page_size + 1]]
+    return results[:page_size], len(results) > page_size
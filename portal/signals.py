@@ -0,0 +1,89 @@
+"""Signal handlers keeping derived portal data in sync with model writes."""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .catalog import invalidate_catalog
+from .events import CLAIM_AUDIT_FIELDS, LINE_AUDIT_FIELDS, claim_event, instance_values, line_event, record
+from .models import ClaimEvent, ClaimSparePart, PartnerService, SparePart, WarrantyClaim
+from .rollups import apply_rollup_delta, claim_rows, instance_row, rows_delta
+from .totals import apply_totals_delta, line_amounts, lines_delta, merge_deltas
+
+
+@receiver([post_save, post_delete], sender=SparePart)
+def sparepart_changed(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(pre_save, sender=ClaimSparePart)
+def remember_line_totals(sender, instance, raw=False, **kwargs):
+    instance._totals_before = None
+    if instance.pk and not raw:
+        instance._totals_before = sender.objects.filter(pk=instance.pk).values(*LINE_AUDIT_FIELDS).first()
+
+
+@receiver(post_save, sender=ClaimSparePart)
+def line_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = lines_delta([instance])
+    before = getattr(instance, "_totals_before", None)
+    if before:
+        removed = line_amounts(before["currency"], before["total_price"], before["approved_total_price"])
+        deltas = merge_deltas(deltas, {before["claim_id"]: {field: -amount for field, amount in removed.items()}})
+    apply_totals_delta(deltas)
+    after = instance_values(instance, LINE_AUDIT_FIELDS)
+    if created or before is None:
+        record([line_event(ClaimEvent.Actions.Created, instance.claim_id, instance.pk, after=after)])
+    else:
+        event = line_event(ClaimEvent.Actions.Updated, instance.claim_id, instance.pk, before, after)
+        if event.changes:
+            record([event])
+
+
+@receiver(post_delete, sender=ClaimSparePart)
+def line_deleted(sender, instance, origin=None, **kwargs):
+    # Lines cascading from a deleted claim have no totals left to maintain
+    if isinstance(origin, WarrantyClaim) or getattr(origin, "model", None) is WarrantyClaim:
+        return
+    apply_totals_delta(lines_delta([instance], sign=-1))
+    record([line_event(ClaimEvent.Actions.Deleted, instance.claim_id, instance.pk,
+                       before=instance_values(instance, LINE_AUDIT_FIELDS))])
+
+
+@receiver(pre_save, sender=WarrantyClaim)
+def remember_claim_rollup(sender, instance, raw=False, **kwargs):
+    # The same snapshot serves the rollups and the event diff
+    instance._rollup_before = claim_rows([instance.pk], CLAIM_AUDIT_FIELDS) if instance.pk and not raw else []
+
+
+@receiver(post_save, sender=WarrantyClaim)
+def claim_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, "_rollup_before", [])
+    apply_rollup_delta(rows_delta(before, [instance_row(instance)]))
+    after = instance_values(instance, CLAIM_AUDIT_FIELDS)
+    if created or not before:
+        record([claim_event(ClaimEvent.Actions.Created, instance.pk, after=after)])
+    else:
+        event = claim_event(ClaimEvent.Actions.Updated, instance.pk, before[0], after)
+        if event.changes:
+            record([event])
+
+
+@receiver(pre_delete, sender=WarrantyClaim)
+def remember_deleted_claim_rollup(sender, instance, **kwargs):
+    # The instance may be stale; count out what is actually stored
+    instance._rollup_before = claim_rows([instance.pk], CLAIM_AUDIT_FIELDS)
+
+
+@receiver(post_delete, sender=WarrantyClaim)
+def claim_deleted(sender, instance, origin=None, **kwargs):
+    before = getattr(instance, "_rollup_before", [])
+    record([claim_event(ClaimEvent.Actions.Deleted, instance.pk, before=before[0] if before else None)])
+    # Rollups of a deleted partner service are deleted along with it
+    if isinstance(origin, PartnerService) or getattr(origin, "model", None) is PartnerService:
+        return
+    apply_rollup_delta(rows_delta(before, []))
+
@@ -0,0 +1,329 @@
+"""Deterministic synthetic data at production scale.
+
+``generate_dataset`` adds partner services (with one partner user each),
+customers, catalog parts, claims and claim part lines. The same seed and
+counts give the same rows. Dates are relative to the day the data is
+generated.
+
+Distributions:
+- Partner services get customers and claims with Zipf weights ``1 / rank**skew``,
+  so ``skew=0`` is uniform and larger values concentrate the load on a few services.
+- Parts are picked for claim lines with the same skew.
+- Claim dates lean towards the present (claim volume grows over ``days``).
+- Older claims are more likely to be closed.
+
+Rows are written with ``bulk_create(batch_size=...)``, ``batch_size`` rows per
+transaction, through the base managers. Every index and constraint stays in
+place, so a load that stops halfway leaves a consistent (if smaller) dataset.
+``claim_date`` and ``claim_last_modified`` are ``auto_now`` fields, which
+``bulk_create`` would overwrite with the current time; their ``auto_now``
+flags are switched off for the load so the generated dates are kept.
+
+The base managers skip the model maintenance hooks. To make up for it:
+- claim totals are computed while the lines are generated;
+- the rollups are rebuilt afterwards;
+- the SQLite search index is refilled once at the end.
+"""
+
+import gc
+import random
+import time
+from bisect import bisect
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+from itertools import accumulate, islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from users.models import PartnerFields, User
+from .catalog import invalidate_catalog
+from .models import ClaimSparePart, Customer, PartnerService, SparePart, WarrantyClaim
+from .rollups import rebuild_rollups
+from .search import search_index_suspended
+from .totals import CURRENCIES, TOTAL_FIELDS, total_fields
+
+DEFAULT_BATCH_SIZE = 10000
+# Claims were last modified within this many seconds after their claim date
+MODIFIED_SPREAD = 30 * 24 * 3600
+
+CITIES = ["Istanbul", "Ankara", "Izmir", "Adana", "Bursa", "Konya", "Hamburg", "Lyon", "Milan", "Warsaw"]
+DEFECT_CATEGORIES = ["axle", "brakes", "suspension", "lighting", "chassis", "tyres", "landing gear",
+                     "coupling", "bodywork", "electrics", "refrigeration unit", "hydraulics"]
+DEFECT_SYMPTOMS = ["noise when braking", "crack near the weld", "oil leak", "excessive wear", "loose bolts",
+                   "corrosion", "vibration at speed", "intermittent failure", "bent bracket", "air leak",
+                   "water ingress", "misalignment", "overheating", "seized bearing", "broken seal"]
+PART_NAMES = ["brake pad", "brake disc", "air bag", "shock absorber", "axle hub", "wheel bearing",
+              "tail lamp", "marker lamp", "kingpin", "landing leg", "tarpaulin", "door hinge", "valve", "sensor"]
+VEHICLE_TYPE_WEIGHTS = {"CS": 30, "PF": 12, "CC": 10, "SB": 5, "RF": 15, "BX": 8, "SI": 4, "TK": 5,
+                        "LB": 3, "TP": 6, "OT": 2}
+# Status weights for (recent, older) claims
+STATUS_WEIGHTS = {
+    "NW": (45, 2), "RV": (10, 1), "NR": (15, 2), "AC": (15, 25), "RJ": (5, 15), "CP": (10, 55),
+}
+APPROVED_STATUSES = {"AC", "CP"}
+
+
+class _Picker:
+    """Draw from weighted choices with one ``random()`` call and a bisection."""
+
+    def __init__(self, rng, values, weights):
+        self.rng = rng
+        self.values = list(values)
+        self.cumulative = list(accumulate(weights))
+        self.total = self.cumulative[-1]
+
+    def __call__(self):
+        return self.values[bisect(self.cumulative, self.rng.random() * self.total)]
+
+
+def _weight_table(weights):
+    """Expand integer ``{value: weight}`` into a list to draw from by ``int(random() * len(table))``.
+
+    That draws the same value as a _Picker given the same ``random()``, without
+    a bisection or a method call.
+    """
+    return [value for value, weight in weights.items() for _ in range(weight)]
+
+
+def zipf_weights(count, skew):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+class _Money(dict):
+    """Integer cents to the Decimal a DecimalField holds, memoized."""
+
+    def __missing__(self, cents):
+        value = self[cents] = Decimal(cents).scaleb(-2)
+        return value
+
+
+def _next_id(model):
+    return (model._base_manager.aggregate(top=Max("pk"))["top"] or 0) + 1
+
+
+@contextmanager
+def _explicit_dates(model):
+    """Keep the dates set on ``model`` instances instead of letting ``auto_now`` replace them."""
+    fields = [field for field in model._meta.concrete_fields if getattr(field, "auto_now", False)
+              or getattr(field, "auto_now_add", False)]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def _gc_paused():
+    """Pause the cyclic garbage collector while millions of instances are built.
+
+    The instances hold no reference cycles, so the collections their
+    allocations keep triggering only cost time.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _write_batches(model, objs, batch_size, report):
+    """``bulk_create`` the instances ``objs`` yields, ``batch_size`` per transaction."""
+    objs = iter(objs)
+    while True:
+        batch = list(islice(objs, batch_size))
+        if not batch:
+            break
+        with transaction.atomic():
+            model._base_manager.bulk_create(batch, batch_size=batch_size)
+        report(model, len(batch))
+
+
+def generate_dataset(seed=0, services=20, customers=50000, parts=20000, claims=1000000, lines_per_claim=2.5,
+                     days=730, skew=1.0, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    """Add a synthetic dataset on top of whatever the database holds.
+
+    ``progress(model, rows_written_so_far, elapsed_seconds)`` is called after
+    every batch. Returns ``{model name: rows written}``.
+    """
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    started = time.monotonic()
+    written = {}
+
+    def report(model, rows):
+        name = model.__name__
+        written[name] = written.get(name, 0) + rows
+        if progress:
+            progress(name, written[name], time.monotonic() - started)
+
+    # Partner services and their users are few; the ORM is fine for them
+    service_ids = []
+    partner_ids = []
+    for _ in range(services):
+        service = PartnerService.objects.create(
+            name=f"Partner Service {rng.randrange(10 ** 6):06}", email="service@example.com",
+            phone_number=f"+90{rng.randrange(10 ** 9):09}", address=rng.choice(CITIES),
+        )
+        user = User(username=f"synthetic-partner-{service.pk}")
+        user.set_unusable_password()
+        user.save()
+        PartnerFields.objects.create(user=user, partner_service=service)
+        service_ids.append(service.pk)
+        partner_ids.append(user.pk)
+    report(PartnerService, services)
+    service_picker = _Picker(rng, range(services), zipf_weights(services, skew))
+
+    first_customer = _next_id(Customer)
+    customer_service = []
+
+    def customer_rows():
+        for offset in range(customers):
+            pk = first_customer + offset
+            service = service_picker()
+            customer_service.append(service)
+            yield Customer(
+                pk=pk, first_name=f"First{pk}", last_name=f"Last{pk}",
+                company=f"Company {rng.randrange(customers // 3 + 1)}", email=f"customer{pk}@example.com",
+                phone_number=f"+90{rng.randrange(10 ** 9):09}", city=rng.choice(CITIES), country="Türkiye",
+                address="-", partner_service_id=service_ids[service],
+            )
+
+    _write_batches(Customer, customer_rows(), batch_size, report)
+    customers_by_service = [[] for _ in range(services)]
+    for offset, service in enumerate(customer_service):
+        customers_by_service[service].append(first_customer + offset)
+
+    first_part = _next_id(SparePart)
+    catalog = []
+
+    def part_rows():
+        for offset in range(parts):
+            pk = first_part + offset
+            eur = Decimal(rng.randrange(100, 200000)) / 100
+            prices = {
+                "USD": (eur * Decimal("1.08")).quantize(Decimal("0.01")),
+                "EUR": eur,
+                "GBP": (eur * Decimal("0.85")).quantize(Decimal("0.01")),
+                "TRY": (eur * 35).quantize(Decimal("0.01")),
+            }
+            stock_code = f"S{pk:08}"
+            description = f"{rng.choice(PART_NAMES)} {rng.randrange(1000):03}"
+            catalog.append((stock_code, description,
+                            {code: (price, int(price * 100)) for code, price in prices.items()}))
+            yield SparePart(pk=pk, stock_code=stock_code, description=description, price_usd=prices["USD"],
+                            price_eur=prices["EUR"], price_gbp=prices["GBP"], price_try=prices["TRY"])
+
+    _write_batches(SparePart, part_rows(), batch_size, report)
+    part_picker = _Picker(rng, range(parts), zipf_weights(parts, skew)) if parts else None
+
+    vehicle_types = _weight_table(VEHICLE_TYPE_WEIGHTS)
+    recent_statuses = _weight_table({status: weights[0] for status, weights in STATUS_WEIGHTS.items()})
+    older_statuses = _weight_table({status: weights[1] for status, weights in STATUS_WEIGHTS.items()})
+    currencies = _weight_table(dict(zip(CURRENCIES, [20, 60, 10, 10])))
+    vehicle_type_count, currency_count = len(vehicle_types), len(currencies)
+    # Services and parts are drawn inline; the pickers' values are positions
+    service_cumulative, service_total = service_picker.cumulative, service_picker.total
+    if part_picker:
+        part_cumulative, part_total = part_picker.cumulative, part_picker.total
+    # random() with int() is several times faster than randrange() and choice(),
+    # which matters at millions of rows
+    random_ = rng.random
+    line_slots = int(lines_per_claim * 2) + 1 if part_picker else 0
+    total_index = {currency: [TOTAL_FIELDS.index(field) for field in total_fields(currency)]
+                   for currency in CURRENCIES}
+    # Claim dates go back ``days``, registration dates up to ten years before that
+    dates = [today - timedelta(days=offset) for offset in range(days + 3651)]
+    now = timezone.now()
+    midnights = [datetime.combine(day, dt_time(), tzinfo=now.tzinfo) for day in dates]
+    descriptions = [f"{first} and {second}" for first in DEFECT_SYMPTOMS for second in DEFECT_SYMPTOMS
+                    if first != second]
+    money = _Money()
+    first_claim = _next_id(WarrantyClaim)
+    lines = []
+
+    def claim_rows():
+        for offset in range(claims):
+            pk = first_claim + offset
+            service = bisect(service_cumulative, random_() * service_total)
+            service_customers = customers_by_service[service]
+            if not service_customers:
+                continue
+            # Triangular with the mode at today: more claims in recent days
+            age = int(days * (1 - (1 - random_()) ** 0.5))
+            statuses = recent_statuses if age < 30 else older_statuses
+            status = statuses[int(random_() * len(statuses))]
+            approved = status in APPROVED_STATUSES
+            totals = [0] * len(TOTAL_FIELDS)
+            used = []
+            for _ in range(int(random_() * line_slots)):
+                part = bisect(part_cumulative, random_() * part_total)
+                # A claim has a handful of lines; a list beats a set here
+                if part in used:
+                    continue
+                used.append(part)
+                stock_code, description, prices = catalog[part]
+                line_currency = currencies[int(random_() * currency_count)]
+                quantity = 1 + int(random_() * 4)
+                unit_price, unit_cents = prices[line_currency]
+                total = unit_cents * quantity
+                requested_index, approved_index = total_index[line_currency]
+                totals[requested_index] += total
+                approved_quantity = approved_total = None
+                if approved:
+                    approved_quantity = 1 + int(random_() * quantity)
+                    approved_total = unit_cents * approved_quantity
+                    totals[approved_index] += approved_total
+                    approved_total = money[approved_total]
+                lines.append(ClaimSparePart(
+                    claim_id=pk, spare_part_id=stock_code, stock_code=stock_code, description=description,
+                    currency=line_currency, unit_price=unit_price, quantity=quantity,
+                    approved_quantity=approved_quantity, total_price=money[total],
+                    approved_total_price=approved_total,
+                ))
+            modified = midnights[age] + timedelta(seconds=int(random_() * MODIFIED_SPREAD))
+            claim = WarrantyClaim(
+                pk=pk, claim_date=dates[age], claim_last_modified=min(now, modified), claim_type="RP",
+                customer_id=service_customers[int(random_() * len(service_customers))],
+                vehicle_driver_name="Driver", vehicle_driver_phone=f"+90{int(random_() * 10 ** 9):09}",
+                vehicle_type=vehicle_types[int(random_() * vehicle_type_count)],
+                vehicle_defect_date=dates[age + int(random_() * 10)],
+                vehicle_chassis_number=100000 + int(random_() * 900000),
+                vehicle_registration_date=dates[age + 365 + int(random_() * 3285)],
+                vehicle_kilometer=1000 + int(random_() * 899000),
+                defect_category=DEFECT_CATEGORIES[int(random_() * len(DEFECT_CATEGORIES))],
+                defect_description=descriptions[int(random_() * len(descriptions))],
+                status=status, partner_service_id=service_ids[service], created_by_id=partner_ids[service],
+            )
+            for field, cents in zip(TOTAL_FIELDS, totals):
+                setattr(claim, field, money[cents])
+            yield claim
+
+    def flush_lines(model, rows):
+        # Lines are written right after their claims, in the same batch rhythm
+        report(model, rows)
+        if model is WarrantyClaim and lines:
+            with transaction.atomic():
+                ClaimSparePart._base_manager.bulk_create(lines, batch_size=batch_size)
+            report(ClaimSparePart, len(lines))
+            lines.clear()
+
+    with search_index_suspended(connection), _explicit_dates(WarrantyClaim), _gc_paused():
+        _write_batches(WarrantyClaim, claim_rows(), batch_size, flush_lines)
+    rebuild_rollups()
+
+    # Explicit ids leave sequences behind on backends that have them
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [Customer, SparePart, WarrantyClaim]):
+            cursor.execute(sql)
+    invalidate_catalog()
+    return written
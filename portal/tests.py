@@ -1,3 +1,1631 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import re
+import struct
+import tempfile
+import zipfile
+import zlib
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import PartnerFields, User
+from .attachments import UploadError, blob_path, part_path, receive_chunk, start_upload, thumbnail_path
+from .benchmarks import find_regressions, run_benchmarks, seed_dataset
+from .cards import render_claim_cards
+from .events import ClaimEventMiddleware, acting_as
+from .exports import export_header
+from .importers import import_spareparts, iter_csv_rows, iter_rows
+from .jobs import (
+    _handlers, backoff, claim_batch, enqueue, job_handler, reclaim_stale, run_batch, run_pending,
+)
+from .middleware import QueryBudgetExceeded, QueryInstrumentationMiddleware, query_budget
+from .models import (
+    AttachmentBlob, AttachmentUpload, CatalogVersion, ClaimAttachment, ClaimEvent, ClaimRollup, ClaimSparePart,
+    ClaimStatusHistory, Customer, ExchangeRate, Job, PartnerService, SparePart, WarrantyClaim,
+)
+from .pagination import CLAIMS_PAGE_SIZE
+from .reports import write_report_zip
+from .rollups import dashboard_summary, rebuild_rollups
+from .search import search_claims
+from .synthetic import generate_dataset
+from .thumbnails import png_thumbnail
+from .totals import TOTAL_FIELDS, find_total_mismatches
+from .workflow import approve_claims, approve_quantities, transition_claims
+from .xlsx import iter_xlsx_bytes, iter_xlsx_rows
+
+CLAIM_TABLE = WarrantyClaim._meta.db_table
+
+
+def full_scans(sql, table, params=()):
+    """Return the plan lines of ``sql`` that read every row of ``table``."""
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            lines = [row[-1] for row in cursor.fetchall()]
+            # "SCAN t USING INDEX i" walks an index in order; a bare "SCAN t" reads the table
+            return [line for line in lines if line.split()[:2] == ["SCAN", table] and "INDEX" not in line]
+        if connection.vendor == "postgresql":
+            # Tiny test tables make a seq scan cheapest; only a missing index should force one
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute(f"EXPLAIN {sql}", params)
+            return [row[0] for row in cursor.fetchall() if f"Seq Scan on {table}" in row[0]]
+    return []
+
+
+class ClaimFixtureMixin:
+    """One claim of a partner service, with a partner user and an SSH admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        service = PartnerService.objects.create(name="Service", email="s@example.com", phone_number="1", address="-")
+        customer = Customer.objects.create(
+            first_name="Ada", last_name="Lovelace", company="acme", email="ada@example.com",
+            phone_number="1", city="-", country="-", address="-", partner_service=service,
+        )
+        cls.partner = User.objects.create_user("partner", password="x")
+        PartnerFields.objects.create(user=cls.partner, partner_service=service)
+        cls.ssh_admin = User.objects.create_superuser("ssh", password="x")
+        User.objects.filter(pk=cls.ssh_admin.pk).update(role=User.Types.SSH_ADMIN)
+        cls.claim = WarrantyClaim.objects.create(
+            customer=customer, vehicle_driver_name="-", vehicle_driver_phone="-", vehicle_chassis_number=4711,
+            vehicle_kilometer=1, defect_category="-", defect_description="-",
+            partner_service=service, created_by=cls.partner,
+        )
+
+
+class QueryPlanTests(ClaimFixtureMixin, TestCase):
+    """Fail when a claim access path stops using an index and falls back to a table scan."""
+
+    def assertIndexedClaimQueries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        checked = 0
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if sql.startswith("SELECT") and CLAIM_TABLE in sql:
+                checked += 1
+                self.assertEqual(full_scans(sql, CLAIM_TABLE), [], sql)
+        self.assertGreater(checked, 0, f"{url} ran no claim queries")
+
+    def test_partner_listing(self):
+        self.assertIndexedClaimQueries(self.partner, reverse("portal:claims"))
+        self.assertIndexedClaimQueries(self.partner, reverse("portal:claims") + "?status=NW")
+
+    def test_ssh_listing(self):
+        url = reverse("portal:claims")
+        cursor = f"{self.claim.claim_date.isoformat()}.{self.claim.pk + 1}"
+        for query in ("", "?status=NW", "?vehicle_type=OT", f"?partner_service={self.claim.partner_service_id}",
+                      f"?after={cursor}", "?q=noise"):
+            self.assertIndexedClaimQueries(self.ssh_admin, url + query)
+
+    def test_claim_details(self):
+        self.assertIndexedClaimQueries(self.ssh_admin, reverse("portal:claim_details", args=[self.claim.pk]))
+
+    def test_admin_changelist(self):
+        url = reverse("admin:portal_warrantyclaim_changelist")
+        for query in ("", "?status__exact=NW", "?q=4711"):
+            self.assertIndexedClaimQueries(self.ssh_admin, url + query)
+
+    def test_partner_claims(self):
+        claims = WarrantyClaim.objects.for_user(self.partner).order_by("-claim_date", "-id")[:25]
+        sql, params = claims.query.sql_with_params()
+        self.assertEqual(full_scans(sql, CLAIM_TABLE, params), [])
+
+
+class ClaimListingTests(ClaimFixtureMixin, TestCase):
+    """The claims list pages by keyset without gaps or repeats, in a fixed number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for _ in range(CLAIMS_PAGE_SIZE * 2 + 5):
+            claim = WarrantyClaim.objects.get(pk=cls.claim.pk)
+            claim.pk = None
+            claim.save()
+        # Three days, many claims sharing each, so pages break inside a day
+        today = timezone.localdate()
+        for pk in WarrantyClaim.objects.values_list("pk", flat=True):
+            WarrantyClaim._base_manager.filter(pk=pk).update(claim_date=today - timedelta(days=pk % 3))
+
+    def setUp(self):
+        self.client.force_login(self.partner)
+
+    def page(self, query=""):
+        response = self.client.get(reverse("portal:claims") + query)
+        self.assertEqual(response.status_code, 200)
+        return [claim.pk for claim in response.context["claims"]], response.context["next_query"]
+
+    def test_pages_cover_every_claim_once(self):
+        expected = list(WarrantyClaim.objects.order_by("-claim_date", "-id").values_list("pk", flat=True))
+        seen, query, pages = [], "", 0
+        while query is not None:
+            ids, next_query = self.page(f"?{query}" if query else "")
+            seen += ids
+            pages += 1
+            query = next_query
+        self.assertEqual(seen, expected)
+        self.assertEqual(pages, 3)
+
+    def test_query_count_does_not_grow_with_depth(self):
+        _, next_query = self.page()
+        _, last_query = self.page(f"?{next_query}")
+        counts = []
+        for query in ("", f"?{next_query}", f"?{last_query}"):
+            with CaptureQueriesContext(connection) as queries:
+                self.page(query)
+            counts.append(len(queries))
+        # Session, user, partner fields, one joined page query
+        self.assertEqual(counts, [4, 4, 4])
+
+    def test_tampered_cursor_shows_the_first_page(self):
+        first, _ = self.page()
+        for cursor in ("garbage", "2024-13-01.5", "2024-01-01.x", ".", "2024-01-01.5.6", ""):
+            self.assertEqual(self.page(f"?after={cursor}")[0], first, cursor)
+
+    def test_cursor_stays_in_scope_and_filters(self):
+        other = User.objects.create_user("other", password="x")
+        self.client.force_login(other)
+        _, next_query = self.page()
+        self.assertIsNone(next_query)
+        cursor = f"{timezone.localdate().isoformat()}.{self.claim.pk + 100}"
+        self.assertEqual(self.page(f"?after={cursor}")[0], [])
+        self.client.force_login(self.partner)
+        WarrantyClaim.objects.filter(pk=self.claim.pk).update(status=WarrantyClaim.ClaimStatus.Rejected)
+        self.assertEqual(self.page("?status=RJ")[0], [self.claim.pk])
+
+    def test_empty_results_explain_why(self):
+        response = self.client.get(reverse("portal:claims"), {"q": "zyxwv"})
+        self.assertContains(response, "No claims match \"zyxwv\".")
+        self.assertNotContains(response, "any warranty claims yet")
+        response = self.client.get(reverse("portal:claims"), {"status": "CP"})
+        self.assertContains(response, "No claims match these filters")
+        self.client.force_login(User.objects.create_user("other", password="x"))
+        self.assertContains(self.client.get(reverse("portal:claims")), "any warranty claims yet")
+
+
+class CreateClaimTests(ClaimFixtureMixin, TestCase):
+    """New claims are saved with their part lines priced from the catalog, or not at all."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        SparePart.objects.create(stock_code="BR-1", description="brake pad", price_eur="12.50", price_usd=14)
+        SparePart.objects.create(stock_code="AX-1", description="axle", price_eur=100)
+
+    def setUp(self):
+        self.client.force_login(self.partner)
+
+    def post(self, parts):
+        return self.client.post(reverse("portal:create_claim"), {
+            "claim_type": "RP", "customer": self.claim.customer_id, "vehicle_driver_name": "Driver",
+            "vehicle_driver_phone": "1", "vehicle_type": "OT", "vehicle_defect_date": "2025-01-02",
+            "vehicle_chassis_number": "815", "vehicle_registration_date": "2020-01-01", "vehicle_kilometer": "10",
+            "defect_category": "brakes", "defect_description": "noise",
+            "parts": parts if isinstance(parts, str) else json.dumps(parts),
+        })
+
+    def assertRejected(self, parts, message):
+        claims = WarrantyClaim.objects.count()
+        response = self.post(parts)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(message, " ".join(response.context["WarrantForm"].errors.get("parts", [])))
+        self.assertEqual(WarrantyClaim.objects.count(), claims)
+
+    def test_parts_are_saved_with_catalog_prices(self):
+        response = self.post({
+            # Client-side prices are ignored
+            "BR-1": {"stock_code": "BR-1", "quantity": 2, "currency": "EUR", "unit_price": "0.01"},
+            "AX-1": {"stock_code": "AX-1", "quantity": "1", "currency": "USD"},
+        })
+        claim = WarrantyClaim.objects.get(vehicle_chassis_number=815)
+        self.assertRedirects(response, reverse("portal:claim_details", args=[claim.pk]))
+        lines = {line.stock_code: line for line in claim.claim_spare_parts.all()}
+        self.assertEqual(
+            (lines["BR-1"].unit_price, lines["BR-1"].total_price, lines["BR-1"].description),
+            (Decimal("12.50"), Decimal("25.00"), "brake pad"),
+        )
+        self.assertEqual((lines["AX-1"].currency, lines["AX-1"].unit_price), ("USD", 0))
+        claim.refresh_from_db()
+        self.assertEqual(claim.requested_total_eur, Decimal("25.00"))
+        self.assertTrue(Job.objects.filter(kind="claim_created_email", payload={"claim_id": claim.pk}).exists())
+
+    def test_claim_without_parts(self):
+        self.post("")
+        self.assertFalse(WarrantyClaim.objects.get(vehicle_chassis_number=815).claim_spare_parts.exists())
+
+    def test_invalid_parts_save_nothing(self):
+        self.assertRejected({"XX-9": {"stock_code": "XX-9", "quantity": 1, "currency": "EUR"}},
+                            "Unknown stock codes: XX-9")
+        self.assertRejected("{not json", "Enter a valid JSON")
+        self.assertRejected("[1, 2]", "Invalid spare parts payload")
+        for quantity in (1.7, "1.7", 0, -1, True, None):
+            self.assertRejected([{"stock_code": "BR-1", "quantity": quantity, "currency": "EUR"}],
+                                "Invalid spare part line")
+        self.assertRejected([{"stock_code": "BR-1", "quantity": 1, "currency": "JPY"}], "Invalid spare part line")
+        self.assertRejected([{"stock_code": "BR-1", "quantity": 1, "currency": "EUR"}] * 2, "listed twice")
+
+
+class ClaimDetailsTests(ClaimFixtureMixin, TestCase):
+    """Claim details load in a fixed number of queries however many part lines the claim has."""
+
+    def add_lines(self, count):
+        start = SparePart.objects.count()
+        parts = SparePart.objects.bulk_create([
+            SparePart(stock_code=f"P-{start + i}", description="part", price_eur=2) for i in range(count)
+        ])
+        ClaimSparePart.objects.bulk_create([
+            ClaimSparePart(claim=self.claim, spare_part=part, stock_code=part.stock_code, currency="EUR",
+                           unit_price=2, quantity=3, total_price=6)
+            for part in parts
+        ])
+
+    def test_query_count(self):
+        self.client.force_login(self.partner)
+        url = reverse("portal:claim_details", args=[self.claim.pk])
+        for lines in (1, 20):
+            self.add_lines(lines)
+            # Session, user, partner scope, claim with its related rows, part lines
+            # with their parts, attachments, per-currency totals
+            with self.assertNumQueries(7):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context["parts"]), SparePart.objects.count())
+        self.assertEqual(list(response.context["totals"]),
+                         [{"currency": "EUR", "requested": Decimal("126.00"), "approved": None}])
+
+
+class ClaimScopeTests(ClaimFixtureMixin, TestCase):
+    """Every claim view shows a user exactly the claims of their scope."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        other = PartnerService.objects.create(name="Other", email="o@example.com", phone_number="2", address="-")
+        cls.partner_admin = User.objects.create_user("partner-admin", password="x")
+        User.objects.filter(pk=cls.partner_admin.pk).update(role=User.Types.PARTNER_ADMIN)
+        PartnerFields.objects.create(user=cls.partner_admin, partner_service=other)
+        cls.unassigned = User.objects.create_user("unassigned", password="x")
+
+    def test_for_user(self):
+        # The fixtures set roles with update(); reload to see them
+        self.ssh_admin.refresh_from_db()
+        self.partner_admin.refresh_from_db()
+        self.assertEqual(list(WarrantyClaim.objects.for_user(self.partner)), [self.claim])
+        self.assertEqual(list(WarrantyClaim.objects.for_user(self.ssh_admin)), [self.claim])
+        self.assertEqual(list(WarrantyClaim.objects.for_user(self.partner_admin)), [])
+        self.assertEqual(list(WarrantyClaim.objects.for_user(self.unassigned)), [])
+
+    def test_views(self):
+        self.client.force_login(self.partner_admin)
+        response = self.client.get(reverse("portal:claims"))
+        self.assertEqual(list(response.context["claims"]), [])
+        for name in ("claim_details", "claim_details_async"):
+            response = self.client.get(reverse(f"portal:{name}", args=[self.claim.pk]))
+            self.assertEqual(response.status_code, 404)
+        self.client.force_login(self.partner)
+        response = self.client.get(reverse("portal:claim_details", args=[self.claim.pk]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_scope_follows_partner_fields_at_once(self):
+        self.client.force_login(self.partner)
+        url = reverse("portal:claim_details", args=[self.claim.pk])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        # A queryset update sends no signals; the next request must still see it
+        PartnerFields.objects.filter(user=self.partner).update(partner_service=self.partner_admin.partner_fields
+                                                               .partner_service)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        PartnerFields.objects.filter(user=self.partner).delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(list(self.client.get(reverse("portal:claims")).context["claims"]), [])
+
+    def test_partner_fields_load_once_per_request(self):
+        self.client.force_login(self.partner)
+        # Session, user, partner fields with the service (shared by the scope and
+        # the layout context), the page of claims
+        with self.assertNumQueries(4):
+            self.client.get(reverse("portal:claims"))
+
+
+class ExportTests(ClaimFixtureMixin, TestCase):
+    """SSH staff download the filtered claims list as streamed CSV or XLSX."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_service = PartnerService.objects.create(name="Other", email="o@example.com", phone_number="2",
+                                                          address="-")
+        cls.other = WarrantyClaim.objects.get(pk=cls.claim.pk)
+        cls.other.pk = None
+        cls.other.partner_service = cls.other_service
+        cls.other.status = WarrantyClaim.ClaimStatus.Rejected
+        cls.other.save()
+        part = SparePart.objects.create(stock_code="BR-1", description="brake pad", price_eur=3)
+        ClaimSparePart.objects.create(claim=cls.claim, spare_part=part, stock_code="BR-1", currency="EUR",
+                                      unit_price=3, quantity=2, total_price=6)
+
+    def export(self, query=""):
+        self.client.force_login(self.ssh_admin)
+        response = self.client.get(reverse("portal:export_claims") + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def csv_rows(self, query=""):
+        content = b"".join(self.export(query).streaming_content).decode()
+        return list(csv.reader(io.StringIO(content)))
+
+    def test_csv(self):
+        response = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertRegex(response["Content-Disposition"], r'^attachment; filename="warranty-claims-.*\.csv"$')
+        header, *rows = self.csv_rows()
+        self.assertEqual(header, export_header())
+        self.assertEqual([row[0] for row in rows], [str(self.claim.pk), str(self.other.pk)])
+        row = dict(zip(header, rows[0]))
+        self.assertEqual(
+            (row["Status"], row["Customer Last Name"], row["Partner Service"], row["Created By"],
+             row["Requested EUR"], row["Requested USD"]),
+            ("New", "Lovelace", "Service", "partner", "6.00", "0.00"),
+        )
+        self.assertRegex(row["Last Modified"], r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$")
+
+    def test_xlsx(self):
+        response = self.export("?format=xlsx")
+        self.assertRegex(response["Content-Disposition"], r'filename="warranty-claims-.*\.xlsx"$')
+        rows = list(iter_xlsx_rows(io.BytesIO(b"".join(response.streaming_content))))
+        self.assertEqual(rows[0], export_header())
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.claim.pk), str(self.other.pk)])
+
+    def test_filters(self):
+        self.assertEqual([row[0] for row in self.csv_rows("?status=RJ")[1:]], [str(self.other.pk)])
+        self.assertEqual([row[0] for row in self.csv_rows(f"?partner_service={self.other_service.pk}")[1:]],
+                         [str(self.other.pk)])
+        self.assertEqual(self.csv_rows("?status=AC&vehicle_type=OT")[1:], [])
+
+    def test_formulas_are_written_as_text(self):
+        Customer.objects.filter(pk=self.claim.customer_id).update(
+            first_name='=HYPERLINK("http://evil.example","x")', last_name="+1", company="@SUM(A1)",
+        )
+        WarrantyClaim.objects.filter(pk=self.claim.pk).update(defect_category="-2+3")
+        header, row, _ = self.csv_rows()
+        row = dict(zip(header, row))
+        self.assertEqual(
+            (row["Customer First Name"], row["Customer Last Name"], row["Customer Company"], row["Defect Category"]),
+            ("'=HYPERLINK(\"http://evil.example\",\"x\")", "'+1", "'@SUM(A1)", "'-2+3"),
+        )
+        rows = list(iter_xlsx_rows(io.BytesIO(b"".join(self.export("?format=xlsx").streaming_content))))
+        self.assertEqual(rows[1][export_header().index("Customer Last Name")], "'+1")
+
+    def test_invalid_filter_is_reported_not_dropped_with_the_rest(self):
+        self.client.force_login(self.ssh_admin)
+        query = {"status": "RJ", "partner_service": "9999"}
+        response = self.client.get(reverse("portal:claims"), query)
+        self.assertEqual([claim.pk for claim in response.context["claims"]], [self.other.pk])
+        self.assertContains(response, "Some filters were ignored")
+        self.assertContains(response, "Partner service: Select a valid choice.")
+        response = self.client.get(reverse("portal:export_claims"), query)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b"partner_service", response.content)
+
+    def test_only_ssh_staff(self):
+        self.client.force_login(self.partner)
+        self.assertEqual(self.client.get(reverse("portal:export_claims")).status_code, 403)
+
+    def test_rows_are_streamed_in_chunks(self):
+        with mock.patch("portal.exports.CSV_ROWS_PER_CHUNK", 1):
+            response = self.export()
+            # Nothing is read until the body is consumed
+            with CaptureQueriesContext(connection) as queries:
+                chunks = iter(response.streaming_content)
+            self.assertEqual(len(queries), 0)
+            chunks = list(chunks)
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith(b"Claim ID,"))
+
+
+class ClaimTotalsTests(ClaimFixtureMixin, TestCase):
+    """Every way of writing part lines keeps the totals stored on the claims right."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.second = WarrantyClaim.objects.get(pk=cls.claim.pk)
+        cls.second.pk = None
+        cls.second.save()
+        cls.parts = SparePart.objects.bulk_create([
+            SparePart(stock_code=f"P-{i}", description="part", price_eur=2) for i in range(3)
+        ])
+
+    def line(self, part, claim=None, currency="EUR", total="6.00"):
+        return ClaimSparePart(claim=claim or self.claim, spare_part=part, stock_code=part.stock_code,
+                              currency=currency, unit_price=2, quantity=3, total_price=Decimal(total))
+
+    def assertTotals(self, claim, **expected):
+        stored = WarrantyClaim.objects.values(*TOTAL_FIELDS).get(pk=claim.pk)
+        self.assertEqual({field: amount for field, amount in stored.items() if amount}, expected)
+        self.assertEqual(find_total_mismatches([self.claim.pk, self.second.pk]), {})
+
+    def test_save_and_delete(self):
+        line = self.line(self.parts[0])
+        line.save()
+        self.assertTotals(self.claim, requested_total_eur=Decimal("6.00"))
+        line.total_price, line.approved_total_price = Decimal("8.50"), Decimal("4.00")
+        line.save()
+        self.assertTotals(self.claim, requested_total_eur=Decimal("8.50"), approved_total_eur=Decimal("4.00"))
+        line.currency = "USD"
+        line.save()
+        self.assertTotals(self.claim, requested_total_usd=Decimal("8.50"), approved_total_usd=Decimal("4.00"))
+        line.claim = self.second
+        line.save()
+        self.assertTotals(self.claim)
+        self.assertTotals(self.second, requested_total_usd=Decimal("8.50"), approved_total_usd=Decimal("4.00"))
+        line.delete()
+        self.assertTotals(self.second)
+
+    def test_bulk_writes(self):
+        lines = ClaimSparePart.objects.bulk_create([
+            self.line(self.parts[0]), self.line(self.parts[1], currency="GBP", total="1.25"),
+            self.line(self.parts[2], claim=self.second),
+        ])
+        self.assertTotals(self.claim, requested_total_eur=Decimal("6.00"), requested_total_gbp=Decimal("1.25"))
+        self.assertTotals(self.second, requested_total_eur=Decimal("6.00"))
+
+        lines[0].total_price = Decimal("10.00")
+        lines[2].claim = self.claim
+        ClaimSparePart.objects.bulk_update([lines[0], lines[2]], ["total_price", "claim"])
+        self.assertTotals(self.claim, requested_total_eur=Decimal("16.00"), requested_total_gbp=Decimal("1.25"))
+        self.assertTotals(self.second)
+
+        ClaimSparePart.objects.filter(currency="EUR").update(approved_total_price=F("total_price") / 2)
+        self.assertTotals(self.claim, requested_total_eur=Decimal("16.00"), approved_total_eur=Decimal("8.00"),
+                          requested_total_gbp=Decimal("1.25"))
+        ClaimSparePart.objects.filter(currency="EUR").delete()
+        self.assertTotals(self.claim, requested_total_gbp=Decimal("1.25"))
+
+    def test_recompute_command(self):
+        ClaimSparePart.objects.bulk_create([self.line(self.parts[0]), self.line(self.parts[1], claim=self.second)])
+        # Drift that bypasses the line write paths
+        WarrantyClaim._base_manager.filter(pk=self.claim.pk).update(requested_total_eur=1)
+        self.assertEqual(find_total_mismatches([self.claim.pk, self.second.pk]),
+                         {self.claim.pk: {"requested_total_eur": (Decimal("1.00"), Decimal("6.00"))}})
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "1 of 2 claims have wrong totals"):
+            call_command("recompute_claim_totals", "--check", "--batch-size=1", stdout=out)
+        self.assertIn(f"claim {self.claim.pk}: requested_total_eur 1.00 != 6", out.getvalue())
+        call_command("recompute_claim_totals", "--batch-size=1", stdout=out)
+        self.assertTotals(self.claim, requested_total_eur=Decimal("6.00"))
+
+
+class SparePartLookupTests(ClaimFixtureMixin, TestCase):
+    """Stock codes are matched exactly or by prefix from an index that follows every catalog write."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        SparePart.objects.bulk_create([
+            SparePart(stock_code=code, description=code.lower(), price_eur=1)
+            for code in ("BR-1", "BR-10", "BR-11", "BR-2", "AX-1")
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.partner)
+
+    def lookup(self, **params):
+        response = self.client.get(reverse("portal:sparepart_lookup"), params)
+        self.assertEqual(response.status_code, 200)
+        return [row["stock_code"] for row in response.json()["results"]]
+
+    def test_exact_and_prefix(self):
+        self.assertEqual(self.lookup(q="BR-1"), ["BR-1", "BR-10", "BR-11"])
+        self.assertEqual(self.lookup(q="BR-1", exact="1"), ["BR-1"])
+        self.assertEqual(self.lookup(q="BR-3", exact="1"), [])
+        self.assertEqual(self.lookup(q="ZZ"), [])
+        self.assertEqual(self.lookup(q=""), [])
+        row = self.client.get(reverse("portal:sparepart_lookup"), {"q": "AX-1", "exact": "1"}).json()["results"][0]
+        self.assertEqual((row["description"], row["price_eur"]), ("ax-1", "1.00"))
+
+    def test_limit(self):
+        self.assertEqual(self.lookup(q="BR", limit=2), ["BR-1", "BR-10"])
+        self.assertEqual(self.lookup(q="BR", limit=0), [])
+        self.assertEqual(
+            self.client.get(reverse("portal:sparepart_lookup"), {"q": "BR", "limit": "x"}).status_code, 400,
+        )
+
+    def test_index_follows_catalog_writes(self):
+        self.assertEqual(self.lookup(q="BR-2"), ["BR-2"])
+        SparePart.objects.create(stock_code="BR-20", description="-")
+        self.assertEqual(self.lookup(q="BR-2"), ["BR-2", "BR-20"])
+        SparePart.objects.get(stock_code="BR-2").delete()
+        self.assertEqual(self.lookup(q="BR-2"), ["BR-20"])
+        part = SparePart.objects.get(stock_code="BR-20")
+        part.stock_code = "CX-20"
+        part.save()
+        self.assertEqual(self.lookup(q="BR-2"), [])
+        self.assertEqual(self.lookup(q="CX", exact=""), ["CX-20"])
+
+    def test_index_is_rebuilt_after_a_change_made_elsewhere(self):
+        self.assertEqual(self.lookup(q="DX"), [])
+        # Rows written by another process without this process's hooks, then its token
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {SparePart._meta.db_table} SET stock_code = 'DX-1' WHERE stock_code = 'AX-1'")
+        self.assertEqual(self.lookup(q="DX"), [])
+        CatalogVersion.objects.update(token="written-elsewhere")
+        self.assertEqual(self.lookup(q="DX"), ["DX-1"])
+
+
+class CatalogTests(ClaimFixtureMixin, TestCase):
+    """The catalog version lives in the database, so every process sees every catalog write."""
+
+    def setUp(self):
+        SparePart.objects.create(stock_code="BR-100", description="brake pad", price_eur=10)
+        self.client.force_login(self.partner)
+
+    def etag(self):
+        response = self.client.get(reverse("portal:sparepart_catalog"))
+        self.assertEqual(response.status_code, 200)
+        return response["ETag"]
+
+    def test_unchanged_catalog_is_not_modified(self):
+        etag = self.etag()
+        with self.assertNumQueries(3):
+            # session, user, catalog version
+            response = self.client.get(reverse("portal:sparepart_catalog"), headers={"if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_import_changes_etag(self):
+        etag = self.etag()
+        with tempfile.TemporaryDirectory() as root:
+            path = Path(root) / "prices.csv"
+            path.write_text("stock_code,price_eur\nBR-100,11.50\n")
+            call_command("import_spareparts", str(path), stdout=io.StringIO())
+        self.assertNotEqual(self.etag(), etag)
+        self.assertEqual(json.loads(self.client.get(reverse("portal:sparepart_catalog")).content)["BR-100"]["price_eur"],
+                         "11.50")
+
+    def test_reprice_changes_etag(self):
+        ExchangeRate.objects.bulk_create([
+            ExchangeRate(currency=currency, rate=rate)
+            for currency, rate in (("EUR", 1), ("USD", "1.1"), ("GBP", "0.85"), ("TRY", 35))
+        ])
+        etag = self.etag()
+        call_command("reprice_spareparts", "--base", "EUR", stdout=io.StringIO())
+        self.assertNotEqual(self.etag(), etag)
+
+    def test_version_is_shared_through_the_database(self):
+        etag = self.etag()
+        # What another process's import looks like from here: new rows and a new
+        # token, with none of this process's hooks running
+        with connection.cursor() as cursor:
+            cursor.execute(f"UPDATE {SparePart._meta.db_table} SET price_eur = 12")
+        self.assertEqual(self.etag(), etag)
+        CatalogVersion.objects.update(token="written-elsewhere")
+        self.assertNotEqual(self.etag(), etag)
+
+
+class SparePartImportTests(TestCase):
+    """CSV and XLSX price lists are upserted batch by batch; bad rows are reported, not guessed."""
+
+    def import_csv(self, text, batch_size=2):
+        return import_spareparts(iter_csv_rows(io.BytesIO(text.encode())), batch_size=batch_size)
+
+    def prices(self):
+        return dict(SparePart.objects.values_list("stock_code", "price_eur"))
+
+    def test_csv_upsert_and_row_errors(self):
+        SparePart.objects.create(stock_code="A-1", description="old", price_eur=1, price_usd=7)
+        result = self.import_csv(
+            "Stock_Code,Description,Price_EUR\n"
+            "A-1,axle,10.50\n"
+            ",nameless,1\n"
+            "B-1,bolt,abc\n"
+            "C-1,clip,10.005\n"
+            "D-1,disc,-1\n"
+            "\n"
+            "E-1,pad,2.500\n"
+        )
+        self.assertEqual((result.rows, result.imported, result.error_count), (6, 2, 4))
+        self.assertEqual([line for line, _ in result.errors], [3, 4, 5, 6])
+        self.assertIn("price_eur is not a valid price: '10.005'", result.errors[2][1])
+        self.assertEqual(self.prices(), {"A-1": Decimal("10.50"), "E-1": Decimal("2.50")})
+        # Columns missing from the file are left alone
+        self.assertEqual(SparePart.objects.get(stock_code="A-1").price_usd, 7)
+        self.assertEqual(SparePart.objects.get(stock_code="A-1").description, "axle")
+
+    def test_batch_boundaries(self):
+        rows = "".join(f"P-{i},part,{i}\n" for i in range(5))
+        # The same code twice within a batch and again in a later one: the last row wins
+        result = self.import_csv("stock_code,description,price_eur\n" + rows + "P-0,part,7\nP-0,part,8\n")
+        self.assertEqual((result.rows, result.error_count), (7, 0))
+        self.assertEqual(self.prices(), {"P-0": 8, "P-1": 1, "P-2": 2, "P-3": 3, "P-4": 4})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.import_csv("stock_code,price_eur\n").rows, 0)
+        with self.assertRaises(ValueError):
+            self.import_csv("description,price_eur\nx,1\n")
+
+    def test_xlsx(self):
+        # Written the way spreadsheet programs do: shared strings, cell references, a gap
+        sheet = (
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="C1" t="s"><v>1</v></c></row>'
+            '<row r="2"><c r="A2" t="s"><v>2</v></c><c r="C2"><v>12.25</v></c></row>'
+            '<row r="3"><c r="A3" t="inlineStr"><is><t>X-2</t></is></c><c r="C3"><v>3</v></c></row>'
+            '</sheetData></worksheet>'
+        )
+        strings = (
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<si><t>stock_code</t></si><si><t>price_eur</t></si><si><r><t>X-</t></r><r><t>1</t></r></si></sst>'
+        )
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("xl/worksheets/sheet1.xml", sheet)
+            archive.writestr("xl/sharedStrings.xml", strings)
+        buffer.seek(0)
+        self.assertEqual(list(iter_xlsx_rows(buffer)), [["stock_code", "", "price_eur"], ["X-1", "", "12.25"],
+                                                         ["X-2", "", "3"]])
+        buffer.seek(0)
+        result = import_spareparts(iter_rows(buffer, "prices.XLSX"))
+        self.assertEqual((result.imported, result.error_count), (2, 0))
+        self.assertEqual(self.prices(), {"X-1": Decimal("12.25"), "X-2": 3})
+
+        # What the exports write reads back the same
+        exported = io.BytesIO(b"".join(iter_xlsx_bytes([["stock_code", "price_eur"], ["Y-1", Decimal("4.20")]])))
+        self.assertEqual(list(iter_xlsx_rows(exported)), [["stock_code", "price_eur"], ["Y-1", "4.20"]])
+
+
+class RepricingTests(TestCase):
+    """Prices in other currencies are derived from the base column, rounded half-up to cents."""
+
+    @classmethod
+    def setUpTestData(cls):
+        ExchangeRate.objects.bulk_create([
+            ExchangeRate(currency=currency, rate=Decimal(rate))
+            for currency, rate in (("EUR", "1"), ("USD", "1.085"), ("GBP", "0.125"), ("TRY", "35.123"))
+        ])
+        SparePart.objects.bulk_create([
+            SparePart(stock_code="A", price_eur="1.00", price_usd=99),
+            SparePart(stock_code="B", price_eur="2.50"),
+            SparePart(stock_code="C", price_eur=0),
+        ])
+
+    def prices(self):
+        return {
+            part["stock_code"]: tuple(str(part[field]) for field in ("price_eur", "price_usd", "price_gbp", "price_try"))
+            for part in SparePart.objects.values()
+        }
+
+    def test_reprice_in_batches(self):
+        out = io.StringIO()
+        call_command("reprice_spareparts", "--base=EUR", "--batch-size=2", stdout=out)
+        # Half-even would give 1.08 and 0.12 for A
+        self.assertEqual(self.prices(), {
+            "A": ("1.00", "1.09", "0.13", "35.12"),
+            "B": ("2.50", "2.71", "0.31", "87.81"),
+            "C": ("0.00", "0.00", "0.00", "0.00"),
+        })
+        self.assertIn("2 parts repriced\n3 parts repriced\nRepriced 3 parts from EUR", out.getvalue())
+
+    def test_other_base(self):
+        SparePart.objects.filter(stock_code="A").update(price_usd="2.17")
+        call_command("reprice_spareparts", "--base=USD", stdout=io.StringIO())
+        # 2.17 / 1.085 = 2 EUR, 0.25 GBP, 70.246 TRY
+        self.assertEqual(self.prices()["A"], ("2.00", "2.17", "0.25", "70.25"))
+
+    def test_missing_or_invalid_rate(self):
+        ExchangeRate.objects.filter(currency="TRY").delete()
+        with self.assertRaisesMessage(CommandError, "No exchange rate for TRY"):
+            call_command("reprice_spareparts", stdout=io.StringIO())
+        ExchangeRate.objects.create(currency="TRY", rate=0)
+        with self.assertRaisesMessage(CommandError, "Exchange rates must be positive"):
+            call_command("reprice_spareparts", stdout=io.StringIO())
+        self.assertEqual(self.prices()["A"], ("1.00", "99.00", "0.00", "0.00"))
+
+    def test_prices_too_large_for_the_column_are_reported(self):
+        # 9,999,999,999.99 EUR is the largest price; in TRY it needs 12 integer digits
+        SparePart.objects.filter(stock_code="B").update(price_eur="9999999999.99")
+        out, err = io.StringIO(), io.StringIO()
+        with self.assertRaisesMessage(CommandError, "1 parts were not repriced"):
+            call_command("reprice_spareparts", stdout=out, stderr=err)
+        part = SparePart.objects.get(stock_code="B")
+        self.assertIn(f"part {part.pk} left unchanged", err.getvalue())
+        self.assertIn("Repriced 2 parts", out.getvalue())
+        self.assertEqual(self.prices()["B"], ("9999999999.99", "0.00", "0.00", "0.00"))
+        self.assertEqual(self.prices()["A"], ("1.00", "1.09", "0.13", "35.12"))
+
+
+class SearchTests(TestCase):
+    """The text index follows every write path and ranks the best match first."""
+
+    @classmethod
+    def setUpTestData(cls):
+        service = PartnerService.objects.create(name="Service", email="s@example.com", phone_number="1", address="-")
+        cls.customer = Customer.objects.create(
+            first_name="Ada", last_name="Lovelace", company="acme", email="ada@example.com",
+            phone_number="1", city="-", country="-", address="-", partner_service=service,
+        )
+        cls.user = User.objects.create_superuser("ssh", password="x")
+        User.objects.filter(pk=cls.user.pk).update(role=User.Types.SSH_ADMIN)
+        cls.service = service
+
+    def make_claim(self, category, description):
+        return WarrantyClaim.objects.create(
+            customer=self.customer, vehicle_driver_name="-", vehicle_driver_phone="-", vehicle_chassis_number=1,
+            vehicle_kilometer=1, defect_category=category, defect_description=description,
+            partner_service=self.service, created_by=self.user,
+        )
+
+    def search(self, text):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("portal:claim_search"), {"q": text})
+        self.assertEqual(response.status_code, 200)
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_index_follows_writes(self):
+        claim = self.make_claim("brakes", "noise when braking")
+        self.assertEqual(self.search("brak"), [claim.pk])
+        WarrantyClaim.objects.filter(pk=claim.pk).update(defect_description="worn pads")
+        self.assertEqual(self.search("pads"), [claim.pk])
+        self.assertEqual(self.search("noise"), [])
+        claim.delete()
+        self.assertEqual(self.search("pads"), [])
+
+    def test_ranking_and_syntax(self):
+        weak = self.make_claim("engine", "oil leak near the gearbox")
+        strong = self.make_claim("gearbox", "gearbox grinds, gearbox slips")
+        self.assertEqual(self.search("gearbox"), [strong.pk, weak.pk])
+        self.assertEqual(self.search('"AND( *'), [])
+
+
+class RollupFixtureMixin:
+    """Two partner services, a customer, an SSH admin and two catalog parts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = PartnerService.objects.create(name="Service", email="s@example.com", phone_number="1", address="-")
+        cls.other_service = PartnerService.objects.create(name="Other", email="o@example.com", phone_number="2", address="-")
+        cls.customer = Customer.objects.create(
+            first_name="Ada", last_name="Lovelace", company="acme", email="ada@example.com",
+            phone_number="1", city="-", country="-", address="-", partner_service=cls.service,
+        )
+        cls.user = User.objects.create_superuser("ssh", password="x")
+        User.objects.filter(pk=cls.user.pk).update(role=User.Types.SSH_ADMIN)
+        cls.parts = [
+            SparePart.objects.create(stock_code=code, description=code, price_eur=10, price_usd=12)
+            for code in ("A-1", "B-2")
+        ]
+
+    def make_claim(self, **fields):
+        return WarrantyClaim.objects.create(
+            customer=self.customer, vehicle_driver_name="-", vehicle_driver_phone="-", vehicle_chassis_number=1,
+            vehicle_kilometer=1, defect_category="-", defect_description="-",
+            partner_service=self.service, created_by=self.user, **fields,
+        )
+
+    def line(self, claim, part, currency="EUR", quantity=1, price=10):
+        return ClaimSparePart(
+            claim=claim, spare_part=part, stock_code=part.stock_code, currency=currency,
+            unit_price=price, quantity=quantity, total_price=price * quantity,
+        )
+
+    def rollups(self):
+        fields = ["day", "status", "partner_service_id", "vehicle_type", "claim_count", *TOTAL_FIELDS]
+        return sorted(
+            tuple(row) for row in ClaimRollup.objects.exclude(claim_count=0).values_list(*fields)
+        )
+
+    def assertRollupsMatchRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+
+class RollupTests(RollupFixtureMixin, TestCase):
+    """Incremental rollup maintenance must end up where a full rebuild does."""
+
+    def test_writes_keep_rollups_in_sync(self):
+        first = self.make_claim()
+        second = self.make_claim(vehicle_type=WarrantyClaim.VehicleTypes.Tanker)
+        self.line(first, self.parts[0]).save()
+        ClaimSparePart.objects.bulk_create([
+            self.line(second, self.parts[0], quantity=3),
+            self.line(second, self.parts[1], currency="USD", price=12),
+        ])
+        self.assertRollupsMatchRebuild()
+
+        first.status = WarrantyClaim.ClaimStatus.Accepted
+        first.save()
+        WarrantyClaim.objects.filter(pk=second.pk).update(status=WarrantyClaim.ClaimStatus.Rejected)
+        ClaimSparePart.objects.filter(claim=second).update(approved_total_price=5)
+        self.assertRollupsMatchRebuild()
+
+        WarrantyClaim.objects.filter(pk=first.pk).update(partner_service=self.other_service)
+        ClaimSparePart.objects.filter(claim=second, currency="USD").delete()
+        second.delete()
+        self.assertRollupsMatchRebuild()
+        self.assertEqual(ClaimRollup.objects.filter(claim_count__gt=0).count(), 1)
+
+    def test_dashboard(self):
+        claim = self.make_claim()
+        self.line(claim, self.parts[0], quantity=2).save()
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("portal:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q["sql"] for q in queries.captured_queries if CLAIM_TABLE + '"' in q["sql"]])
+        dashboard = response.context["dashboard"]
+        self.assertEqual(dashboard["overall"]["claims"], 1)
+        self.assertEqual(dashboard["by_status"][0]["totals"][0]["requested"], 20)
+
+    def test_dashboard_keeps_services_with_the_same_name_apart(self):
+        PartnerService.objects.filter(pk=self.other_service.pk).update(name="Service")
+        claims = [self.make_claim() for _ in range(3)]
+        WarrantyClaim.objects.filter(pk__in=[claims[1].pk, claims[2].pk]).update(partner_service=self.other_service)
+        rows = dashboard_summary(timezone.localdate())["by_partner_service"]
+        self.assertEqual([(row["label"], row["claims"]) for row in rows], [("Service", 1), ("Service", 2)])
+
+
+class WorkflowTests(RollupFixtureMixin, TestCase):
+    """Bulk transitions follow the workflow, record history and keep the rollups right."""
+
+    def test_transition_claims(self):
+        Status = WarrantyClaim.ClaimStatus
+        new = [self.make_claim() for _ in range(3)]
+        completed = self.make_claim(status=Status.Completed)
+        claims = WarrantyClaim.objects.filter(pk__in=[claim.pk for claim in [*new, completed]])
+        with CaptureQueriesContext(connection) as queries:
+            result = transition_claims(claims, Status.Accepted, user=self.user, note="batch")
+        self.assertEqual((result.updated, result.skipped), (3, 1))
+        updates = [q["sql"] for q in queries.captured_queries if q["sql"].startswith(f'UPDATE "{CLAIM_TABLE}"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(
+            sorted(ClaimStatusHistory.objects.values_list("claim_id", "from_status", "to_status", "changed_by")),
+            [(claim.pk, Status.New, Status.Accepted, self.user.pk) for claim in new],
+        )
+        self.assertEqual(WarrantyClaim.objects.get(pk=completed.pk).status, Status.Completed)
+        self.assertRollupsMatchRebuild()
+        with self.assertRaises(ValueError):
+            transition_claims(claims, "XX")
+
+    def test_admin_action(self):
+        claims = [self.make_claim() for _ in range(2)]
+        self.client.force_login(self.user)
+        response = self.client.post(reverse("admin:portal_warrantyclaim_changelist"), {
+            "action": "mark_rejected", "_selected_action": [claim.pk for claim in claims],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(WarrantyClaim.objects.values_list("status", flat=True)), {"RJ"})
+
+
+class PartApprovalTests(RollupFixtureMixin, TestCase):
+    """Approvals are one UPDATE of the lines, with totals computed by the database."""
+
+    def test_approve_claims(self):
+        bulletin = self.make_claim(claim_type=WarrantyClaim.ClaimTypes.Bulletin)
+        parts = SparePart.objects.bulk_create(
+            SparePart(stock_code=f"P-{i}", description="-", price_eur=10) for i in range(300)
+        )
+        ClaimSparePart.objects.bulk_create(
+            self.line(bulletin, part, quantity=1 + i % 3, price=Decimal("2.50")) for i, part in enumerate(parts)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(approve_claims(WarrantyClaim.objects.filter(pk=bulletin.pk), user=self.user), 300)
+        line_updates = [q for q in queries.captured_queries if q["sql"].startswith('UPDATE "portal_claimsparepart"')]
+        self.assertEqual(len(line_updates), 1)
+        self.assertFalse(ClaimSparePart.objects.exclude(approved_total_price=F("total_price")).exists())
+        self.assertEqual(find_total_mismatches([bulletin.pk]), {})
+        self.assertRollupsMatchRebuild()
+
+    def test_approve_quantities(self):
+        claim = self.make_claim()
+        first, second = ClaimSparePart.objects.bulk_create([
+            self.line(claim, self.parts[0], quantity=3), self.line(claim, self.parts[1], quantity=2),
+        ])
+        lines = ClaimSparePart.objects.filter(claim=claim)
+        self.assertEqual(approve_quantities(lines, {first.pk: 1, second.pk: 5}), 2)
+        self.assertEqual(
+            list(lines.order_by("pk").values_list("approved_quantity", "approved_total_price")),
+            [(1, 10), (2, 20)],
+        )
+        claim.refresh_from_db()
+        self.assertEqual(claim.approved_total_eur, 30)
+        self.assertRollupsMatchRebuild()
+
+
+class ClaimReportTests(ClaimFixtureMixin, TestCase):
+    """Reports are well-formed PDFs, scoped like the claim details and renderable in bulk."""
+
+    def assertValidPdf(self, content):
+        self.assertTrue(content.startswith(b"%PDF-1.4"))
+        xref = int(re.search(rb"startxref\n(\d+)", content).group(1))
+        self.assertTrue(content[xref:].startswith(b"xref"))
+        offsets = re.findall(rb"(\d{10}) 00000 n ", content[xref:])
+        for number, offset in enumerate(offsets, start=1):
+            self.assertTrue(content[int(offset):].startswith(b"%d 0 obj" % number))
+
+    def test_view(self):
+        part = SparePart.objects.create(stock_code="A-1", description="axle (rear)", price_eur=10)
+        ClaimSparePart.objects.create(claim=self.claim, spare_part=part, stock_code="A-1", quantity=2,
+                                      unit_price=10, total_price=20)
+        self.client.force_login(self.partner)
+        response = self.client.get(reverse("portal:claim_report", args=[self.claim.pk]))
+        self.assertEqual(response["Content-Type"], "application/pdf")
+        self.assertValidPdf(response.content)
+        other = User.objects.create_user("other", password="x")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse("portal:claim_report", args=[self.claim.pk])).status_code, 404)
+
+    def test_batch(self):
+        for workers in (0, 2):
+            buffer = io.BytesIO()
+            self.assertEqual(write_report_zip(WarrantyClaim.objects.all(), buffer, workers=workers), 1)
+            with zipfile.ZipFile(buffer) as archive:
+                self.assertEqual(archive.namelist(), [f"claim-{self.claim.pk}.pdf"])
+                self.assertValidPdf(archive.read(archive.namelist()[0]))
+
+
+class AttachmentTests(ClaimFixtureMixin, TestCase):
+    """Uploads resume at the acknowledged offset and identical files are stored once."""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        settings = override_settings(PORTAL_ATTACHMENT_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.partner)
+
+    def upload(self, content, filename="defect.txt", chunk=4):
+        response = self.client.post(
+            reverse("portal:start_attachment_upload", args=[self.claim.pk]),
+            {"filename": filename, "size": len(content)}, content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response.json()["url"]
+        for offset in range(0, len(content), chunk):
+            response = self.client.put(f"{url}?offset={offset}", content[offset:offset + chunk],
+                                       content_type="application/octet-stream")
+        return url, response
+
+    def test_resumable_upload_and_dedup(self):
+        content = b"crack near the weld"
+        response = self.client.post(
+            reverse("portal:start_attachment_upload", args=[self.claim.pk]),
+            {"filename": "weld.txt", "size": len(content)}, content_type="application/json",
+        )
+        url = response.json()["url"]
+        self.client.put(f"{url}?offset=0", content[:5], content_type="application/octet-stream")
+        # A repeated or skipped chunk is refused with the offset to resume from
+        response = self.client.put(f"{url}?offset=0", content[:5], content_type="application/octet-stream")
+        self.assertEqual((response.status_code, response.json()["offset"]), (409, 5))
+        self.assertEqual(self.client.get(url).json(), {"offset": 5, "size": len(content)})
+        response = self.client.put(f"{url}?offset=5", content[5:], content_type="application/octet-stream")
+        self.assertEqual(response.status_code, 201)
+        attachment = response.json()
+
+        download = self.client.get(attachment["url"])
+        self.assertEqual(b"".join(download.streaming_content), content)
+        _, again = self.upload(content, filename="weld-again.txt")
+        self.assertEqual(again.json()["id"], attachment["id"])
+        self.assertEqual(AttachmentBlob.objects.count(), 1)
+        self.assertEqual(len([path for path in self.root.rglob("*") if path.is_file()]), 1)
+
+        self.upload(b"another file", filename="other.txt")
+        self.assertEqual(ClaimAttachment.objects.filter(claim=self.claim).count(), 2)
+        other = User.objects.create_user("other", password="x")
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(attachment["url"]).status_code, 404)
+
+    def test_size_limit(self):
+        with override_settings(PORTAL_ATTACHMENT_MAX_SIZE=10):
+            response = self.client.post(
+                reverse("portal:start_attachment_upload", args=[self.claim.pk]),
+                {"filename": "big.jpg", "size": 11}, content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 413)
+
+    def test_only_images_and_pdfs_are_shown_inline(self):
+        _, page = self.upload(b"<script>alert(document.cookie)</script>", filename="x.html")
+        _, svg = self.upload(b'<svg xmlns="http://www.w3.org/2000/svg" onload="alert(1)"/>', filename="x.svg")
+        _, photo = self.upload(b"\x89PNG\r\n\x1a\n" + b"\0" * 8, filename="photo.txt")
+        for attachment in (page, svg):
+            attachment = attachment.json()
+            self.assertEqual(attachment["content_type"], "application/octet-stream")
+            response = self.client.get(attachment["url"])
+            self.assertEqual(response["Content-Type"], "application/octet-stream")
+            self.assertTrue(response["Content-Disposition"].startswith("attachment;"))
+            self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+        response = self.client.get(photo.json()["url"])
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertTrue(response["Content-Disposition"].startswith("inline;"))
+        # Blobs stored before types were sniffed keep their guessed type, and are not trusted
+        AttachmentBlob.objects.filter(pk=ClaimAttachment.objects.get(pk=page.json()["id"]).blob_id).update(
+            content_type="text/html",
+        )
+        response = self.client.get(page.json()["url"])
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+
+    def test_chunk_claimed_by_another_request_is_not_written(self):
+        upload = start_upload(self.claim, "weld.txt", 8, self.partner)
+        stale = AttachmentUpload.objects.get(pk=upload.pk)
+        receive_chunk(upload, 0, io.BytesIO(b"weld"), 4)
+        # A second request with the same offset, read before the first one committed
+        with self.assertRaises(UploadError) as raised:
+            receive_chunk(stale, 0, io.BytesIO(b"XXXX"), 4)
+        self.assertEqual(raised.exception.offset, 4)
+        self.assertEqual(part_path(upload).read_bytes(), b"weld")
+        with self.assertRaises(UploadError):
+            receive_chunk(upload, 4, io.BytesIO(b"cr"), 4)
+        self.assertEqual(AttachmentUpload.objects.get(pk=upload.pk).received, 4)
+        receive_chunk(upload, 4, io.BytesIO(b"rack"), 4)
+        self.assertEqual(blob_path(AttachmentBlob.objects.get().sha256).read_bytes(), b"weldrack")
+
+    def test_cleanup(self):
+        _, kept = self.upload(b"kept on the claim")
+        _, dropped = self.upload(b"claim is gone")
+        ClaimAttachment.objects.filter(pk=dropped.json()["id"]).delete()
+        abandoned = start_upload(self.claim, "half.txt", 8, self.partner)
+        fresh = start_upload(self.claim, "new.txt", 8, self.partner)
+        stray_part = self.root / "uploads" / "gone.part"
+        stray_blob = blob_path("ab" * 32)
+        stray_thumbnail = thumbnail_path("cd" * 32)
+        for path in (stray_part, stray_blob, stray_thumbnail):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b"x")
+        day_ago = timezone.now() - timedelta(days=1)
+        AttachmentUpload.objects.filter(pk=abandoned.pk).update(created_at=day_ago)
+        AttachmentBlob.objects.update(created_at=day_ago)
+        for path in self.root.rglob("*"):
+            if path.is_file() and path != part_path(fresh):
+                os.utime(path, (day_ago.timestamp(), day_ago.timestamp()))
+
+        out = io.StringIO()
+        call_command("cleanup_attachments", "--hours", "12", stdout=out)
+        self.assertIn("Removed 1 abandoned uploads, 1 unreferenced blobs and 3 stray files", out.getvalue())
+        self.assertEqual(list(AttachmentUpload.objects.values_list("pk", flat=True)), [fresh.pk])
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual(blob.attachments.get().pk, kept.json()["id"])
+        self.assertEqual(
+            sorted(path for path in self.root.rglob("*") if path.is_file()),
+            sorted([blob_path(blob.sha256), part_path(fresh)]),
+        )
+
+
+def png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def make_png(width, height, pixel):
+    """An RGB PNG whose rows use each of the five filters in turn; ``pixel(x, y)`` gives the colour."""
+    rows = [bytes(channel for x in range(width) for channel in pixel(x, y)) for y in range(height)]
+    data = b""
+    previous = bytes(3 * width)
+    for y, row in enumerate(rows):
+        kind = y % 5
+        filtered = bytearray()
+        for i, value in enumerate(row):
+            a = row[i - 3] if i >= 3 else 0
+            b = previous[i]
+            c = previous[i - 3] if i >= 3 else 0
+            p = a + b - c
+            paeth = a if abs(p - a) <= abs(p - b) and abs(p - a) <= abs(p - c) else b if abs(p - b) <= abs(p - c) else c
+            filtered.append((value - (0, a, b, (a + b) >> 1, paeth)[kind]) & 0xFF)
+        data += bytes([kind]) + filtered
+        previous = row
+    return (
+        b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + png_chunk(b"IDAT", zlib.compress(data)) + png_chunk(b"IEND", b"")
+    )
+
+
+def read_png(data):
+    """Size and unfiltered rows of a PNG written by portal.thumbnails (filter 0 only)."""
+    width, height = struct.unpack(">II", data[16:24])
+    end = data.index(b"IEND") - 4
+    raw = zlib.decompress(data[data.index(b"IDAT") + 4:end - 4])
+    stride = 3 * width + 1
+    return width, height, [raw[y * stride + 1:(y + 1) * stride] for y in range(height)]
+
+
+class ThumbnailTests(ClaimFixtureMixin, TestCase):
+    """Image uploads get a thumbnail from the job queue; other files do not."""
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings = override_settings(PORTAL_ATTACHMENT_ROOT=Path(root.name))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.client.force_login(self.partner)
+
+    def upload(self, content, filename):
+        upload = start_upload(self.claim, filename, len(content), self.partner)
+        return receive_chunk(upload, 0, io.BytesIO(content), len(content))
+
+    def thumbnail(self, attachment):
+        return self.client.get(
+            reverse("portal:claim_attachment", args=[self.claim.pk, attachment.pk]) + "?thumbnail=1"
+        )
+
+    def test_png_thumbnail(self):
+        def pixel(x, y):
+            return (x % 256, y % 256, (x * y) % 256)
+
+        attachment = self.upload(make_png(640, 250, pixel), "scratch.png")
+        self.assertEqual(attachment.blob.thumbnail_status, AttachmentBlob.ThumbnailStatus.Pending)
+        self.assertEqual(self.thumbnail(attachment).status_code, 404)
+        self.assertEqual(run_pending(), (1, 0))
+
+        response = self.thumbnail(attachment)
+        self.assertEqual(response["Content-Type"], "image/png")
+        width, height, rows = read_png(b"".join(response.streaming_content))
+        self.assertEqual((width, height), (320, 125))
+        # Every thumbnail pixel is the source pixel at its centre
+        for y in (0, 62, 124):
+            self.assertEqual(rows[y][:6], bytes(pixel(1, 2 * y + 1) + pixel(3, 2 * y + 1)))
+            self.assertEqual(rows[y][-3:], bytes(pixel(639, 2 * y + 1)))
+        page = self.client.get(reverse("portal:claim_details", args=[self.claim.pk]))
+        self.assertContains(page, "?thumbnail=1")
+
+    def test_jpeg_exif_thumbnail(self):
+        preview = b"\xff\xd8\xff\xdbsmall preview\xff\xd9"
+        # Little-endian TIFF: an empty IFD0 pointing at IFD1, which locates the preview
+        ifd1 = struct.pack("<H", 2) + struct.pack("<HHII", 0x0201, 4, 1, 44) + struct.pack("<HHII", 0x0202, 4, 1, len(preview))
+        tiff = b"II*\0" + struct.pack("<I", 8) + struct.pack("<HI", 0, 14) + ifd1 + struct.pack("<I", 0) + preview
+        exif = b"Exif\0\0" + tiff
+        photo = b"\xff\xd8" + b"\xff\xe1" + struct.pack(">H", len(exif) + 2) + exif + b"\xff\xda" + b"\0" * 64
+        attachment = self.upload(photo, "engine.jpg")
+        run_pending()
+        response = self.thumbnail(attachment)
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(b"".join(response.streaming_content), preview)
+
+    def test_files_without_a_thumbnail(self):
+        gif = self.upload(b"GIF89a" + b"\0" * 16, "weld.gif")
+        text = self.upload(b"no picture", "notes.txt")
+        broken = self.upload(b"\x89PNG\r\n\x1a\n" + b"\0" * 8, "broken.png")
+        # Only the PNG queued a job
+        self.assertEqual(run_pending(), (1, 0))
+        for attachment in (gif, text, broken):
+            attachment.blob.refresh_from_db()
+            self.assertEqual(attachment.blob.thumbnail_status, AttachmentBlob.ThumbnailStatus.Unavailable)
+            self.assertEqual(self.thumbnail(attachment).status_code, 404)
+        self.assertFalse(thumbnail_path(broken.blob.sha256).exists())
+
+    def test_large_png_is_not_decoded(self):
+        with override_settings(PORTAL_THUMBNAIL_MAX_PIXELS=100):
+            with self.assertRaisesMessage(Exception, "too large"):
+                png_thumbnail(make_png(20, 10, lambda x, y: (0, 0, 0)))
+        # Smaller than the thumbnail: kept at its size
+        self.assertEqual(read_png(png_thumbnail(make_png(20, 10, lambda x, y: (x, y, 0))))[:2], (20, 10))
+
+
+@override_settings(PORTAL_SITE_URL="https://portal.example.com/")
+class JobQueueTests(ClaimFixtureMixin, TestCase):
+    """Jobs run in batches of one kind and failures are retried with backoff."""
+
+    def second_claim(self):
+        second = WarrantyClaim.objects.get(pk=self.claim.pk)
+        second.pk = None
+        second.save()
+        return second
+
+    def test_claim_emails_are_sent_in_one_batch(self):
+        second = self.second_claim()
+        for claim in (self.claim, second):
+            enqueue("claim_created_email", {"claim_id": claim.pk})
+        self.assertEqual(len(mail.outbox), 0)
+        with self.assertNumQueries(8):
+            # Reclaim stale jobs (two updates), due kind, claim the batch, read it back,
+            # read the claims, mark done, find nothing left
+            self.assertEqual(run_pending(), (2, 0))
+        self.assertEqual(sorted(message.subject for message in mail.outbox),
+                         sorted(f"Warranty claim #{claim.pk} created" for claim in (self.claim, second)))
+        self.assertEqual(mail.outbox[0].to, ["s@example.com"])
+        details = "https://portal.example.com" + reverse("portal:claim_details", args=[self.claim.pk])
+        self.assertIn(f"Details: {details}\n", mail.outbox[0].body)
+        self.assertEqual(set(Job.objects.values_list("status", flat=True)), {Job.Status.Done})
+        self.assertEqual(run_pending(), (0, 0))
+
+    def test_only_failed_emails_of_a_batch_are_retried(self):
+        jobs = [enqueue("claim_created_email", {"claim_id": claim.pk}) for claim in (self.claim, self.second_claim())]
+        with mock.patch.object(mail.EmailMessage, "send", side_effect=[1, OSError("recipient refused")]):
+            with self.assertLogs("portal.jobs", "WARNING"):
+                self.assertEqual(run_pending(), (1, 1))
+        sent, refused = Job.objects.filter(pk__in=[job.pk for job in jobs]).order_by("pk")
+        self.assertEqual(sent.status, Job.Status.Done)
+        self.assertEqual((refused.status, refused.attempts), (Job.Status.Queued, 1))
+        self.assertIn("recipient refused", refused.last_error)
+        Job.objects.filter(pk=refused.pk).update(run_after=timezone.now())
+        self.assertEqual(run_pending(), (1, 0))
+        self.assertEqual([message.subject for message in mail.outbox],
+                         [f"Warranty claim #{refused.payload['claim_id']} created"])
+
+    @override_settings(PORTAL_SITE_URL="")
+    def test_emails_need_the_site_url(self):
+        job = enqueue("claim_created_email", {"claim_id": self.claim.pk})
+        with self.assertLogs("portal.jobs", "WARNING"):
+            self.assertEqual(run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertIn("PORTAL_SITE_URL", job.last_error)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_failures_are_retried_then_given_up(self):
+        calls = []
+
+        @job_handler("test_flaky")
+        def flaky(payload):
+            calls.append(payload)
+            raise RuntimeError("smtp down")
+        self.addCleanup(_handlers.pop, "test_flaky")
+
+        job = enqueue("test_flaky", {"n": 1}, max_attempts=2)
+        with self.assertLogs("portal.jobs", "WARNING"):
+            self.assertEqual(run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.Queued, 1))
+        self.assertIn("smtp down", job.last_error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=backoff(1) - 5))
+        # Not due until the backoff has passed
+        self.assertEqual(run_pending(), (0, 0))
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        with self.assertLogs("portal.jobs", "WARNING"):
+            self.assertEqual(run_pending(), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.Failed, 2))
+        self.assertEqual(len(calls), 2)
+
+    def test_stale_running_jobs_are_reclaimed(self):
+        job = enqueue("claim_created_email", {"claim_id": self.claim.pk}, max_attempts=2)
+        Job.objects.filter(pk=job.pk).update(status=Job.Status.Running, locked_by="dead", locked_at=timezone.now())
+        self.assertEqual(run_pending(), (0, 0))
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(run_pending(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.Done, 1))
+
+        # Reclaiming counts as an attempt, so a job that keeps hanging is given up
+        hung = enqueue("claim_created_email", {"claim_id": self.claim.pk}, max_attempts=2)
+        for _ in range(2):
+            Job.objects.filter(pk=hung.pk).update(
+                status=Job.Status.Running, locked_by="dead", locked_at=timezone.now() - timedelta(hours=1),
+            )
+            reclaim_stale()
+        hung.refresh_from_db()
+        self.assertEqual((hung.status, hung.attempts), (Job.Status.Failed, 2))
+        self.assertIn("did not finish", hung.last_error)
+
+    def test_outcome_is_not_recorded_for_a_reclaimed_job(self):
+        enqueue("claim_created_email", {"claim_id": self.claim.pk})
+        jobs = claim_batch()
+        # Reclaimed and claimed by another worker while this one was still busy
+        Job.objects.filter(pk=jobs[0].pk).update(locked_by="other")
+        self.assertEqual(run_batch(jobs), 1)
+        self.assertEqual(Job.objects.get(pk=jobs[0].pk).status, Job.Status.Running)
+
+        @job_handler("test_broken")
+        def broken(payload):
+            raise RuntimeError("boom")
+        self.addCleanup(_handlers.pop, "test_broken")
+        enqueue("test_broken")
+        jobs = claim_batch()
+        Job.objects.filter(pk=jobs[0].pk).update(locked_by="other")
+        with self.assertLogs("portal.jobs", "WARNING"):
+            run_batch(jobs)
+        job = Job.objects.get(pk=jobs[0].pk)
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.Status.Running, 0, ""))
+
+    def test_unknown_kind_is_refused(self):
+        with self.assertRaises(ValueError):
+            enqueue("no_such_job")
+
+
+class ClaimCardTests(ClaimFixtureMixin, TestCase):
+    """Claim cards are cached until the claim, its customer or its creator changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def cards(self):
+        claims = WarrantyClaim.objects.for_user(self.partner).order_by("pk")
+        with mock.patch("portal.cards.render_to_string", wraps=render_to_string) as render:
+            cards = render_claim_cards(claims)
+        return cards, render.call_count
+
+    def test_cards_are_cached_until_modified(self):
+        cards, rendered = self.cards()
+        self.assertEqual(rendered, 1)
+        self.assertIn("4711", cards[0])
+        self.assertEqual(self.cards(), (cards, 0))
+
+        claim = WarrantyClaim.objects.get(pk=self.claim.pk)
+        claim.vehicle_chassis_number = 4712
+        claim.save()
+        cards, rendered = self.cards()
+        self.assertEqual(rendered, 1)
+        self.assertIn("4712", cards[0])
+
+        customer = self.claim.customer
+        customer.company = "globex"
+        customer.save()
+        cards, rendered = self.cards()
+        self.assertEqual(rendered, 1)
+        self.assertIn("Globex", cards[0])
+        # Customer edits do not count as changes to the claim
+        modified = WarrantyClaim.objects.get(pk=self.claim.pk).claim_last_modified
+        self.assertEqual(modified, claim.claim_last_modified)
+
+        # Bulk updates of the customer or the creator send no signals and still show up
+        Customer.objects.filter(pk=customer.pk).update(first_name="grace")
+        User.objects.filter(pk=self.partner.pk).update(username="renamed")
+        cards, rendered = self.cards()
+        self.assertEqual(rendered, 1)
+        self.assertIn("Grace Lovelace", cards[0])
+        self.assertIn("renamed", cards[0])
+
+        # Totals are derived from the lines and leave the card alone
+        WarrantyClaim.objects.filter(pk=self.claim.pk).update(requested_total_eur=5)
+        self.assertEqual(self.cards()[1], 0)
+
+    def test_claims_page(self):
+        self.client.force_login(self.partner)
+        response = self.client.get(reverse("portal:claims"))
+        self.assertContains(response, "Chasis Number:</span> 4711", html=False)
+        self.partner.username = "renamed"
+        self.partner.save()
+        self.assertContains(self.client.get(reverse("portal:claims")), "renamed")
+
+
+class ClaimEventTests(RollupFixtureMixin, TestCase):
+    """Every claim and line write path lands in the event log, one insert per transaction."""
+
+    def events(self):
+        return list(ClaimEvent.objects.order_by("id").values_list("line_id", "action", "changes"))
+
+    def test_write_paths(self):
+        with self.captureOnCommitCallbacks(execute=True), acting_as(self.user):
+            claim = self.make_claim()
+        self.assertEqual(ClaimEvent.objects.get().actor_id, self.user.pk)
+        ClaimEvent.objects.all()._raw_delete(ClaimEvent.objects.db)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                claim.defect_description = "oil leak"
+                claim.save()
+                line = self.line(claim, self.parts[0])
+                line.save()
+                ClaimSparePart.objects.bulk_create([self.line(claim, self.parts[1])])
+                ClaimSparePart.objects.filter(pk=line.pk).update(approved_quantity=1)
+                WarrantyClaim.objects.filter(pk=claim.pk).update(status=WarrantyClaim.ClaimStatus.Accepted)
+            self.assertEqual(ClaimEvent.objects.count(), 0)
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith(f'INSERT INTO "{ClaimEvent._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        second = ClaimSparePart.objects.get(spare_part=self.parts[1])
+        events = self.events()
+        self.assertEqual([event[:2] for event in events], [
+            (None, "updated"), (line.pk, "created"), (second.pk, "created"), (line.pk, "updated"), (None, "updated"),
+        ])
+        self.assertEqual(events[0][2], {"defect_description": ["-", "oil leak"]})
+        self.assertEqual(events[2][2]["stock_code"], [None, "B-2"])
+        self.assertEqual(events[3][2], {"approved_quantity": [None, 1]})
+        self.assertEqual(events[4][2], {"status": ["NW", "AC"]})
+
+        claim_id = claim.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            claim.delete()
+        # The history outlives the claim; the claim's deletion covers its lines
+        self.assertEqual(self.events()[-1][:2], (None, "deleted"))
+        self.assertEqual(ClaimEvent.objects.filter(claim_id=claim_id).count(), 6)
+        with self.assertRaises(TypeError):
+            ClaimEvent.objects.update(action="created")
+
+    def test_rolled_back_events_are_dropped(self):
+        claim = self.make_claim()
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                claim.defect_description = "kept"
+                claim.save()
+                try:
+                    with transaction.atomic():
+                        WarrantyClaim.objects.filter(pk=claim.pk).update(defect_description="rolled back")
+                        raise ValueError
+                except ValueError:
+                    pass
+        self.assertEqual([changes for _, action, changes in self.events() if action == "updated"],
+                         [{"defect_description": ["-", "kept"]}])
+
+    def test_events_after_a_rolled_back_first_write_are_kept(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            claim = self.make_claim()
+        ClaimEvent.objects.all()._raw_delete(ClaimEvent.objects.db)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        WarrantyClaim.objects.filter(pk=claim.pk).update(defect_description="rolled back")
+                        raise ValueError
+                except ValueError:
+                    pass
+                WarrantyClaim.objects.filter(pk=claim.pk).update(vehicle_kilometer=2)
+                WarrantyClaim.objects.filter(pk=claim.pk).update(vehicle_kilometer=3)
+        inserts = [q for q in queries.captured_queries if q["sql"].startswith(f'INSERT INTO "{ClaimEvent._meta.db_table}"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual([changes for _, _, changes in self.events()],
+                         [{"vehicle_kilometer": [1, 2]}, {"vehicle_kilometer": [2, 3]}])
+
+class ClaimEventRequestTests(RollupFixtureMixin, TransactionTestCase):
+    """Outside of transactions the middleware writes a request's events at its end."""
+
+    def setUp(self):
+        # TransactionTestCase has no class-level fixtures
+        self.setUpTestData()
+
+    def test_middleware_buffers_the_request(self):
+        claim = self.make_claim()
+        ClaimEvent.objects.all()._raw_delete(ClaimEvent.objects.db)
+
+        def view(request):
+            WarrantyClaim.objects.filter(pk=claim.pk).update(vehicle_kilometer=2)
+            WarrantyClaim.objects.filter(pk=claim.pk).update(vehicle_kilometer=3)
+            self.assertEqual(ClaimEvent.objects.count(), 0)
+            return HttpResponse()
+
+        request = RequestFactory().get("/")
+        request.user = self.user
+        ClaimEventMiddleware(view)(request)
+        self.assertEqual(list(ClaimEvent.objects.values_list("actor_id", flat=True)), [self.user.pk] * 2)
+
+    def test_transactions_write_their_events_on_commit(self):
+        claim = self.make_claim()
+        ClaimEvent.objects.all()._raw_delete(ClaimEvent.objects.db)
+        for kilometer in (2, 3):
+            with transaction.atomic():
+                try:
+                    with transaction.atomic():
+                        WarrantyClaim.objects.filter(pk=claim.pk).update(defect_description="rolled back")
+                        raise ValueError
+                except ValueError:
+                    pass
+                WarrantyClaim.objects.filter(pk=claim.pk).update(vehicle_kilometer=kilometer)
+                self.assertEqual(ClaimEvent.objects.count(), kilometer - 2)
+        self.assertEqual(list(ClaimEvent.objects.order_by("id").values_list("changes", flat=True)),
+                         [{"vehicle_kilometer": [1, 2]}, {"vehicle_kilometer": [2, 3]}])
+
+
+class AsyncViewTests(ClaimFixtureMixin, TestCase):
+    """The async views answer exactly like their sync counterparts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        SparePart.objects.create(stock_code="A-1", description="axle", price_eur=10)
+
+    async def test_same_responses(self):
+        pairs = [
+            (reverse("portal:claims"), reverse("portal:claims_async")),
+            (reverse("portal:claims") + "?q=x", reverse("portal:claims_async") + "?q=x"),
+            (reverse("portal:claim_details", args=[self.claim.pk]),
+             reverse("portal:claim_details_async", args=[self.claim.pk])),
+            (reverse("portal:sparepart_lookup") + "?q=A", reverse("portal:sparepart_lookup_async") + "?q=A"),
+            (reverse("portal:sparepart_catalog"), reverse("portal:sparepart_catalog_async")),
+        ]
+        for user in (self.partner, self.ssh_admin):
+            await self.async_client.aforce_login(user)
+            await sync_to_async(self.client.force_login)(user)
+            for sync_url, async_url in pairs:
+                expected = await sync_to_async(self.client.get)(sync_url)
+                response = await self.async_client.get(async_url)
+                self.assertEqual(response.status_code, expected.status_code, async_url)
+                self.assertEqual(response.content, expected.content, async_url)
+        response = await self.async_client.get(
+            reverse("portal:sparepart_catalog_async"), headers={"if-none-match": expected["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class BenchmarkTests(TestCase):
+    """The benchmark dataset is consistent and every benchmarked view answers."""
+
+    def test_seed_and_run(self):
+        dataset = seed_dataset(claims=50)
+        claim_ids = list(WarrantyClaim.objects.values_list("pk", flat=True))
+        self.assertEqual(len(claim_ids), 50)
+        self.assertEqual(find_total_mismatches(claim_ids), {})
+        results = run_benchmarks(dataset, iterations=2, warmup=0)
+        self.assertEqual(set(results), {"login_view", "claims_page", "claims_page_ssh", "claim_details", "create_claim"})
+        self.assertTrue(all(stats["queries"] > 0 for stats in results.values()))
+        self.assertEqual(find_regressions(results, results), [])
+        slower = {"claims_page": {**results["claims_page"], "queries": results["claims_page"]["queries"] + 1}}
+        self.assertEqual(len(find_regressions(results, slower)), 1)
+
+
+class SyntheticDataTests(TestCase):
+    """Generated data is reproducible and as consistent as data written through the ORM."""
+
+    def generate(self):
+        return generate_dataset(seed=3, services=3, customers=40, parts=30, claims=200, batch_size=64)
+
+    def test_generate_dataset(self):
+        written = self.generate()
+        self.assertEqual(written["WarrantyClaim"], 200)
+        claim_ids = list(WarrantyClaim.objects.values_list("pk", flat=True))
+        self.assertEqual(find_total_mismatches(claim_ids), {})
+        self.assertEqual(ClaimSparePart.objects.count(), written["ClaimSparePart"])
+        rollups = list(ClaimRollup.objects.order_by("day", "status", "partner_service", "vehicle_type").values())
+        self.assertEqual(sum(row["claim_count"] for row in rollups), 200)
+        # The search index was refilled and its triggers are back
+        self.assertTrue(search_claims(WarrantyClaim.objects.all(), "leak").exists())
+        # The generated dates were kept, and saves set them again afterwards
+        self.assertGreater(WarrantyClaim.objects.values("claim_date").distinct().count(), 20)
+        claim = WarrantyClaim.objects.order_by("claim_last_modified").first()
+        claim.defect_description = "zyxwv"
+        claim.save()
+        self.assertEqual(list(search_claims(WarrantyClaim.objects.all(), "zyxwv")), [claim])
+        self.assertGreater(claim.claim_last_modified, timezone.now() - timedelta(minutes=1))
+
+    def test_same_seed_same_rows(self):
+        self.generate()
+        first = list(WarrantyClaim.objects.order_by("pk").values_list("status", "vehicle_type", "claim_date"))
+        WarrantyClaim.objects.all().delete()
+        self.generate()
+        second = list(WarrantyClaim.objects.order_by("pk").values_list("status", "vehicle_type", "claim_date"))
+        self.assertEqual(first, second)
+
+
+class QueryInstrumentationTests(TestCase):
+    """The middleware reports queries, flags repeats and enforces budgets in strict mode."""
+
+    def run_middleware(self, queries, budget=None):
+        def view(request):
+            for _ in range(queries):
+                list(PartnerService.objects.filter(pk=1))
+            return HttpResponse()
+
+        def get_response(request):
+            # The handler runs process_view inside the middleware's __call__
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        if budget is not None:
+            view = query_budget(budget)(view)
+        middleware = QueryInstrumentationMiddleware(get_response)
+        return middleware(RequestFactory().get("/"))
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs("portal.sql", "INFO") as logs:
+            response = self.run_middleware(1)
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+        self.assertEqual(json.loads(logs.records[0].getMessage())["queries"], 1)
+
+    def test_repeated_queries_warn(self):
+        with self.assertLogs("portal.sql", "WARNING") as logs:
+            response = self.run_middleware(4)
+        self.assertIn('dup;desc="1 repeated"', response["Server-Timing"])
+        self.assertEqual(json.loads(logs.records[0].getMessage())["repeated"][0]["count"], 4)
+
+    @override_settings(PORTAL_QUERY_STRICT=True)
+    def test_strict_budget(self):
+        with self.assertLogs("portal.sql"):
+            self.run_middleware(2, budget=2)
+            with self.assertRaises(QueryBudgetExceeded):
+                self.run_middleware(3, budget=2)
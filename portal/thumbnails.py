@@ -0,0 +1,213 @@
+"""Thumbnails of image attachments, made by the job queue with the standard library only.
+
+Uploads queue an ``attachment_thumbnail`` job (see portal.jobs) for each new
+image blob, so the upload request returns as soon as the file is stored and
+``manage.py run_jobs`` workers are the pool that makes the thumbnails.
+
+There is no imaging library, so only what can be decoded cheaply is
+previewed:
+
+- PNG (8 bits per sample, not interlaced, any colour type) is decoded with
+  ``zlib`` and sampled down to fit ``THUMBNAIL_SIZE``; the thumbnail is a PNG
+  of the same colour type.
+- JPEG photos carry a small JPEG preview in their EXIF data (phones and
+  cameras write one); that preview is the thumbnail. Decoding the photo
+  itself in Python would take far too long.
+
+Anything else, or a file that fails to decode, is marked as having no
+thumbnail.
+
+Settings:
+
+``PORTAL_THUMBNAIL_MAX_PIXELS``
+    Largest PNG, in pixels, that is decoded for a thumbnail (default 4
+    million); decoding runs at Python speed.
+"""
+
+import os
+import struct
+import zlib
+
+from django.conf import settings
+
+from .attachments import blob_path, thumbnail_path
+from .models import AttachmentBlob
+
+THUMBNAIL_SIZE = 320
+DEFAULT_MAX_PIXELS = 4_000_000
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Samples per pixel of each PNG colour type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+EXIF_THUMBNAIL_OFFSET = 0x0201
+EXIF_THUMBNAIL_LENGTH = 0x0202
+
+
+class NoThumbnail(Exception):
+    """The file cannot be previewed."""
+
+
+def make_thumbnail(blob_id):
+    """Write the thumbnail of an image blob and record the outcome on the blob; returns the status."""
+    blob = AttachmentBlob.objects.filter(pk=blob_id).first()
+    if blob is None:
+        # Cleaned up before the job ran
+        return None
+    status = AttachmentBlob.ThumbnailStatus.Unavailable
+    try:
+        data = thumbnail_bytes(blob_path(blob.sha256), blob.content_type)
+    except (NoThumbnail, OSError, ValueError, IndexError, struct.error, zlib.error):
+        data = None
+    if data is not None:
+        target = thumbnail_path(blob.sha256)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary = target.with_name(f"{target.name}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, target)
+        status = AttachmentBlob.ThumbnailStatus.Ready
+    AttachmentBlob.objects.filter(pk=blob_id).update(thumbnail_status=status)
+    return status
+
+
+def thumbnail_bytes(path, content_type):
+    """The thumbnail of the image at ``path``; raises NoThumbnail when there is none."""
+    if content_type == "image/png":
+        return png_thumbnail(path.read_bytes())
+    if content_type == "image/jpeg":
+        return exif_thumbnail(path)
+    raise NoThumbnail(content_type)
+
+
+# PNG
+
+def _png_chunks(data):
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        if kind == b"IEND":
+            return
+        pos += 12 + length
+
+
+def _png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def _unfilter(kind, row, previous, bpp):
+    """Undo the PNG filter of one scanline in place (see the PNG specification, section 9)."""
+    if kind == 0:
+        return
+    if kind == 1:
+        for i in range(bpp, len(row)):
+            row[i] = (row[i] + row[i - bpp]) & 0xFF
+    elif kind == 2:
+        row[:] = bytes((a + b) & 0xFF for a, b in zip(row, previous))
+    elif kind == 3:
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+    elif kind == 4:
+        for i in range(len(row)):
+            a = row[i - bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    else:
+        raise NoThumbnail(f"Unknown PNG filter {kind}")
+
+
+def png_thumbnail(data, size=THUMBNAIL_SIZE):
+    """Sample a PNG down to fit ``size`` x ``size`` pixels; returns the new PNG."""
+    if not data.startswith(PNG_SIGNATURE):
+        raise NoThumbnail("Not a PNG")
+    chunks = list(_png_chunks(data))
+    if not chunks or chunks[0][0] != b"IHDR":
+        raise NoThumbnail("PNG without a header")
+    width, height, depth, colour, _, _, interlace = struct.unpack(">IIBBBBB", chunks[0][1])
+    if depth != 8 or interlace or colour not in PNG_CHANNELS:
+        raise NoThumbnail("Only 8-bit, non-interlaced PNGs are previewed")
+    if not width or not height or width * height > getattr(settings, "PORTAL_THUMBNAIL_MAX_PIXELS", DEFAULT_MAX_PIXELS):
+        raise NoThumbnail("PNG too large to preview")
+
+    scale = max(width / size, height / size, 1)
+    out_width, out_height = max(1, round(width / scale)), max(1, round(height / scale))
+    bpp = PNG_CHANNELS[colour]
+    stride = width * bpp
+    # Nearest neighbour: the source row and column at the centre of each output pixel
+    wanted_rows = {int((y + 0.5) * height / out_height): y for y in range(out_height)}
+    columns = [int((x + 0.5) * width / out_width) * bpp for x in range(out_width)]
+
+    raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+    if len(raw) < height * (stride + 1):
+        raise NoThumbnail("Truncated PNG")
+    rows = []
+    previous = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        _unfilter(raw[start], row, previous, bpp)
+        if y in wanted_rows:
+            rows.append(b"".join(row[x:x + bpp] for x in columns))
+        previous = row
+
+    # Palette images keep their palette and transparency
+    extra = b"".join(_png_chunk(kind, body) for kind, body in chunks if kind in (b"PLTE", b"tRNS"))
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", out_width, out_height, 8, colour, 0, 0, 0))
+        + extra
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(b"\0" + row for row in rows), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+# JPEG
+
+def exif_thumbnail(path):
+    """The JPEG preview stored in the EXIF data of the JPEG at ``path``."""
+    with open(path, "rb") as fh:
+        if fh.read(2) != b"\xff\xd8":
+            raise NoThumbnail("Not a JPEG")
+        while True:
+            marker = fh.read(2)
+            # Metadata segments all come before the start of scan (DA)
+            if len(marker) < 2 or marker[0] != 0xFF or marker[1] in (0xD9, 0xDA):
+                raise NoThumbnail("No EXIF thumbnail")
+            (length,) = struct.unpack(">H", fh.read(2))
+            segment = fh.read(length - 2)
+            if marker[1] == 0xE1 and segment.startswith(b"Exif\0\0"):
+                return _tiff_thumbnail(segment[6:])
+
+
+def _tiff_thumbnail(tiff):
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        raise NoThumbnail("Bad EXIF byte order")
+
+    def directory(offset):
+        (count,) = struct.unpack(order + "H", tiff[offset:offset + 2])
+        entries = {}
+        for i in range(count):
+            start = offset + 2 + 12 * i
+            tag, kind = struct.unpack(order + "HH", tiff[start:start + 4])
+            # SHORT values sit in the first two bytes of the value field, LONGs fill it
+            entries[tag] = struct.unpack(order + ("H" if kind == 3 else "I"), tiff[start + 8:start + (10 if kind == 3 else 12)])[0]
+        (following,) = struct.unpack(order + "I", tiff[offset + 2 + 12 * count:offset + 6 + 12 * count])
+        return entries, following
+
+    (first,) = struct.unpack(order + "I", tiff[4:8])
+    _, second = directory(first)
+    if not second:
+        raise NoThumbnail("No EXIF thumbnail")
+    # The second directory (IFD1) describes the thumbnail
+    entries, _ = directory(second)
+    offset, length = entries.get(EXIF_THUMBNAIL_OFFSET), entries.get(EXIF_THUMBNAIL_LENGTH)
+    if not offset or not length:
+        raise NoThumbnail("No EXIF thumbnail")
+    thumbnail = tiff[offset:offset + length]
+    if len(thumbnail) != length or not thumbnail.startswith(b"\xff\xd8"):
+        raise NoThumbnail("Broken EXIF thumbnail")
+    return thumbnail
@@ -0,0 +1,129 @@
+"""Incremental maintenance of the per-currency totals stored on WarrantyClaim.
+
+Every change to ClaimSparePart rows is turned into per-claim deltas that are
+added with a single ``UPDATE ... SET field = field + delta`` per claim. Paths
+where the old values are unknown (queryset ``update`` and ``bulk_update``)
+recompute the affected claims with one set-based UPDATE instead.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import ClaimSparePart, SparePart, WarrantyClaim
+
+CURRENCIES = SparePart.Currency.values
+
+
+def total_fields(currency):
+    """Return the ``(requested, approved)`` WarrantyClaim fields for a currency."""
+    currency = currency.lower()
+    return f"requested_total_{currency}", f"approved_total_{currency}"
+
+
+TOTAL_FIELDS = [field for currency in CURRENCIES for field in total_fields(currency)]
+
+
+def line_amounts(currency, total_price, approved_total_price):
+    """Map one line's prices onto the total fields of its currency."""
+    requested, approved = total_fields(currency)
+    return {requested: total_price or Decimal(0), approved: approved_total_price or Decimal(0)}
+
+
+def lines_delta(lines, sign=1):
+    """Sum the amounts of ``lines`` per claim: ``{claim_id: {field: delta}}``."""
+    deltas = defaultdict(lambda: defaultdict(Decimal))
+    for line in lines:
+        for field, amount in line_amounts(line.currency, line.total_price, line.approved_total_price).items():
+            deltas[line.claim_id][field] += sign * amount
+    return deltas
+
+
+def merge_deltas(*parts):
+    merged = defaultdict(lambda: defaultdict(Decimal))
+    for deltas in parts:
+        for claim_id, fields in deltas.items():
+            for field, amount in fields.items():
+                merged[claim_id][field] += amount
+    return merged
+
+
+def apply_totals_delta(deltas):
+    """Add per-claim deltas to the stored totals, one UPDATE per claim.
+
+    The daily rollups get the same amounts, summed per rollup row, instead of
+    tracking every claim update on its own.
+    """
+    from .rollups import apply_rollup_delta, claim_keys
+    deltas = {
+        claim_id: {field: amount for field, amount in fields.items() if amount}
+        for claim_id, fields in deltas.items()
+        if claim_id is not None
+    }
+    deltas = {claim_id: fields for claim_id, fields in deltas.items() if fields}
+    if not deltas:
+        return
+    keys = claim_keys(deltas)
+    rollup_deltas = defaultdict(lambda: defaultdict(Decimal))
+    for claim_id, fields in deltas.items():
+        # The base manager's update() skips WarrantyClaimQuerySet's own rollup tracking
+        WarrantyClaim._base_manager.filter(pk=claim_id).update(
+            **{field: F(field) + amount for field, amount in fields.items()}
+        )
+        if claim_id in keys:
+            for field, amount in fields.items():
+                rollup_deltas[keys[claim_id]][field] += amount
+    apply_rollup_delta(rollup_deltas)
+
+
+def _line_sum(currency, price_field):
+    lines = (
+        ClaimSparePart.objects.filter(claim=OuterRef("pk"), currency=currency)
+        .order_by()
+        .values("claim")
+        .annotate(total=Sum(price_field))
+        .values("total")
+    )
+    output = DecimalField(max_digits=14, decimal_places=2)
+    return Coalesce(Subquery(lines, output_field=output), Value(Decimal(0)), output_field=output)
+
+
+def recompute_claim_totals(claim_ids):
+    """Recompute the totals of the given claims from their lines in one UPDATE."""
+    claim_ids = [claim_id for claim_id in claim_ids if claim_id is not None]
+    if not claim_ids:
+        return 0
+    changes = {}
+    for currency in CURRENCIES:
+        requested, approved = total_fields(currency)
+        changes[requested] = _line_sum(currency, "total_price")
+        changes[approved] = _line_sum(currency, "approved_total_price")
+    return WarrantyClaim.objects.filter(pk__in=claim_ids).update(**changes)
+
+
+def find_total_mismatches(claim_ids):
+    """Return ``{claim_id: {field: (stored, expected)}}`` for claims whose totals drifted."""
+    expected = defaultdict(lambda: defaultdict(Decimal))
+    sums = (
+        ClaimSparePart.objects.filter(claim_id__in=claim_ids)
+        .values("claim_id", "currency")
+        .annotate(requested=Sum("total_price"), approved=Sum("approved_total_price"))
+        .order_by()
+    )
+    for row in sums:
+        for field, amount in line_amounts(row["currency"], row["requested"], row["approved"]).items():
+            expected[row["claim_id"]][field] += amount
+
+    mismatches = {}
+    for stored in WarrantyClaim.objects.filter(pk__in=claim_ids).values("pk", *TOTAL_FIELDS):
+        claim_id = stored["pk"]
+        diff = {
+            field: (stored[field], expected[claim_id][field])
+            for field in TOTAL_FIELDS
+            if stored[field] != expected[claim_id][field]
+        }
+        if diff:
+            mismatches[claim_id] = diff
+    return mismatches
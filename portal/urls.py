@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'portal'
 urlpatterns = [
@@ -14,9 +14,22 @@ urlpatterns = [
 
     # Claims
     path('claims_page', views.claims_page, name='claims'),
+    path('claims/export', views.export_claims, name='export_claims'),
     path('create_claim', views.create_claim, name='create_claim'),
     path('claim/<int:claim_id>', views.claim_details, name='claim_details'),
+    path('claim/<int:claim_id>/report.pdf', views.claim_report, name='claim_report'),
+    path('claim/<int:claim_id>/attachments/<int:attachment_id>', views.claim_attachment, name='claim_attachment'),
     path('claim/<int:claim_id>/update', views.update_claim, name='update_claim'),
     #API
+    path('api/spareparts', views.sparepart_lookup, name='sparepart_lookup'),
+    path('api/spareparts/catalog', views.sparepart_catalog, name='sparepart_catalog'),
+    path('api/claims/search', views.claim_search, name='claim_search'),
+    path('api/claims/<int:claim_id>/attachments', views.start_attachment_upload, name='start_attachment_upload'),
+    path('api/attachments/uploads/<uuid:upload_id>', views.attachment_upload, name='attachment_upload'),
 
+    # Async versions for ASGI deployments
+    path('async/claims_page', async_views.claims_page, name='claims_async'),
+    path('async/claim/<int:claim_id>', async_views.claim_details, name='claim_details_async'),
+    path('async/api/spareparts', async_views.sparepart_lookup, name='sparepart_lookup_async'),
+    path('async/api/spareparts/catalog', async_views.sparepart_catalog, name='sparepart_catalog_async'),
 ]
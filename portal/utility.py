@@ -1,6 +1,11 @@
 from .models import SparePart
 
 def get_sparepart_data():
+    """Map every stock code to its description and stringified prices.
+
+    This reads the whole catalog; callers should go through
+    ``portal.catalog.get_catalog_snapshot()`` which only rebuilds it on change.
+    """
     rows = SparePart.objects.values(
         "stock_code",
         "description",
@@ -10,7 +15,7 @@ def get_sparepart_data():
         "price_try",
     )
     data = {}
-    for row in rows:
+    for row in rows.iterator(chunk_size=2000):
         stock_code = row["stock_code"]
 
         inner = {}
@@ -18,4 +23,4 @@ def get_sparepart_data():
             if key != "stock_code":
                 inner[key] = f"{value}"
         data[stock_code] = inner
-    return data
\ No newline at end of file
+    return data
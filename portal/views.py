@@ -1,12 +1,30 @@
+import json
+
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
-import json
-from django.core.serializers.json import DjangoJSONEncoder
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import  HttpResponseBadRequest
-from .forms import LoginForm, CreateWarrantyClaimForm, CreateClaimSparePartForm
-from .models import WarrantyClaim
-from .utility import get_sparepart_data
+from django.urls import reverse
+from django.http import  FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_GET, require_http_methods
+from django.db import transaction
+from django.db.models import Prefetch, Sum
+from users.principal import get_partner_service
+from .attachments import (
+    INLINE_CONTENT_TYPES, OCTET_STREAM, UploadError, blob_path, max_size, receive_chunk, start_upload, thumbnail_path,
+)
+from .cards import render_claim_cards
+from .catalog import get_catalog_snapshot, lookup_spareparts
+from .exports import iter_csv, iter_xlsx
+from .forms import LoginForm, CreateWarrantyClaimForm, CreateClaimSparePartForm, ClaimFilterForm
+from .jobs import enqueue
+from .middleware import query_budget
+from .models import AttachmentBlob, AttachmentUpload, ClaimAttachment, ClaimSparePart, WarrantyClaim
+from .pagination import keyset_page
+from .reports import claim_report_data, render_claim_report, report_claims, report_filename
+from .rollups import dashboard_summary
+from .search import search_page
 
 # Views for portal pages and APIs
 
@@ -39,39 +57,187 @@ def logout_view(request):
     logout(request)
     return redirect("portal:login")
 
+DASHBOARD_DAYS = (7, 30, 90, 365)
+
+def _is_partner(user):
+    return user.is_partner or user.is_partner_admin
+
+
 @login_required()
+@query_budget(10)
 def home(request):
-    """Render the portal home page; only GET supported."""
-    if request.method == "GET":
-        return render(request, "portal/home_page.html")
-    return HttpResponseBadRequest("Only GET is allowed")
+    """Render the portal home page with the claims dashboard; only GET supported.
+
+    The dashboard reads only the daily rollups, never the claims. Partners see
+    their own partner service; ``days`` picks the window.
+    """
+    if request.method != "GET":
+        return HttpResponseBadRequest("Only GET is allowed")
+    user = request.user
+    try:
+        days = int(request.GET.get("days", 30))
+    except ValueError:
+        days = 30
+    if days not in DASHBOARD_DAYS:
+        days = 30
+    partner_service = None
+    if _is_partner(user):
+        partner_service = get_partner_service(user)
+        if partner_service is None:
+            return render(request, "portal/home_page.html", {"days": days, "day_choices": DASHBOARD_DAYS})
+    return render(request, "portal/home_page.html", {
+        "dashboard": dashboard_summary(timezone.localdate(), days, partner_service),
+        "days": days,
+        "day_choices": DASHBOARD_DAYS,
+    })
+
+def _page_number(request):
+    try:
+        return max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        return 1
+
+
+def _claim_listing(request, user):
+    """Return ``(claims, filter_form, search_query)`` for the claims list of ``user``."""
+    filter_form = ClaimFilterForm(request.GET, show_partner=not _is_partner(user))
+    claims = filter_form.filter(WarrantyClaim.objects.for_user(user)).only(
+        "id", "claim_date", "claim_last_modified", "vehicle_chassis_number", "partner_service",
+        "customer__first_name", "customer__last_name", "customer__company",
+        "created_by__username",
+    )
+    return claims, filter_form, request.GET.get("q", "").strip()
+
+
+def _listing_context(request, filter_form, search_query, page, next_param=None):
+    """Build the claims list template context; ``next_param`` is the query item of the next page."""
+    params = request.GET.copy()
+    params.pop("after", None)
+    params.pop("page", None)
+    first_query = params.urlencode()
+    next_query = None
+    if next_param:
+        params[next_param[0]] = next_param[1]
+        next_query = params.urlencode()
+    return {
+        "claims": page,
+        "claim_cards": render_claim_cards(page),
+        "filter_form": filter_form,
+        "search_query": search_query,
+        "first_query": first_query,
+        "next_query": next_query,
+        "is_first_page": "after" not in request.GET and "page" not in request.GET,
+    }
+
 
 @login_required()
+@query_budget(8)
 def claims_page(request):
-    """List warranty claims. Partners see only their claims; admins see all."""
+    """List warranty claims. Partners see only their claims; admins see all.
+
+    Claims are paged by keyset on (claim_date, id) through the ``after`` cursor,
+    and the card fields are loaded in one joined query per page. Cards that
+    did not change since they were last shown come from the cache. With ``q`` the
+    list shows full-text matches instead, best first, paged by ``page``.
+    """
     if request.method != "GET":
         return HttpResponseBadRequest("Only GET is allowed")
+    claims, filter_form, search_query = _claim_listing(request, request.user)
+    next_param = None
+    if search_query:
+        page_number = _page_number(request)
+        page, has_next = search_page(claims, search_query, page_number)
+        if has_next:
+            next_param = ("page", page_number + 1)
+    else:
+        page, next_cursor = keyset_page(claims, request.GET.get("after"))
+        if next_cursor:
+            next_param = ("after", next_cursor)
+    return render(request, "portal/warranty_claims.html",
+                  _listing_context(request, filter_form, search_query, page, next_param))
+
+@login_required()
+@require_GET
+def export_claims(request):
+    """Stream the (optionally filtered) claims list as CSV or XLSX to SSH staff.
+
+    ``format=xlsx`` selects a workbook, anything else a CSV file.
+    """
     user = request.user
-    if getattr(user, 'is_partner' or "is_partner_admin", False):
-        claims = user.get_partner_claims()
+    if not (user.is_ssh or user.is_ssh_admin):
+        return HttpResponseForbidden("Only SSH users can export claims")
+    filter_form = ClaimFilterForm(request.GET)
+    claims = filter_form.filter(WarrantyClaim.objects.for_user(user))
+    if filter_form.errors:
+        # Exporting more claims than were asked for is worse than exporting none
+        return HttpResponseBadRequest(filter_form.errors.as_text())
+    stamp = timezone.now().strftime("%Y%m%d-%H%M")
+    if request.GET.get("format") == "xlsx":
+        response = StreamingHttpResponse(
+            iter_xlsx(claims),
+            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        )
+        filename = f"warranty-claims-{stamp}.xlsx"
     else:
-        claims = WarrantyClaim.objects.all()
-    return render(request, "portal/warranty_claims.html", {"claims": claims})
+        response = StreamingHttpResponse(iter_csv(claims), content_type="text/csv")
+        filename = f"warranty-claims-{stamp}.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+def _claim_details_queries(user, claim_id):
+    """Return the claims ``user`` may see (part lines prefetched) and the totals query."""
+    lines = ClaimSparePart.objects.select_related("spare_part").order_by("id")
+    claims = (
+        WarrantyClaim.objects.for_user(user).select_related("partner_service")
+        .prefetch_related(
+            Prefetch("claim_spare_parts", queryset=lines),
+            Prefetch("attachments", queryset=ClaimAttachment.objects.select_related("blob").order_by("id")),
+        )
+    )
+    totals = (
+        ClaimSparePart.objects.filter(claim_id=claim_id)
+        .values("currency")
+        .annotate(requested=Sum("total_price"), approved=Sum("approved_total_price"))
+        .order_by("currency")
+    )
+    return claims, totals
+
 
 @login_required()
+@query_budget(8)
 def claim_details(request, claim_id):
-    """Show a read-only view of a specific claim with its parts and labours."""
-    claim = get_object_or_404(WarrantyClaim, pk=claim_id)
+    """Show a read-only view of a specific claim with its parts and labours.
+
+    The claim, its related rows and all part lines load in two queries; the
+    per-currency totals come from one aggregate query. Claims outside the
+    user's scope answer 404.
+    """
+    claims, totals = _claim_details_queries(request.user, claim_id)
+    claim = get_object_or_404(claims, pk=claim_id)
 
     return render(request, "portal/claim_details.html", {
         "claim": claim,
-        "parts": claim.spare_parts.all(),
+        "parts": claim.claim_spare_parts.all(),
+        "attachments": claim.attachments.all(),
+        "totals": totals,
     })
 
 
 
 
 
+@login_required()
+@require_GET
+@query_budget(6)
+def claim_report(request, claim_id):
+    """Return the printable PDF report of a claim, shown inline by the browser."""
+    claim = get_object_or_404(report_claims(WarrantyClaim.objects.for_user(request.user)), pk=claim_id)
+    data = claim_report_data(claim)
+    response = HttpResponse(render_claim_report(data), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{report_filename(data)}"'
+    return response
+
+
 def users(request):
     pass
 
@@ -85,35 +251,209 @@ def create_claim(request):
     if request.method == "POST":
         form = CreateWarrantyClaimForm(request.POST)
 
+        partner_service = get_partner_service(request.user)
+        if partner_service is None:
+            return HttpResponseBadRequest("Only partner users can create claims")
         if form.is_valid():
-            spare_part = form.clean_parts()
-            print(spare_part)
             claim = form.save(commit=False)
             claim.created_by = request.user
-            claim.partner_service = request.user.partner_fields.partner_service
+            claim.partner_service = partner_service
 
-            claim.save()
+            # The claim and all of its part lines are written together or not at all
+            with transaction.atomic():
+                claim.save()
+                form.save_parts(claim)
+                # Emailed by the run_jobs worker, so the request does not wait on SMTP
+                enqueue("claim_created_email", {"claim_id": claim.id})
             return redirect("portal:claim_details", claim_id=claim.id)
         else:
             return render(request, "portal/claim_form.html", {
                 "WarrantForm": form,
                 "SparePartForm": CreateClaimSparePartForm(),
-                "parts": get_sparepart_data()
             })
 
     else:
+        # Parts are looked up through the sparepart_lookup API as the user types
         warrant_form = CreateWarrantyClaimForm()
         spart_form = CreateClaimSparePartForm()
-        parts = get_sparepart_data()
-        parts_json = json.dumps(parts, cls=DjangoJSONEncoder)
 
         return render(request, "portal/claim_form.html", {
             "WarrantForm": warrant_form,
             "SparePartForm": spart_form,
-            "parts": parts_json
         })
 
 
 
 def update_claim(request):
     pass
+
+
+# API
+
+SPAREPART_LOOKUP_LIMIT = 50
+
+def _lookup_params(request):
+    """Return ``(query, exact, limit)``; raises ValueError for a malformed limit."""
+    query = request.GET.get("q", "").strip()
+    exact = request.GET.get("exact") == "1"
+    limit = min(int(request.GET.get("limit", 20)), SPAREPART_LOOKUP_LIMIT)
+    return query, exact, limit
+
+
+@login_required()
+def sparepart_lookup(request):
+    """Return catalog rows matching a stock code.
+
+    ``q`` is matched as a prefix, or exactly when ``exact=1``; ``limit`` caps
+    prefix results. Each row carries the description and the four price columns.
+    """
+    if request.method != "GET":
+        return HttpResponseBadRequest("Only GET is allowed")
+    try:
+        query, exact, limit = _lookup_params(request)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    if not query or limit < 1:
+        return JsonResponse({"results": []})
+    return JsonResponse({"results": lookup_spareparts(query, exact=exact, limit=limit)})
+
+
+@login_required()
+@require_GET
+def claim_search(request):
+    """Ranked full-text search over the defect fields of the claims the user may see.
+
+    ``q`` is the search text and ``page`` the 1-based result page; the listing
+    filters (status, vehicle_type, partner_service) apply as well.
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"results": [], "page": 1, "has_next": False})
+    user = request.user
+    claims = ClaimFilterForm(request.GET, show_partner=not _is_partner(user)).filter(
+        WarrantyClaim.objects.for_user(user)
+    ).select_related(None).only(
+        "id", "claim_date", "status", "vehicle_type", "defect_category", "defect_description",
+    )
+    page_number = _page_number(request)
+    results, has_next = search_page(claims, query, page_number)
+    return JsonResponse({
+        "results": [{
+            "id": claim.id,
+            "claim_date": claim.claim_date,
+            "status": claim.status,
+            "vehicle_type": claim.vehicle_type,
+            "defect_category": claim.defect_category,
+            "defect_description": claim.defect_description,
+            "url": reverse("portal:claim_details", args=[claim.id]),
+        } for claim in results],
+        "page": page_number,
+        "has_next": has_next,
+    })
+
+
+
+def _attachment_json(attachment):
+    return {
+        "id": attachment.id,
+        "filename": attachment.filename,
+        "size": attachment.blob.size,
+        "content_type": attachment.blob.content_type,
+        "url": reverse("portal:claim_attachment", args=[attachment.claim_id, attachment.id]),
+    }
+
+
+@login_required()
+@require_http_methods(["POST"])
+def start_attachment_upload(request, claim_id):
+    """Open a resumable upload to a claim from a JSON body ``{"filename", "size"}``.
+
+    The answer carries the upload URL; send the file there in chunks with
+    ``PUT ...?offset=<bytes sent so far>``.
+    """
+    claim = get_object_or_404(WarrantyClaim.objects.for_user(request.user), pk=claim_id)
+    try:
+        payload = json.loads(request.body)
+        filename, size = str(payload["filename"]), int(payload["size"])
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("Expected a JSON body with filename and size")
+    try:
+        upload = start_upload(claim, filename, size, request.user)
+    except UploadError as exc:
+        return JsonResponse({"error": str(exc), "max_size": max_size()}, status=413)
+    return JsonResponse({
+        "upload_id": str(upload.pk),
+        "offset": 0,
+        "url": reverse("portal:attachment_upload", args=[upload.pk]),
+    }, status=201)
+
+
+@login_required()
+@require_http_methods(["GET", "PUT"])
+def attachment_upload(request, upload_id):
+    """Report the resume offset of an upload (GET) or append one chunk to it (PUT).
+
+    The request body of a PUT is streamed to disk as it is read. A chunk at
+    the wrong offset is refused with 409 and the offset to resume from; the
+    last chunk answers 201 with the stored attachment.
+    """
+    upload = get_object_or_404(AttachmentUpload, pk=upload_id, created_by=request.user)
+    if request.method == "GET":
+        return JsonResponse({"offset": upload.received, "size": upload.size})
+    try:
+        offset = int(request.GET["offset"])
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("offset and Content-Length must be integers")
+    try:
+        attachment = receive_chunk(upload, offset, request, length)
+    except UploadError as exc:
+        return JsonResponse({"error": str(exc), "offset": exc.offset}, status=409)
+    if attachment is None:
+        return JsonResponse({"offset": upload.received, "size": upload.size})
+    return JsonResponse(_attachment_json(attachment), status=201)
+
+
+@login_required()
+@require_GET
+def claim_attachment(request, claim_id, attachment_id):
+    """Download an attachment, or with ``?thumbnail=1`` its thumbnail."""
+    attachment = get_object_or_404(
+        ClaimAttachment.objects.select_related("blob").filter(claim__in=WarrantyClaim.objects.for_user(request.user)),
+        pk=attachment_id, claim_id=claim_id,
+    )
+    blob = attachment.blob
+    if request.GET.get("thumbnail") == "1":
+        if blob.thumbnail_status != AttachmentBlob.ThumbnailStatus.Ready:
+            raise Http404("No thumbnail for this attachment")
+        # Thumbnails have the format of their image
+        response = FileResponse(open(thumbnail_path(blob.sha256), "rb"), content_type=blob.content_type)
+        response["X-Content-Type-Options"] = "nosniff"
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
+    # Only images and PDFs are shown inline; the rest could be HTML or SVG with script in it
+    inline = blob.content_type in INLINE_CONTENT_TYPES
+    response = FileResponse(
+        open(blob_path(blob.sha256), "rb"), as_attachment=not inline,
+        content_type=blob.content_type if inline else OCTET_STREAM, filename=attachment.filename,
+    )
+    response["X-Content-Type-Options"] = "nosniff"
+    # The content behind a blob never changes
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def _catalog_etag(request):
+    return get_catalog_snapshot().etag
+
+@login_required()
+@require_GET
+@cache_control(max_age=60, must_revalidate=True)
+@condition(etag_func=_catalog_etag)
+def sparepart_catalog(request):
+    """Serve the whole catalog as JSON, keyed by stock code.
+
+    The snapshot is only rebuilt after the catalog changes; conditional requests
+    whose ETag still matches get a 304 after reading just the catalog version.
+    """
+    return HttpResponse(get_catalog_snapshot().content, content_type="application/json")
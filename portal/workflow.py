@@ -0,0 +1,114 @@
+"""Claim status workflow and bulk status transitions.
+
+A claim starts as New. Reviewers accept it, reject it or send it back to the
+partner (Needs Revise); a revised claim is reviewed again, and an accepted
+claim is completed once it has been paid out. ALLOWED_TRANSITIONS is the
+whole workflow: any other status change is refused.
+
+``transition_claims`` moves a set of claims to one target status with a
+single conditional UPDATE (``WHERE status IN (<allowed sources>)``), so claims
+that are not in a valid source status are skipped rather than failing the
+batch, and records the changes with one batched history insert.
+
+``approve_quantities`` sets the approved quantities and approved totals of
+part lines, across any number of claims, with one UPDATE whose totals are
+computed by the database (``approved_quantity * unit_price``).
+"""
+
+from contextlib import nullcontext
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Value, When
+from django.db.models.functions import Greatest, Least
+from django.utils import timezone
+
+from .events import acting_as
+from .models import ClaimSparePart, ClaimStatusHistory, WarrantyClaim
+
+Status = WarrantyClaim.ClaimStatus
+
+ALLOWED_TRANSITIONS = {
+    Status.New: {Status.Accepted, Status.Rejected, Status.NeedsRevise},
+    Status.NeedsRevise: {Status.Revised},
+    Status.Revised: {Status.Accepted, Status.Rejected, Status.NeedsRevise},
+    Status.Accepted: {Status.Completed},
+    Status.Rejected: set(),
+    Status.Completed: set(),
+}
+
+HISTORY_BATCH_SIZE = 1000
+
+
+def allowed_sources(target):
+    """Return the statuses a claim may be moved to ``target`` from."""
+    return sorted(source for source, targets in ALLOWED_TRANSITIONS.items() if target in targets)
+
+
+def can_transition(source, target):
+    return target in ALLOWED_TRANSITIONS.get(source, ())
+
+
+@dataclass
+class TransitionResult:
+    target: str
+    updated: int
+    skipped: int
+
+
+def transition_claims(claims, target, user=None, note=""):
+    """Move the claims of the ``claims`` queryset to ``target`` where the workflow allows it.
+
+    Returns a TransitionResult; ``skipped`` counts the claims whose current
+    status does not lead to ``target``. The rollups follow through the
+    tracking ``update`` of WarrantyClaimQuerySet.
+    """
+    if target not in ALLOWED_TRANSITIONS:
+        raise ValueError(f"Unknown claim status {target!r}")
+    sources = allowed_sources(target)
+    with transaction.atomic(), acting_as(user) if user is not None else nullcontext():
+        current = dict(claims.order_by().select_for_update().values_list("pk", "status"))
+        movable = {pk: status for pk, status in current.items() if status in sources}
+        updated = 0
+        if movable:
+            updated = WarrantyClaim.objects.filter(pk__in=list(movable), status__in=sources).update(
+                status=target, claim_last_modified=timezone.now(),
+            )
+            ClaimStatusHistory.objects.bulk_create(
+                [ClaimStatusHistory(claim_id=pk, from_status=status, to_status=target, changed_by=user, note=note)
+                 for pk, status in movable.items()],
+                batch_size=HISTORY_BATCH_SIZE,
+            )
+    return TransitionResult(target=target, updated=updated, skipped=len(current) - updated)
+
+
+def approve_quantities(lines, quantities=None, user=None):
+    """Approve part quantities of the ``lines`` queryset of ClaimSparePart rows.
+
+    Without ``quantities`` every line is approved in full. Otherwise it maps
+    line ids to approved quantities; they are capped at the requested
+    quantity and lines missing from it are left alone. Returns the number of
+    lines updated. The claim totals and rollups follow through the tracking
+    ``update`` of ClaimSparePartQuerySet.
+    """
+    if quantities is None:
+        approved = F("quantity")
+    else:
+        if not quantities:
+            return 0
+        lines = lines.filter(pk__in=list(quantities))
+        approved = Case(
+            *[When(pk=pk, then=Value(int(quantity))) for pk, quantity in quantities.items()],
+            output_field=IntegerField(),
+        )
+        approved = Least(Greatest(approved, Value(0)), F("quantity"))
+    # SET expressions read the old row, so the total repeats the quantity
+    # expression instead of referring to approved_quantity
+    total = ExpressionWrapper(approved * F("unit_price"), output_field=DecimalField(max_digits=12, decimal_places=2))
+    with transaction.atomic(), acting_as(user) if user is not None else nullcontext():
+        return lines.update(approved_quantity=approved, approved_total_price=total)
+
+
+def approve_claims(claims, user=None):
+    """Approve every part line of the ``claims`` queryset in full."""
+    return approve_quantities(ClaimSparePart.objects.filter(claim__in=claims), user=user)
@@ -0,0 +1,203 @@
+"""Minimal streaming .xlsx reader and writer using only the standard library.
+
+Only what the importers and exports need is supported. Reading parses the
+first worksheet row by row with ``iterparse`` and drops each row once it is
+yielded, so memory stays bounded by the shared-strings table, not the sheet.
+Writing produces one sheet of inline strings and numbers, streamed out of the
+zip archive as it is built.
+"""
+
+import io
+import posixpath
+import re
+import zipfile
+from decimal import Decimal
+from xml.etree.ElementTree import iterparse
+from xml.sax.saxutils import escape
+
+_CELL_REF = re.compile(r"([A-Z]+)")
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _column_index(ref):
+    """Turn the letters of a cell reference such as ``AB12`` into 0-based 27."""
+    letters = _CELL_REF.match(ref).group(1)
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def _first_sheet_path(archive):
+    try:
+        with archive.open("xl/workbook.xml") as fh:
+            sheet_rid = None
+            for _, elem in iterparse(fh):
+                if _local(elem.tag) == "sheet":
+                    sheet_rid = elem.get(_REL_NS)
+                    break
+        with archive.open("xl/_rels/workbook.xml.rels") as fh:
+            for _, elem in iterparse(fh):
+                if _local(elem.tag) == "Relationship" and elem.get("Id") == sheet_rid:
+                    target = elem.get("Target")
+                    if target.startswith("/"):
+                        return target.lstrip("/")
+                    return posixpath.normpath(posixpath.join("xl", target))
+    except KeyError:
+        pass
+    return "xl/worksheets/sheet1.xml"
+
+
+def _shared_strings(archive):
+    strings = []
+    try:
+        fh = archive.open("xl/sharedStrings.xml")
+    except KeyError:
+        return strings
+    with fh:
+        for _, elem in iterparse(fh):
+            if _local(elem.tag) == "si":
+                strings.append("".join(
+                    node.text or "" for node in elem.iter() if _local(node.tag) == "t"
+                ))
+                elem.clear()
+    return strings
+
+
+def iter_xlsx_rows(fileobj):
+    """Yield the first worksheet of an .xlsx file as lists of cell strings.
+
+    ``fileobj`` must be seekable (a path, an open file or an uploaded file).
+    Empty cells come back as ``""``.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        strings = _shared_strings(archive)
+        with archive.open(_first_sheet_path(archive)) as fh:
+            parent = None
+            row = {}
+            cell_ref = cell_type = value = None
+            for event, elem in iterparse(fh, events=("start", "end")):
+                tag = _local(elem.tag)
+                if event == "start":
+                    if tag == "sheetData":
+                        parent = elem
+                    elif tag == "c":
+                        cell_ref, cell_type, value = elem.get("r"), elem.get("t"), None
+                    continue
+                if tag == "v":
+                    value = elem.text or ""
+                elif tag == "t" and cell_type == "inlineStr":
+                    value = (value or "") + (elem.text or "")
+                elif tag == "c":
+                    if value is not None:
+                        if cell_type == "s":
+                            value = strings[int(value)]
+                        column = _column_index(cell_ref) if cell_ref else len(row)
+                        row[column] = value
+                elif tag == "row":
+                    if row:
+                        values = [""] * (max(row) + 1)
+                        for column, cell in row.items():
+                            values[column] = cell
+                        yield values
+                    else:
+                        yield []
+                    row = {}
+                    # Drop the parsed rows so the tree never holds the whole sheet
+                    if parent is not None:
+                        parent.clear()
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable sink that collects what zipfile writes until it is drained."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+    '</Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+# Control characters are not allowed in XML 1.0 documents
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_ILLEGAL_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def iter_xlsx_bytes(rows, sheet_name="Sheet1", rows_per_chunk=500):
+    """Stream a single-sheet .xlsx built from ``rows`` as chunks of bytes.
+
+    The archive is written to an unseekable buffer that is drained every
+    ``rows_per_chunk`` rows, so memory stays flat however many rows there are.
+    """
+    sink = _StreamBuffer()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEAD.encode())
+            for count, row in enumerate(rows, start=1):
+                sheet.write(("<row>" + "".join(_cell(value) for value in row) + "</row>").encode())
+                if count % rows_per_chunk == 0:
+                    yield sink.drain()
+            sheet.write(_SHEET_TAIL.encode())
+    yield sink.drain()
@@ -2,7 +2,6 @@ from django.contrib.auth.models import AbstractUser,UserManager
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 from portal.models import PartnerService
-from portal.models import WarrantyClaim
 
 
 # Create your models here.
@@ -40,18 +39,6 @@ class User(AbstractUser):
     def is_ssh_admin(self):
         return self.role == self.Types.SSH_ADMIN
 
-    def get_partner_claims(self):
-        if not (self.is_partner or self.is_partner_admin):
-            return "That is not a partner"
-        else:
-            try:
-                ps = self.partner_fields.partner_service.claims.all()
-            except Exception:
-                return "Cannot find any claims for this partner service or partner service "
-            else:
-                return ps
-
-
 
 class PartnerManager(UserManager):
     def get_queryset(self):
@@ -0,0 +1,37 @@
+"""Per-request resolution of a user's partner fields and partner service.
+
+``get_partner_fields`` loads a user's PartnerFields together with its
+PartnerService in one joined query and stores the result in Django's
+related-object cache on the user instance. Since ``request.user`` is the same
+object for the whole request, every later ``user.partner_fields.partner_service``
+access is free, and the next request reads the current row again.
+
+The result decides which claims a user may see, so it is deliberately not
+kept across requests: a cache shared between requests would have to be
+invalidated on every write, including queryset updates that send no signals.
+"""
+
+from .models import PartnerFields, User
+
+
+def get_partner_fields(user):
+    """Return the user's PartnerFields (with PartnerService loaded), or None."""
+    if not user.is_authenticated:
+        return None
+    related = User.partner_fields.related
+    if related.is_cached(user):
+        return related.get_cached_value(user)
+
+    partner_fields = PartnerFields.objects.select_related("partner_service").filter(user_id=user.pk).first()
+    if partner_fields is None:
+        # Caching None keeps the usual RelatedObjectDoesNotExist on access
+        related.set_cached_value(user, None)
+    else:
+        user.partner_fields = partner_fields
+    return partner_fields
+
+
+def get_partner_service(user):
+    """Return the PartnerService the user belongs to, or None."""
+    partner_fields = get_partner_fields(user)
+    return partner_fields.partner_service if partner_fields else None